@@ -0,0 +1,543 @@
+"""
+Synthetic catalog, students, trends and chat history for load and scale testing.
+
+Generates course_details rows (with prerequisite chains within each department,
+semester strings, section details and 384-d embeddings) and, for a population of
+students, student_profile, login, completed_courses (prerequisites first),
+course_trends and chat_sessions / chat_messages. Everything is bulk-loaded with COPY,
+or written as CSV files with --csv-dir.
+
+Rows come from RNGs seeded with --seed and the table (or student), so the same
+arguments always produce the same rows, and adding students does not reshuffle the
+catalog or the existing students. Synthetic rows use the "SYN" course id and "syn_" user id prefixes, so
+--replace can delete them without touching the real catalog.
+
+Embeddings default to the hashed bag-of-words vectors of backend/fake_services.py,
+matching the fake /embed server; --embeddings api calls EMBEDDING_API_URL instead.
+Students can log in with --password, e.g. for the load test:
+    python backend/benchmarks/bench_load.py --spawn --no-signup --user-prefix syn_ --users 1000
+
+Usage:
+    python Preprocessing_and_Ingestion/generate_synthetic_data.py --scale 10 --replace
+    python Preprocessing_and_Ingestion/generate_synthetic_data.py --courses 500 --students 100 --csv-dir /tmp/synthetic
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "backend"))
+
+from chat_title import extractive_title
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+# DB Configuration
+db_config = {
+    "host": os.environ.get("DB_HOST", "localhost"),
+    "port": int(os.environ.get("DB_PORT", 5432)),
+    "database": os.environ.get("DB_NAME", "smart_search_course_recommendation"),
+    "user": os.environ.get("DB_USER", "postgres"),
+    "password": os.environ.get("DB_PASSWORD", "mz7zdz123")
+}
+
+COURSE_PREFIX = "SYN"
+USER_PREFIX = "syn_"
+
+# Rows per table at --scale 1
+BASE_COURSES = 5000
+BASE_STUDENTS = 1000
+
+# Subject code, major and topics per department
+DEPARTMENTS = [
+    ("CSCI-B", "Computer Science", ["Algorithms", "Machine Learning", "Artificial Intelligence", "Computer Vision",
+                                    "Natural Language Processing", "Distributed Systems", "Compilers", "Databases"]),
+    ("CSCI-C", "Computer Science", ["Programming", "Data Structures", "Discrete Structures", "Software Systems",
+                                    "Operating Systems", "Computer Architecture"]),
+    ("CSCI-P", "Computer Science", ["Software Engineering", "Mobile Development", "Web Programming",
+                                    "Cloud Computing", "Computer Security"]),
+    ("INFO-I", "Informatics", ["Human-Computer Interaction", "Data Visualization", "Information Retrieval",
+                               "Social Informatics", "User Experience Design", "Applied Machine Learning"]),
+    ("DSCI-D", "Data Science", ["Data Science", "Data Mining", "Big Data Systems", "Statistical Learning",
+                                "Data Engineering", "Data Ethics"]),
+    ("STAT-S", "Statistics", ["Statistical Inference", "Regression Analysis", "Bayesian Statistics",
+                              "Time Series Analysis", "Experimental Design", "Probability"]),
+    ("MATH-M", "Mathematics", ["Calculus", "Linear Algebra", "Differential Equations", "Numerical Analysis",
+                               "Real Analysis", "Optimization"]),
+    ("BUS-K", "Business Administration", ["Business Analytics", "Information Systems", "Decision Modeling",
+                                          "Digital Enterprise", "Database Management"]),
+    ("BUS-M", "Marketing", ["Marketing Strategy", "Consumer Behavior", "Digital Marketing", "Product Management",
+                            "Marketing Research"]),
+    ("ECON-E", "Economics", ["Microeconomics", "Macroeconomics", "Econometrics", "Game Theory",
+                             "Behavioral Economics"]),
+    ("SPEA-V", "Public Affairs", ["Public Policy", "Nonprofit Management", "Program Evaluation",
+                                  "Public Finance", "Environmental Policy"]),
+    ("PBHL-B", "Public Health", ["Biostatistics", "Epidemiology", "Health Informatics", "Global Health"]),
+    ("BIOL-L", "Biotechnology", ["Molecular Biology", "Genetics", "Bioinformatics", "Cell Biology", "Ecology"]),
+    ("ENGR-E", "Intelligent Systems Engineering", ["Embedded Systems", "Robotics", "Signal Processing",
+                                                   "Cyber-Physical Systems", "Neuro-Engineering"]),
+    ("PSY-P", "Psychology", ["Cognitive Psychology", "Research Methods", "Social Psychology",
+                             "Developmental Psychology", "Cognitive Neuroscience"]),
+    ("ILS-Z", "Information and Library Science", ["Information Architecture", "Digital Libraries",
+                                                  "Metadata", "Information Policy"]),
+]
+
+# Course numbers per level, with title patterns typical of that level
+LEVELS = [
+    (100, ["Introduction to {topic}", "{topic} for Everyone", "Foundations of {topic}"]),
+    (200, ["{topic} I", "Principles of {topic}", "{topic} Fundamentals"]),
+    (300, ["{topic} II", "Applied {topic}", "Intermediate {topic}"]),
+    (400, ["Advanced {topic}", "{topic} Laboratory", "Topics in {topic}"]),
+    (500, ["Graduate {topic}", "{topic} Theory and Practice", "Elements of {topic}"]),
+    (600, ["Seminar in {topic}", "Research in {topic}", "Advanced Topics in {topic}"]),
+]
+
+DESCRIPTION_SENTENCES = [
+    "This course introduces the core ideas of {topic} and how they are used in practice.",
+    "Students study {topic} through lectures, readings and weekly problem sets.",
+    "Topics include {keywords}.",
+    "Emphasis is placed on {keyword} and its applications in {field}.",
+    "Hands-on projects apply {topic} to real datasets and case studies from {field}.",
+    "The course builds skills in {keywords} that employers in {field} look for.",
+    "Students complete a team project and present their results at the end of the semester.",
+    "Prior experience with {keyword} is helpful but not required.",
+]
+KEYWORDS = [
+    "Python", "R", "SQL", "statistical modeling", "experimentation", "visualization", "algorithm design",
+    "system design", "research methods", "technical writing", "data cleaning", "optimization", "ethics",
+    "user research", "prototyping", "cloud deployment", "security analysis", "linear models", "simulation",
+]
+
+OFFERED_SEMESTERS = [
+    ("Fall, Spring", 30), ("Fall", 18), ("Spring", 18), ("Fall, Spring, Summer", 12), ("Summer", 4),
+    ("Fall semester only", 4), ("Spring odd years", 3), ("Fall even years", 3), ("Fall, Spring, Winter", 3),
+    ("Occasionally", 4),
+]
+CREDITS = [((3, 3), 70), ((4, 4), 10), ((1, 3), 8), ((1, 1), 5), ((2, 2), 4), ((1, 6), 3)]
+INSTRUCTORS = ["Dr. Patel", "Dr. Nguyen", "Prof. Johnson", "Dr. Garcia", "Prof. Kim", "Dr. Okafor", "Dr. Rossi",
+               "Prof. Chen", "Dr. Haddad", "Prof. Williams", "Dr. Kowalski", "Dr. Sato"]
+MEETING_DAYS = ["MW", "TR", "MWF", "F", "T", "R"]
+MEETING_TIMES = ["9:00A-10:15A", "11:30A-12:45P", "1:00P-2:15P", "2:30P-3:45P", "4:00P-5:15P", "6:00P-8:30P"]
+
+DEGREES = [("Bachelor", 120, 60), ("Master", 30, 30), ("PhD", 60, 10)]  # name, total credits, weight
+SEMESTERS = ["fall", "spring", "summer", "winter"]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+FIRST_NAMES = ["Aarav", "Maya", "Liam", "Sofia", "Noah", "Priya", "Ethan", "Chloe", "Mateo", "Amara", "Lucas",
+               "Hana", "Omar", "Zoe", "Kai", "Ines", "Arjun", "Leah", "Diego", "Yuki"]
+LAST_NAMES = ["Smith", "Sharma", "Garcia", "Chen", "Johnson", "Okoye", "Müller", "Kim", "Rossi", "Nguyen",
+              "Brown", "Haddad", "Silva", "Patel", "Lee", "Novak"]
+
+CAREER_GOALS = ["data scientist", "machine learning engineer", "UX designer", "product manager",
+                "software engineer", "policy analyst", "bioinformatician", "quantitative analyst",
+                "epidemiologist", "cybersecurity analyst", "research scientist", "business analyst"]
+CHAT_OPENERS = [
+    "I want to become a {goal}. Which courses should I take?",
+    "What courses would prepare me to work as a {goal}?",
+    "Tell me about {code}",
+    "What are the prerequisites for {title}?",
+    "I'm not sure what to take next semester",
+]
+CHAT_FOLLOW_UPS = ["Can you tell me more about the first one?", "Which of those is offered in the spring?",
+                   "Are there any easier alternatives?", "How many credits is {code}?", "Thanks!"]
+
+
+def weighted(rng: random.Random, options):
+    values, weights = zip(*options)
+    return rng.choices(values, weights)[0]
+
+
+def table_rng(seed: int, table: str) -> random.Random:
+    return random.Random(f"{seed}:{table}")
+
+
+def course_id(index: int) -> str:
+    return f"{COURSE_PREFIX}{index:06d}"
+
+
+def user_id(index: int) -> str:
+    return f"{USER_PREFIX}{index:05d}"
+
+
+def generate_courses(count: int, seed: int):
+    """
+    Course rows as dicts, ordered by department and level. Prerequisites always point
+    at lower-level courses of the same department, so they form chains without cycles.
+    """
+    rng = table_rng(seed, "course_details")
+    courses = []
+    per_department = [count // len(DEPARTMENTS) + (index < count % len(DEPARTMENTS))
+                      for index in range(len(DEPARTMENTS))]
+    for (subject, major, topics), department_count in zip(DEPARTMENTS, per_department):
+        department = subject.split("-")[0]
+        department_courses = []
+        used_numbers = Counter()
+        lower, lower_by_topic, current_level = [], {}, None
+        for position in range(department_count):
+            level, patterns = LEVELS[min(len(LEVELS) - 1, int(position * len(LEVELS) / max(department_count, 1)))]
+            if level != current_level:
+                # Courses of the finished level become candidate prerequisites
+                for course in department_courses[len(lower):]:
+                    lower.append(course)
+                    lower_by_topic.setdefault(course["topic"], []).append(course)
+                current_level = level
+            number = level + rng.randrange(100)
+            # Large catalogs reuse numbers with a letter suffix, as cross-listed variants do
+            repeat = used_numbers[number]
+            used_numbers[number] += 1
+            suffix = "" if not repeat else chr(ord("A") + repeat - 1) if repeat <= 26 else str(repeat)
+
+            topic = rng.choice(topics)
+            title = rng.choice(patterns).format(topic=topic)
+            keywords = rng.sample(KEYWORDS, 3)
+            fields = {
+                "topic": topic.lower(), "keyword": keywords[0], "keywords": ", ".join(keywords), "field": major.lower()
+            }
+            sentences = rng.sample(DESCRIPTION_SENTENCES, rng.randint(2, 4))
+            description = " ".join(sentence.format(**fields) for sentence in sentences)
+
+            # Prefer a lower-level course on the same topic, then anything lower in the department
+            prerequisites = []
+            if lower and rng.random() < 0.6:
+                same_topic = lower_by_topic.get(topic)
+                pool = same_topic if same_topic and rng.random() < 0.7 else lower
+                picks = rng.sample(pool, min(len(pool), rng.randint(1, 2)))
+                prerequisites = sorted({course["course_id"] for course in picks})
+
+            min_credits, max_credits = weighted(rng, CREDITS)
+            sections = [{
+                "section": f"{index + 1:04d}",
+                "instructor": rng.choice(INSTRUCTORS),
+                "days": rng.choice(MEETING_DAYS),
+                "time": rng.choice(MEETING_TIMES),
+                "capacity": rng.choice([25, 30, 40, 60, 90, 120, 200])
+            } for index in range(rng.randint(1, 3))]
+            course = {
+                "course_id": course_id(len(courses) + len(department_courses) + 1),
+                "course_name": f"{subject} {number}{suffix}",
+                "department": department,
+                "min_credits": min_credits,
+                "max_credits": max_credits,
+                "prerequisites": prerequisites,
+                "offered_semester": weighted(rng, OFFERED_SEMESTERS),
+                "course_title": title,
+                "course_description": description,
+                "course_details": {
+                    "attributes": rng.sample(["Lecture", "Lab", "Online", "Hybrid", "Project", "Writing Intensive"], 2),
+                    "academicCareer": "UGRD" if level < 500 else "GRAD",
+                    "effectiveDate": f"{rng.randint(2015, 2024)}-08-01",
+                    "courseOfferNumber": 1,
+                    "courseTopicId": 0,
+                    "institution": "IUBLA",
+                    "classes": sections
+                },
+                "major": major,
+                "topic": topic,
+                "level": level
+            }
+            department_courses.append(course)
+        courses.extend(department_courses)
+    return courses
+
+
+def embedding_texts(courses):
+    """Same text format as load_data_pg_final.py"""
+    return [f"Title: {course['course_title']}. Description: {course['course_description']}." for course in courses]
+
+
+def embed_batch(texts, source: str):
+    if source == "fake":
+        from fake_services import fake_embedding
+        return [fake_embedding(text) for text in texts]
+    api_url = os.environ.get("EMBEDDING_API_URL", "http://127.0.0.1:8001/embed")
+    response = requests.post(api_url, json={"texts": texts}, timeout=120)
+    response.raise_for_status()
+    return response.json()["embeddings"]
+
+
+def course_rows(courses, source: str, batch_size: int = 256):
+    """COPY rows for course_details, embedding one batch at a time to keep memory flat"""
+    for start in range(0, len(courses), batch_size):
+        batch = courses[start:start + batch_size]
+        for course, embedding in zip(batch, embed_batch(embedding_texts(batch), source)):
+            yield (
+                course["course_id"], course["course_name"], course["department"], course["min_credits"],
+                course["max_credits"], "{" + ",".join(course["prerequisites"]) + "}", course["offered_semester"],
+                course["course_title"], course["course_description"], json.dumps(course["course_details"]),
+                "[" + ",".join(f"{value:.6f}" for value in embedding) + "]"
+            )
+        if source == "api" and (start // batch_size) % 20 == 0:
+            logger.info(f"Embedded {min(start + batch_size, len(courses))} / {len(courses)} courses")
+
+
+def student_records(index: int, majors, seed: int, password_hash: str):
+    """(student_profile row, login row) for one student"""
+    rng = random.Random(f"{seed}:student:{index}")
+    uid = user_id(index)
+    degree, total_credits = weighted(rng, [((name, total), weight) for name, total, weight in DEGREES])
+    completed_credits = rng.randint(0, total_credits - 3) // 3 * 3
+    availability = {day: f"{rng.randint(8, 12)}am-{rng.randint(1, 6)}pm"
+                    for day in rng.sample(WEEKDAYS, rng.randint(3, 5))}
+    profile = (
+        uid, degree, rng.choice(majors), rng.choice(["Full-time", "Full-time", "Part-time"]),
+        f"{rng.uniform(2.3, 4.0):.2f}", rng.choice(SEMESTERS[:3]), total_credits, completed_credits,
+        total_credits - completed_credits, json.dumps(availability)
+    )
+    login = (uid, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f"{uid}@synthetic.example.edu", password_hash)
+    return profile, login
+
+
+def completed_course_rows(profile, courses, by_id, by_major, seed: int):
+    """
+    About completed_credits / 3 courses for a student, mostly from their major, each
+    preceded by its prerequisites so the eligibility filter sees consistent histories.
+    """
+    uid, major, completed_credits = profile[0], profile[2], profile[7]
+    rng = random.Random(f"{seed}:completed:{uid}")
+    wanted = completed_credits // 3
+    taken, seen = [], set()
+    for _ in range(wanted * 4):
+        if len(taken) >= wanted:
+            break
+        course = rng.choice(by_major[major] if rng.random() < 0.8 else courses)
+        stack = [course["course_id"]]
+        while stack:
+            cid = stack.pop()
+            if cid in seen:
+                continue
+            missing = [prereq for prereq in by_id[cid]["prerequisites"] if prereq not in seen]
+            if missing:
+                stack.append(cid)
+                stack.extend(missing)
+            else:
+                seen.add(cid)
+                taken.append(cid)
+
+    first_year = 2024 - len(taken[:wanted]) // 8
+    for position, cid in enumerate(taken[:wanted]):
+        semester = ("Fall", "Spring", "Summer")[position % 3]
+        year = first_year + position // 8
+        month = {"Fall": 12, "Spring": 5, "Summer": 8}[semester]
+        yield (uid, cid, semester, by_id[cid]["max_credits"], year, rng.choice([2.0, 2.7, 3.0, 3.3, 3.7, 4.0]),
+               f"{year}-{month:02d}-{rng.randint(10, 22)}")
+
+
+def trend_rows(courses, seed: int, first_year: int, last_year: int):
+    rng = table_rng(seed, "course_trends")
+    for course in courses:
+        popularity = rng.betavariate(2, 2)
+        capacity = sum(section["capacity"] for section in course["course_details"]["classes"])
+        difficulty = rng.uniform(0.0, 1.0)
+        for year in range(first_year, last_year + 1):
+            popularity = min(1.0, max(0.05, popularity + rng.gauss(0.0, 0.08)))
+            filled = min(capacity, int(capacity * popularity * rng.uniform(0.8, 1.2)))
+            yield (
+                course["course_id"], year, filled, capacity,
+                int(rng.uniform(1, 60) * (1.2 - popularity)) if filled else None,
+                round(min(4.0, max(0.0, 4.0 - difficulty * 1.2 + rng.gauss(0.0, 0.15))), 2),
+                round(4 + difficulty * 10 + rng.gauss(0.0, 1.0), 1),
+                round(min(5.0, max(1.0, 3.2 + popularity + rng.gauss(0.0, 0.3))), 2)
+            )
+
+
+def student_chats(index: int, courses, seed: int, sessions_per_student: float, turns_per_session: int):
+    """(chat_sessions row, chat_messages rows) for each of a student's sessions in the first half of 2025"""
+    uid = user_id(index)
+    rng = random.Random(f"{seed}:chat:{uid}")
+    start = datetime(2025, 1, 1)
+    for number in range(int(rng.expovariate(1 / sessions_per_student)) if sessions_per_student else 0):
+        session_id = f"session_{uid}_{number:04d}"
+        created = start + timedelta(minutes=rng.randrange(180 * 24 * 60))
+        course = rng.choice(courses)
+        fields = {"goal": rng.choice(CAREER_GOALS), "code": course["course_name"], "title": course["course_title"]}
+        first_query = rng.choice(CHAT_OPENERS).format(**fields)
+        moment = created
+        messages = []
+        for turn in range(rng.randint(1, turns_per_session)):
+            query = first_query if turn == 0 else rng.choice(CHAT_FOLLOW_UPS).format(**fields)
+            moment += timedelta(seconds=rng.randint(20, 300))
+            messages.append((session_id, uid, "user", query, moment.isoformat(), None))
+            picks = rng.sample(courses, 3)
+            answer = "Here are some courses that fit:\n" + "\n".join(
+                f"- {pick['course_name']} - {pick['course_title']}" for pick in picks)
+            moment += timedelta(seconds=rng.randint(2, 15))
+            messages.append((session_id, uid, "assistant", answer, moment.isoformat(),
+                             json.dumps({"courses": [pick["course_id"] for pick in picks]})))
+        session = (session_id, uid, extractive_title(first_query), created.isoformat(), moment.isoformat())
+        yield session, messages
+
+
+TABLES = {
+    "course_details": ("course_id", "course_name", "department", "min_credits", "max_credits", "prerequisites",
+                       "offered_semester", "course_title", "course_description", "course_details", "embedding"),
+    "student_profile": ("user_id", "degree_type", "major", "enrollment_type", "gpa", "upcoming_semester",
+                        "total_credits", "completed_credits", "remaining_credits", "time_availability"),
+    "login": ("user_id", "first_name", "last_name", "email", "password"),
+    "completed_courses": ("user_id", "course_id", "semester", "credits", "year", "gpa", "completed_date"),
+    "course_trends": ("course_id", "year", "slots_filled", "total_slots", "slots_filled_time", "avg_gpa",
+                      "avg_hours_spent", "avg_rating"),
+    "chat_sessions": ("session_id", "user_id", "title", "created_at", "last_activity"),
+    "chat_messages": ("session_id", "user_id", "message_type", "content", "timestamp", "metadata"),
+}
+
+# Child tables first, so synthetic rows can be deleted without violating foreign keys
+DELETE_STATEMENTS = [
+    "DELETE FROM iu_catalog.chat_messages WHERE user_id LIKE %(users)s",
+    "DELETE FROM iu_catalog.chat_sessions WHERE user_id LIKE %(users)s",
+    "DELETE FROM iu_catalog.completed_courses WHERE user_id LIKE %(users)s",
+    "DELETE FROM iu_catalog.login WHERE user_id LIKE %(users)s",
+    "DELETE FROM iu_catalog.student_profile WHERE user_id LIKE %(users)s",
+    "DELETE FROM iu_catalog.course_trends WHERE course_id LIKE %(courses)s",
+    "DELETE FROM iu_catalog.course_details WHERE course_id LIKE %(courses)s",
+]
+
+
+class PostgresWriter:
+    """Streams rows into Postgres with COPY, in chunks of `chunk_size` rows"""
+    def __init__(self, chunk_size: int = 20000):
+        import psycopg2
+        self.connection = psycopg2.connect(
+            host=db_config["host"], port=db_config["port"], dbname=db_config["database"],
+            user=db_config["user"], password=db_config["password"]
+        )
+        self.chunk_size = chunk_size
+
+    def delete_synthetic(self):
+        with self.connection.cursor() as cursor:
+            for statement in DELETE_STATEMENTS:
+                cursor.execute(statement, {"users": USER_PREFIX.replace("_", "\\_") + "%", "courses": COURSE_PREFIX + "%"})
+                logger.info(f"{statement.split(' WHERE')[0]}: {cursor.rowcount} rows")
+        self.connection.commit()
+
+    def write(self, table: str, rows) -> int:
+        columns = ", ".join(TABLES[table])
+        statement = f"COPY iu_catalog.{table} ({columns}) FROM STDIN WITH (FORMAT csv)"
+        total = 0
+        with self.connection.cursor() as cursor:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in rows:
+                writer.writerow(["" if value is None else value for value in row])
+                total += 1
+                if total % self.chunk_size == 0:
+                    buffer.seek(0)
+                    cursor.copy_expert(statement, buffer)
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+        self.connection.commit()
+        return total
+
+    def finish(self):
+        """Rebuild the ivfflat index (its lists are fixed at build time) and refresh planner statistics"""
+        self.connection.autocommit = True
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('iu_catalog.course_embedding_idx')")
+            if cursor.fetchone()[0]:
+                logger.info("Rebuilding course_embedding_idx")
+                cursor.execute("REINDEX INDEX iu_catalog.course_embedding_idx")
+            for table in TABLES:
+                cursor.execute(f"ANALYZE iu_catalog.{table}")
+        self.connection.close()
+
+
+class CsvWriter:
+    """Writes one CSV file per table, in the column order of TABLES"""
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def delete_synthetic(self):
+        pass
+
+    def write(self, table: str, rows) -> int:
+        total = 0
+        with open(os.path.join(self.directory, f"{table}.csv"), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(TABLES[table])
+            for row in rows:
+                writer.writerow(["" if value is None else value for value in row])
+                total += 1
+        return total
+
+    def finish(self):
+        pass
+
+
+def timed_write(writer, table: str, rows):
+    start = time.perf_counter()
+    total = writer.write(table, rows)
+    elapsed = time.perf_counter() - start
+    logger.info(f"{table}: {total} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f} rows/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help=f"Multiplier for the default sizes ({BASE_COURSES} courses, {BASE_STUDENTS} students)")
+    parser.add_argument("--courses", type=int, default=None)
+    parser.add_argument("--students", type=int, default=None)
+    parser.add_argument("--trend-years", default="2015-2024", help="First and last year of course_trends")
+    parser.add_argument("--sessions-per-student", type=float, default=2.0, help="Mean chat sessions per student")
+    parser.add_argument("--turns-per-session", type=int, default=4, help="Most user turns in a chat session")
+    parser.add_argument("--embeddings", choices=("fake", "api"), default="fake")
+    parser.add_argument("--password", default="loadtest-password", help="Password of every synthetic student")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--replace", action="store_true", help="Delete earlier synthetic rows first")
+    parser.add_argument("--csv-dir", default=None, help="Write CSV files here instead of loading Postgres")
+    args = parser.parse_args()
+
+    course_count = args.courses or int(BASE_COURSES * args.scale)
+    student_count = args.students if args.students is not None else int(BASE_STUDENTS * args.scale)
+    first_year, last_year = (int(year) for year in args.trend_years.split("-"))
+
+    writer = CsvWriter(args.csv_dir) if args.csv_dir else PostgresWriter()
+    if args.replace:
+        writer.delete_synthetic()
+
+    start = time.perf_counter()
+    courses = generate_courses(course_count, args.seed)
+    logger.info(f"Generated {len(courses)} courses in {time.perf_counter() - start:.1f}s")
+    timed_write(writer, "course_details", course_rows(courses, args.embeddings))
+
+    # bcrypt is deliberately slow, so every synthetic student shares one hash
+    from passlib.context import CryptContext
+    password_hash = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(args.password)
+    majors = sorted({course["major"] for course in courses})
+    students = [student_records(index, majors, args.seed, password_hash) for index in range(1, student_count + 1)]
+    timed_write(writer, "student_profile", (profile for profile, _ in students))
+    timed_write(writer, "login", (login for _, login in students))
+
+    by_id = {course["course_id"]: course for course in courses}
+    by_major = {}
+    for course in courses:
+        by_major.setdefault(course["major"], []).append(course)
+    timed_write(writer, "completed_courses", (
+        row for profile, _ in students for row in completed_course_rows(profile, courses, by_id, by_major, args.seed)
+    ))
+    timed_write(writer, "course_trends", trend_rows(courses, args.seed, first_year, last_year))
+
+    # Sessions before messages (foreign key); both passes regenerate the same chats from their seeds
+    def chats():
+        for index in range(1, student_count + 1):
+            yield from student_chats(index, courses, args.seed, args.sessions_per_student, args.turns_per_session)
+    timed_write(writer, "chat_sessions", (session for session, _ in chats()))
+    timed_write(writer, "chat_messages", (message for _, messages in chats() for message in messages))
+
+    writer.finish()
+    logger.info(f"Synthetic data ready in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -160,6 +160,22 @@ CREATE TABLE iu_catalog.recommendation_history (
   timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Create decision_cache table (classified queries shared across backend workers)
+CREATE TABLE iu_catalog.decision_cache (
+  query_key TEXT PRIMARY KEY,
+  decision JSONB NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create session_state table (chat session snapshots shared across backend workers)
+CREATE TABLE iu_catalog.session_state (
+  session_id VARCHAR(100) PRIMARY KEY,
+  user_id VARCHAR(20) NOT NULL,
+  version INTEGER NOT NULL,
+  state JSONB NOT NULL,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create index for vector search after the table exists
 CREATE INDEX course_embedding_idx ON iu_catalog.course_details USING ivfflat (embedding vector_cosine_ops);
 
@@ -2,13 +2,15 @@ import os
 import tenacity
 from typing import Optional, Dict, Any, List, Union
 from anthropic import Anthropic
+from llm_admission import LLMAdmission, AdmissionRejected
 
 DEFAULT_MODEL = "claude-3-5-sonnet-20240620"
 DEFAULT_MAX_TOKENS = 1600
 DEFAULT_TEMPERATURE = 0
 
 class AnthropicClient:
-    def __init__(self, api_key: Optional[str] = None, model: str = DEFAULT_MODEL):
+    def __init__(self, api_key: Optional[str] = None, model: str = DEFAULT_MODEL,
+                 admission: Optional[LLMAdmission] = None):
         """
         Initializes the AnthropicClient with the provided API key and model.
         If the API key is not provided, it attempts to read it from the environment variable ANTHROPIC_API_KEY.
@@ -16,12 +18,15 @@ class AnthropicClient:
         Args:
             api_key (Optional[str]): The API key for the Anthropic service.
             model (str): The model to use for the Anthropic service.
+            admission (Optional[LLMAdmission]): Admission controller every request must pass;
+                a full queue raises AdmissionRejected instead of calling the API.
         """
         self.api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
         if not self.api_key:
             raise ValueError("API key must be provided or set in the ANTHROPIC_API_KEY environment variable.")
         
         self.model = model
+        self.admission = admission
         self.client = Anthropic(api_key=self.api_key)
 
     def _create_message_payload(self, 
@@ -61,6 +66,7 @@ class AnthropicClient:
 
     @tenacity.retry(wait=tenacity.wait_random_exponential(multiplier=0.3, exp_base=3, max=90),
                     stop=tenacity.stop_after_attempt(6),
+                    retry=tenacity.retry_if_not_exception_type(AdmissionRejected),
                     reraise=True)
     def send_message(self, 
                     content: str, 
@@ -78,8 +84,17 @@ class AnthropicClient:
 
         Returns:
             Dict[str, Any]: A dictionary containing the status and the result of the response.
+
+        Raises:
+            AdmissionRejected: If the admission controller has no capacity (not retried).
         """
         payload = self._create_message_payload(content, max_tokens, temperature)
+        if self.admission:
+            with self.admission.sync_slot():
+                return self._send(payload, json_eval)
+        return self._send(payload, json_eval)
+
+    def _send(self, payload: Dict[str, Any], json_eval: bool) -> Dict[str, Any]:
         try:
             message = self.client.messages.create(**payload)
             result_text = message.content[0].text
@@ -1,6 +1,7 @@
 import os
+import hmac
 import logging
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header
 from pydantic import BaseModel
 from sqlalchemy import create_engine, func, text
 from sqlalchemy.ext.declarative import declarative_base
@@ -23,9 +24,16 @@ import json
 from pgvector.sqlalchemy import Vector
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 
 # Import the new LangGraph-based system
-from course_recommendation_system_langgraph import CourseRecommenderSystem, SessionManager
+from course_recommendation_system_langgraph import CourseRecommenderSystem, SessionManager, intent_router, recommendation_cache, decision_cache, supervisor_bypass, title_refiner, chat_write_queue, session_turns, init_agent_runtime, llm_admission, llm_breaker, degraded_turns, trace_buffer, llm
+from llm_admission import AdmissionRejected
+import util
+from util import close_async_resources, embedding_breaker, TimedQueuePool
+from metrics import metrics, MetricsMiddleware
+from speculative_retrieval import speculation_counters
+from fake_services import FakeChatAnthropic
 
 load_dotenv()
 
@@ -50,9 +58,17 @@ DB_PORT = int(os.environ.get("DB_PORT", 5432))
 
 # SQLAlchemy setup
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine = create_engine(DATABASE_URL)
+class AppQueuePool(TimedQueuePool):
+    metrics_label = "app"
+
+engine = create_engine(DATABASE_URL, poolclass=AppQueuePool)
 SessionLocal = sessionmaker(bind=engine)
 
+# /debug/* access: with DEBUG_TOKEN set, callers must send it as X-Debug-Token;
+# without one the endpoints exist only when DEBUG_ENDPOINTS=true (local development)
+DEBUG_TOKEN = os.environ.get("DEBUG_TOKEN", "")
+DEBUG_ENDPOINTS = os.environ.get("DEBUG_ENDPOINTS", "false").lower() == "true"
+
 # Define Request Pydantic models
 class UserCreate(BaseModel):
     user_id: str
@@ -83,6 +99,7 @@ class ChatResponse(BaseModel):
     json_response: Optional[Dict] = None
     chat_title: Optional[str] = None
     session_id: Optional[str] = None
+    trace: Optional[Dict] = None  # per-node trace, only when requested with X-Debug-Trace
 
 class CourseTrendResponse(BaseModel):
     year: int
@@ -103,6 +120,10 @@ class ChatSessionResponse(BaseModel):
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+def format_sse(event, data):
+    """Format a server-sent event frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 def extract_json_string(response_text):
     json_match = re.search(r'(\{.*\})', response_text, re.DOTALL)
     
@@ -147,19 +168,38 @@ async def lifespan(app: FastAPI):
             anthropic_api_key = os.environ.get("ANTHROPIC_API_KEY")
             anthropic_model = os.environ.get("ANTHROPIC_MODEL", "claude-3-7-sonnet-20250219")
             if anthropic_api_key:
-                anthropic_client = AnthropicClient(api_key=anthropic_api_key, model=anthropic_model)
+                anthropic_client = AnthropicClient(api_key=anthropic_api_key, model=anthropic_model, admission=llm_admission)
                 logger.info(f"Successfully initialized Anthropic client with model: {anthropic_model}")
             else:
                 logger.warning("ANTHROPIC_API_KEY not found in environment variables")
         except Exception as e:
             logger.warning(f"Could not initialize Anthropic client: {e}")
         
+        # Compile the agent graph and prompt templates once for every session
+        init_agent_runtime()
+        logger.info("Agent runtime initialized")
+        
+        # Background writer for chat messages and sessions
+        chat_write_queue.start()
+        
+        # Drop session snapshots nobody has touched for SESSION_STORE_TTL seconds
+        if session_manager.store:
+            try:
+                await session_manager.store.purge(float(os.environ.get("SESSION_STORE_TTL", 7 * 86400)))
+            except Exception as e:
+                logger.warning(f"Could not purge expired session snapshots: {e}")
+        
         yield
     except Exception as e:
         logger.error(f"Error during startup: {e}")
         raise
     finally:
         logger.info("Cleaning up resources...")
+        await title_refiner.drain()
+        await chat_write_queue.stop()
+        if session_manager.store:
+            await session_manager.store.drain()
+        await close_async_resources()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -178,8 +218,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency histograms for /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Initialize global session manager
-session_manager = SessionManager()
+session_manager = SessionManager.from_env()
+
+# Scrape-time gauges mirroring pool, session and LLM queue state
+def pool_stats():
+    stats = {}
+    for label, pool in (("app", engine.pool), ("sync", util.engine.pool), ("async", util.async_engine.pool)):
+        stats[(label, "size")] = pool.size()
+        stats[(label, "checked_out")] = pool.checkedout()
+        stats[(label, "checked_in")] = pool.checkedin()
+        # QueuePool counts unused capacity as negative overflow
+        stats[(label, "overflow")] = max(0, pool.overflow())
+    return stats
+
+def session_stats():
+    stats = session_manager.stats()
+    return {("sessions",): stats["sessions"], ("users",): stats["users"], ("estimated_bytes",): stats["estimated_bytes"]}
+
+def llm_queue_stats():
+    stats = llm_admission.stats()
+    return {
+        (priority, field): stats[priority][field]
+        for priority in ("interactive", "background")
+        for field in ("in_flight", "queue_depth")
+    }
+
+metrics.gauge("db_pool_connections", "SQLAlchemy pool connections by state", pool_stats, ("engine", "state"))
+metrics.gauge("chat_sessions", "Active chat sessions, users and estimated session memory", session_stats, ("kind",))
+metrics.gauge("llm_admission", "LLM calls in flight and queued by priority", llm_queue_stats, ("priority", "state"))
 
 # Dependency to get the database session
 def get_db():
@@ -197,7 +267,7 @@ def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 @app.post("/signup", response_model=UserResponse)
-async def signup(user: UserCreate, db: Session = Depends(get_db)):
+def signup(user: UserCreate, db: Session = Depends(get_db)):
     """Register a new user account"""
     logger.info(f"Processing signup request for user_id: {user.user_id}")
     
@@ -246,7 +316,7 @@ async def signup(user: UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error creating user: {str(e)}")
 
 @app.post("/login", response_model=UserResponse)
-async def login(credentials: UserLogin, db: Session = Depends(get_db)):
+def login(credentials: UserLogin, db: Session = Depends(get_db)):
     """Authenticate user credentials"""
     logger.info(f"Processing login request for user_id: {credentials.user_id}")
     
@@ -272,7 +342,7 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
     }
 
 @app.get("/course_catalog")
-async def get_course_catalog(db: Session = Depends(get_db)):
+def get_course_catalog(db: Session = Depends(get_db)):
     """Fetch all courses from the database"""
     logger.info("Processing request to fetch all courses")
     
@@ -304,8 +374,27 @@ async def get_course_catalog(db: Session = Depends(get_db)):
         logger.error(f"Error fetching courses: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching courses: {str(e)}")
 
+def has_debug_access(debug_token: Optional[str]) -> bool:
+    if DEBUG_TOKEN:
+        return bool(debug_token) and hmac.compare_digest(debug_token, DEBUG_TOKEN)
+    return DEBUG_ENDPOINTS
+
+def wants_trace(header_value: Optional[str], debug_token: Optional[str]) -> bool:
+    """X-Debug-Trace is honoured only for callers that may also read /debug/*"""
+    return (header_value or "").lower() in ("1", "true", "yes") and has_debug_access(debug_token)
+
+def require_debug_access(debug_token: Optional[str] = Header(default=None, alias="X-Debug-Token")):
+    """Guard for /debug/* endpoints, which expose other users' activity"""
+    if has_debug_access(debug_token):
+        return
+    if DEBUG_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid or missing X-Debug-Token")
+    raise HTTPException(status_code=404, detail="Not Found")
+
 @app.post("/chat", response_model=ChatResponse)
-async def process_chat(request: ChatRequest, db: Session = Depends(get_db)):
+async def process_chat(request: ChatRequest, db: Session = Depends(get_db),
+                       debug_trace: Optional[str] = Header(default=None, alias="X-Debug-Trace"),
+                       debug_token: Optional[str] = Header(default=None, alias="X-Debug-Token")):
     """Process a user query with the LangGraph-based system"""
     logger.info(f"Processing chat request for user_id: {request.user_id}")
     
@@ -313,39 +402,95 @@ async def process_chat(request: ChatRequest, db: Session = Depends(get_db)):
         if not request.user_id or not request.query:
             raise HTTPException(status_code=400, detail="User ID and query are required")
         
+        # Shed load before touching the session when the LLM queue is already full
+        llm_admission.check()
+        
         # Get or create session
         if request.session_id:
             # Try to get existing session
-            recommender = session_manager.get_session_by_id(request.session_id)
+            recommender = await session_manager.aget_session_by_id(request.session_id, db)
             if not recommender:
                 # If session not found, create new one
-                recommender = session_manager.get_or_create_session(request.user_id, db)
+                recommender = session_manager.create_session(request.user_id, db)
         else:
             # Create new session
             print("creating session id")
-            recommender = session_manager.get_or_create_session(request.user_id, db)
+            recommender = session_manager.create_session(request.user_id, db)
         
         print("Processing User query")
         # Process the query
-        response, agent_response, chat_title = recommender.process_query(request.query)
+        with trace_buffer.turn(recommender.session_id, request.user_id) as trace:
+            response, agent_response, chat_title = await recommender.process_query(request.query)
         
         # Return response with session ID
         return ChatResponse(
             response=response,
             json_response=agent_response,
             chat_title=chat_title,
-            session_id=recommender.session_id
+            session_id=recommender.session_id,
+            trace=trace.to_dict() if trace and wants_trace(debug_trace, debug_token) else None
         )
     
     except HTTPException:
         raise
     
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected chat request: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing chat request: {str(e)}")
 
+@app.post("/chat/stream")
+async def process_chat_stream(request: ChatRequest, db: Session = Depends(get_db),
+                              debug_trace: Optional[str] = Header(default=None, alias="X-Debug-Trace"),
+                              debug_token: Optional[str] = Header(default=None, alias="X-Debug-Token")):
+    """Process a user query and stream progress as server-sent events.
+    
+    Emits a `stage` event as each graph node finishes, `token` events with the
+    supervisor's response as it is generated, and a final `done` event carrying
+    the same fields as ChatResponse.
+    """
+    logger.info(f"Processing streaming chat request for user_id: {request.user_id}")
+    
+    if not request.user_id or not request.query:
+        raise HTTPException(status_code=400, detail="User ID and query are required")
+    
+    # The status line is sent with the first event, so a full LLM queue is refused up front
+    try:
+        llm_admission.check()
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    
+    recommender = None
+    if request.session_id:
+        recommender = await session_manager.aget_session_by_id(request.session_id, db)
+    if not recommender:
+        recommender = session_manager.create_session(request.user_id, db)
+    
+    async def event_stream():
+        try:
+            with trace_buffer.turn(recommender.session_id, request.user_id) as trace:
+                async for event, data in recommender.stream_query(request.query):
+                    if event == "done" and trace and wants_trace(debug_trace, debug_token):
+                        data = {**data, "trace": trace.to_dict()}
+                    yield format_sse(event, data)
+        except AdmissionRejected as e:
+            logger.warning(f"Rejected chat stream: {str(e)}")
+            yield format_sse("error", {"detail": str(e), "retry_after": e.retry_after_header})
+        except Exception as e:
+            logger.error(f"Error in chat stream: {str(e)}")
+            yield format_sse("error", {"detail": f"Error processing chat request: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/chat/sessions/{user_id}", response_model=List[ChatSessionResponse])
-async def get_user_sessions(user_id: str, db: Session = Depends(get_db)):
+def get_user_sessions(user_id: str, db: Session = Depends(get_db)):
     """Get all chat sessions for a user"""
     logger.info(f"Fetching sessions for user_id: {user_id}")
     
@@ -366,7 +511,7 @@ async def get_user_sessions(user_id: str, db: Session = Depends(get_db)):
                     "user_id": db_session.user_id,
                     "title": db_session.title,
                     "created_at": db_session.created_at.isoformat(),
-                    "last_active": db_session.last_active.isoformat() if db_session.last_active else None
+                    "last_active": db_session.last_activity.isoformat() if db_session.last_activity else None
                 }
         
         return list(all_sessions.values())
@@ -376,23 +521,23 @@ async def get_user_sessions(user_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error fetching sessions: {str(e)}")
 
 @app.get("/chat/messages/{session_id}")
-async def get_session_messages(session_id: str, db: Session = Depends(get_db)):
+def get_session_messages(session_id: str, db: Session = Depends(get_db)):
     """Get all messages for a specific chat session"""
     logger.info(f"Fetching messages for session_id: {session_id}")
     
     try:
         messages = db.query(ChatMessage).filter(
             ChatMessage.session_id == session_id
-        ).order_by(ChatMessage.created_at).all()
+        ).order_by(ChatMessage.timestamp, ChatMessage.id).all()
         
         return {
             "session_id": session_id,
             "messages": [
                 {
-                    "message_id": msg.message_id,
-                    "role": msg.role,
+                    "message_id": msg.id,
+                    "role": msg.message_type,
                     "content": msg.content,
-                    "created_at": msg.created_at.isoformat()
+                    "created_at": msg.timestamp.isoformat() if msg.timestamp else None
                 }
                 for msg in messages
             ]
@@ -415,7 +560,7 @@ def get_course_trends(course_id: str, db: Session = Depends(get_db)):
     return trends
 
 @app.get("/health")
-async def health_check():
+def health_check():
     """Check if the API is healthy and database is connected"""
     try:
         db = SessionLocal()
@@ -426,6 +571,45 @@ async def health_check():
         logger.error(f"Health check failed: {str(e)}")
         raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/stats", dependencies=[Depends(require_debug_access)])
+async def debug_stats():
+    """Runtime statistics for tuning the chat pipeline"""
+    return {
+        "intent_router": intent_router.stats(),
+        "speculative_retrieval": speculation_counters.stats(),
+        "decision_cache": decision_cache.stats(),
+        "recommendation_cache": recommendation_cache.stats(),
+        "supervisor_bypass": supervisor_bypass.stats(),
+        "title_refiner": title_refiner.stats(),
+        "chat_write_queue": chat_write_queue.stats(),
+        "session_turns": session_turns.stats(),
+        "llm_admission": llm_admission.stats(),
+        "degradation": {
+            "degraded_turns": dict(degraded_turns),
+            "llm_breaker": llm_breaker.stats(),
+            "embedding_breaker": embedding_breaker.stats()
+        },
+        "fake_llm": llm.stats() if isinstance(llm, FakeChatAnthropic) else None
+    }
+
+@app.get("/debug/traces", dependencies=[Depends(require_debug_access)])
+async def debug_traces(limit: int = 20):
+    """Per-node latency, token and cost summary plus the most recent chat turn traces"""
+    return {
+        "summary": trace_buffer.summary(),
+        "traces": trace_buffer.recent(limit)
+    }
+
+@app.get("/debug/sessions", dependencies=[Depends(require_debug_access)])
+async def debug_sessions():
+    """Active chat session count, estimated memory and eviction counters"""
+    return session_manager.stats()
+
 if __name__ == "__main__":
     import uvicorn
     
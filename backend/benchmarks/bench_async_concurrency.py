@@ -0,0 +1,150 @@
+"""
+Concurrent chat throughput and event-loop responsiveness, blocking vs. async I/O.
+
+Fires N concurrent first-turn chats through CourseRecommenderSystem.process_query on
+one event loop while a probe coroutine plays the role of /health, pinging every 20 ms
+and recording how late it wakes up.
+
+  blocking: the stand-in LLM and retrieval sleep with time.sleep, which is what the
+            previous synchronous llm.invoke / requests.post / SQLAlchemy calls did to
+            the event loop.
+  async:    the stand-ins await asyncio.sleep, as ainvoke / httpx / asyncpg do now.
+
+Embedding is stubbed out, and the intent router, caches, LLM admission controller and
+background title refinement are switched off, so every chat makes the same calls in
+both modes and the difference reflects blocking vs. non-blocking I/O only.
+
+Usage:
+    python benchmarks/bench_async_concurrency.py --concurrency 20 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import course_recommendation_system_langgraph as crs
+import speculative_retrieval
+
+DECISION_JSON = json.dumps({
+    "action": "recommendation",
+    "career_goal": ["Data Scientist"],
+    "course_name": [],
+    "course_work": ["Machine Learning"],
+    "original_query": "I want to become a data scientist",
+    "reasoning": "Clear career goal"
+})
+
+PROBE_INTERVAL = 0.02
+
+
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+
+class StandInLLM:
+    """Stand-in LLM that either blocks the loop or yields to it while 'waiting on the network'"""
+    def __init__(self, latency, blocking):
+        self.latency = latency
+        self.blocking = blocking
+
+    async def ainvoke(self, prompt):
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        if "classify them into a structured JSON format" in prompt:
+            return _Message(DECISION_JSON)
+        if "Generate a short, descriptive title" in prompt:
+            return _Message("Data Science Pathway")
+        return _Message('{"recommended_courses": [], "recommendation_strategy": "n/a"}')
+
+
+def stand_in_retrieval(latency, blocking):
+    async def retrieve(*args, **kwargs):
+        if blocking:
+            time.sleep(latency)
+        else:
+            await asyncio.sleep(latency)
+        return []
+    return retrieve
+
+
+async def zero_embeddings(texts, *args, **kwargs):
+    return [[0.0] * 384 for _ in texts]
+
+
+async def health_probe(stop, lags):
+    """Measure how late a periodic wake-up fires while chats are in flight"""
+    while not stop.is_set():
+        expected = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def run_mode(blocking, concurrency, llm_latency, retrieval_latency):
+    crs.llm = StandInLLM(llm_latency, blocking)
+    crs.aget_course_recommendations = stand_in_retrieval(retrieval_latency, blocking)
+    crs.asearch_courses = stand_in_retrieval(retrieval_latency, blocking)
+    speculative_retrieval.asearch_courses = stand_in_retrieval(retrieval_latency, blocking)
+
+    stop = asyncio.Event()
+    lags = []
+    probe = asyncio.create_task(health_probe(stop, lags))
+    await asyncio.sleep(0)
+
+    async def one_chat(index):
+        recommender = crs.CourseRecommenderSystem(f"bench_user_{index}", None)
+        start = time.perf_counter()
+        await recommender.process_query("I want to become a data scientist")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one_chat(i) for i in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    stop.set()
+    await probe
+    return {
+        "wall_s": wall,
+        "throughput_chats_per_s": concurrency / wall,
+        "chat_p50_s": statistics.median(latencies),
+        "chat_max_s": max(latencies),
+        "probe_max_lag_ms": max(lags, default=0.0) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per stand-in LLM call")
+    parser.add_argument("--retrieval-latency", type=float, default=0.05, help="Seconds per stand-in retrieval")
+    args = parser.parse_args()
+
+    crs.intent_router.enabled = False
+    crs.decision_cache.enabled = False
+    crs.recommendation_cache.enabled = False
+    crs.llm_admission.enabled = False
+    crs.title_refiner.enabled = False
+    crs.aembed_texts = zero_embeddings
+    speculative_retrieval.aembed_texts = zero_embeddings
+    crs.save_chat_message = lambda *a, **k: True
+    crs.save_chat_session = lambda *a, **k: True
+    crs.CourseRecommenderSystem._save_session_metadata = lambda self, metadata: None
+
+    print(f"concurrency={args.concurrency} llm_latency={args.llm_latency}s retrieval_latency={args.retrieval_latency}s")
+    for name, blocking in (("blocking", True), ("async", False)):
+        result = asyncio.run(run_mode(blocking, args.concurrency, args.llm_latency, args.retrieval_latency))
+        print(f"{name:>9}: wall {result['wall_s']:.2f}s  "
+              f"throughput {result['throughput_chats_per_s']:.2f} chats/s  "
+              f"chat p50 {result['chat_p50_s']:.2f}s  max {result['chat_max_s']:.2f}s  "
+              f"/health probe max lag {result['probe_max_lag_ms']:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
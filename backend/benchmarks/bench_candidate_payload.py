@@ -0,0 +1,146 @@
+"""
+Input tokens and latency of the recommendation / inquiry prompts with full JSON
+candidates (json.dumps of the retrieval rows) vs. the compact candidate serialiser.
+
+By default the agents run against a stand-in LLM whose latency grows with prompt
+length (--base-latency plus --per-token-latency per input token), so the run needs
+no API key. With --live the real Claude model is called and the input token counts
+reported by the API are used instead of the estimate.
+
+Usage:
+    python benchmarks/bench_candidate_payload.py --candidates 10 --runs 5
+    python benchmarks/bench_candidate_payload.py --live --runs 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import course_recommendation_system_langgraph as crs
+from chat_history_manager import estimate_tokens
+
+SENTENCES = [
+    "This course introduces the principles and practice of {topic}, with an emphasis on real-world applications.",
+    "Students complete a semester-long project in teams and present their work to industry partners.",
+    "Topics include data collection, modelling, evaluation and the ethical implications of {topic}.",
+    "Weekly labs give hands-on experience with current tools and frameworks used in {topic}.",
+    "The course assumes familiarity with introductory programming and statistics.",
+    "Graduate students are expected to complete an additional research component and literature review.",
+    "Assessment is based on assignments, a midterm examination and the final project report.",
+]
+TOPICS = ["machine learning", "data visualization", "user experience design", "database systems",
+          "cloud computing", "information retrieval", "product management", "natural language processing"]
+
+
+class _Message:
+    def __init__(self, content, input_tokens):
+        self.content = content
+        self.usage_metadata = {"input_tokens": input_tokens}
+
+
+class PrefillLLM:
+    """Stand-in LLM whose latency is a fixed cost plus a cost per input token"""
+    def __init__(self, base_latency, per_token_latency):
+        self.base_latency = base_latency
+        self.per_token_latency = per_token_latency
+
+    async def ainvoke(self, prompt):
+        tokens = estimate_tokens(prompt)
+        await asyncio.sleep(self.base_latency + tokens * self.per_token_latency)
+        return _Message('{"recommended_courses": [], "recommendation_strategy": "n/a"}', tokens)
+
+
+def synthetic_courses(count, seed=7):
+    rng = random.Random(seed)
+    courses = []
+    for index in range(count):
+        topic = rng.choice(TOPICS)
+        courses.append({
+            "course_id": f"{rng.randint(0, 999999):06d}",
+            "course_name": f"CSCI-B {500 + index}",
+            "department": "Computer Science",
+            "min_credits": 3,
+            "max_credits": 3,
+            "course_title": topic.title(),
+            "course_description": " ".join(s.format(topic=topic) for s in rng.sample(SENTENCES, 5)),
+            "similarity": rng.random(),
+        })
+    return courses
+
+
+class RecordingLLM:
+    """Wraps an LLM and records prompt sizes and call latency"""
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = []
+
+    async def ainvoke(self, prompt):
+        start = time.perf_counter()
+        result = await self.inner.ainvoke(prompt)
+        usage = getattr(result, "usage_metadata", None) or {}
+        self.calls.append((usage.get("input_tokens", estimate_tokens(prompt)), time.perf_counter() - start))
+        return result
+
+
+async def run_agent(agent, state, runs):
+    crs.llm.calls.clear()
+    for _ in range(runs):
+        await agent(dict(state))
+    tokens = [call[0] for call in crs.llm.calls]
+    latencies = [call[1] for call in crs.llm.calls]
+    return statistics.median(tokens), statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--base-latency", type=float, default=0.4, help="Stand-in LLM fixed seconds per call")
+    parser.add_argument("--per-token-latency", type=float, default=0.0002, help="Stand-in LLM seconds per input token")
+    parser.add_argument("--live", action="store_true", help="Call the real model instead of the stand-in")
+    args = parser.parse_args()
+
+    courses = synthetic_courses(args.candidates)
+
+    async def retrieval(*a, **k):
+        return courses
+    crs.aget_course_recommendations = retrieval
+    crs.recommendation_cache.enabled = False
+    crs.llm = RecordingLLM(crs.llm if args.live else PrefillLLM(args.base_latency, args.per_token_latency))
+
+    compact = {
+        "recommendation": crs.serialize_recommendation_candidates,
+        "inquiry": crs.serialize_inquiry_candidates,
+    }
+    cases = {
+        "recommendation": (crs.recommendation_agent, crs.DecisionOutput(
+            action="recommendation", career_goal=["Data Scientist"], original_query="I want to become a data scientist",
+            reasoning="benchmark")),
+        "inquiry": (crs.inquiry_agent, crs.DecisionOutput(
+            action="inquiry", course_name=["Machine Learning"], original_query="Tell me about Machine Learning",
+            reasoning="benchmark")),
+    }
+
+    print(f"candidates={args.candidates} runs={args.runs} mode={'live' if args.live else 'stand-in'}")
+    for name, (agent, decision) in cases.items():
+        state = {"user_id": "bench_user", "query": decision.original_query, "decision": decision}
+        results = {}
+        for variant, serialiser in (("full", json.dumps), ("compact", compact[name])):
+            setattr(crs, f"serialize_{name}_candidates", serialiser)
+            results[variant] = asyncio.run(run_agent(agent, state, args.runs))
+        setattr(crs, f"serialize_{name}_candidates", compact[name])
+
+        (full_tokens, full_latency), (compact_tokens, compact_latency) = results["full"], results["compact"]
+        print(f"{name:>14}: input tokens {full_tokens:.0f} -> {compact_tokens:.0f} "
+              f"({(1 - compact_tokens / full_tokens) * 100:.1f}% fewer), "
+              f"median latency {full_latency:.3f}s -> {compact_latency:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
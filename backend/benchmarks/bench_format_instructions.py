@@ -0,0 +1,49 @@
+"""
+Prompt size per agent node with PydanticOutputParser.get_format_instructions() vs.
+the compact instructions from format_instructions.render_format_instructions.
+
+Each node's prompt template is filled with representative inputs both ways and the
+input tokens are estimated (about four characters per token), so the run needs no
+API key.
+
+Usage:
+    python benchmarks/bench_format_instructions.py
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import course_recommendation_system_langgraph as crs
+from bench_candidate_payload import synthetic_courses
+from chat_history_manager import estimate_tokens
+
+NODES = {
+    "decision_agent": (crs.DECISION_PROMPT, crs.decision_parser, crs.DECISION_FORMAT_INSTRUCTIONS,
+                       {"query": "I want to become a data scientist"}),
+    "recommendation_agent": (crs.RECOMMENDATION_PROMPT, crs.recommendation_parser, crs.RECOMMENDATION_FORMAT_INSTRUCTIONS,
+                             {"career_goal": ["Data Scientist"],
+                              "courses": crs.serialize_recommendation_candidates(synthetic_courses(10))}),
+    "inquiry_agent": (crs.INQUIRY_PROMPT, crs.inquiry_parser, crs.INQUIRY_FORMAT_INSTRUCTIONS,
+                      {"course_name": ["Machine Learning"],
+                       "course_details": crs.serialize_inquiry_candidates(synthetic_courses(3))}),
+    "clarification_agent": (crs.CLARIFICATION_PROMPT, crs.clarification_parser, crs.CLARIFICATION_FORMAT_INSTRUCTIONS,
+                            {"query": "help"}),
+}
+
+
+def main():
+    results = {}
+    print(f"{'node':>20}  {'schema':>7}  {'compact':>7}  {'saved':>6}")
+    for node, (template, parser, compact, inputs) in NODES.items():
+        before = estimate_tokens(template.format(format_instructions=parser.get_format_instructions(), **inputs))
+        after = estimate_tokens(template.format(format_instructions=compact, **inputs))
+        results[node] = {"schema_tokens": before, "compact_tokens": after, "saved_tokens": before - after}
+        print(f"{node:>20}  {before:>7}  {after:>7}  {before - after:>6}")
+    if "--json" in sys.argv:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
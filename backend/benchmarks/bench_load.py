@@ -0,0 +1,397 @@
+"""
+End-to-end load test of the FastAPI app: /chat, /course_catalog and /login.
+
+Virtual users run closed-loop (request, optional think time, next request), each
+drawing from a weighted mix of scenarios:
+
+  recommendation  /chat with a career goal ("I want to become a data engineer")
+  inquiry         /chat about a course taken from /course_catalog
+  clarification   /chat with a vague or off-topic message
+  catalog         GET /course_catalog
+  login           POST /login as one of the load-test accounts
+
+Chat turns continue the user's session for --turns-per-session turns, so later turns
+carry history like real conversations. Latency percentiles and throughput are reported
+per scenario and per route, counted from the end of --warmup. Results are written as JSON. With
+--compare, p95 and throughput are checked against an earlier results file and the
+exit status is 1 on a regression beyond --max-regression.
+
+The app needs the database (DB_HOST, DB_NAME, DB_USER, DB_PASSWORD, DB_PORT), e.g.
+seeded by Preprocessing_and_Ingestion/generate_synthetic_data.py, whose students can
+be used with --no-signup --user-prefix syn_ --users <students>. With
+--spawn, the fake embedding server and the app are started here with LLM_BACKEND=fake
+(see fake_services.py), so no Anthropic or embedding service is needed; otherwise
+--base-url must point at a running app. Load-test accounts are created with /signup
+unless --no-signup is given. Server stats come from /debug/stats and /debug/traces,
+sending DEBUG_TOKEN as X-Debug-Token when it is set.
+
+Usage:
+    python benchmarks/bench_load.py --spawn --concurrency 20 --duration 60
+    python benchmarks/bench_load.py --base-url http://127.0.0.1:8000 \\
+        --mix recommendation=40,inquiry=20,clarification=10,catalog=20,login=10 \\
+        --output results/after.json --compare results/before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SCENARIO_ROUTES = {
+    "recommendation": "/chat",
+    "inquiry": "/chat",
+    "clarification": "/chat",
+    "catalog": "/course_catalog",
+    "login": "/login",
+}
+DEFAULT_MIX = "recommendation=35,inquiry=20,clarification=10,catalog=20,login=15"
+
+CAREER_GOALS = [
+    "data scientist", "machine learning engineer", "data engineer", "UX designer", "product manager",
+    "cybersecurity analyst", "software engineer", "cloud architect", "bioinformatics researcher",
+    "business analyst", "game developer", "high school math teacher", "quantitative analyst",
+    "public health data analyst", "nonprofit program manager", "digital marketing strategist",
+]
+RECOMMENDATION_TEMPLATES = [
+    "I want to become a {goal}. Which courses should I take?",
+    "I'm thinking of switching to a career as a {goal}.",
+    "What courses would help me get into {goal} work?",
+    "I want to become a {goal} after graduating, where do I start?",
+]
+INQUIRY_TEMPLATES = [
+    "Tell me about {code}",
+    "What are the prerequisites for {title}?",
+    "What topics are covered in {title}?",
+    "Is {code} offered in the spring?",
+]
+CLARIFICATION_QUERIES = [
+    "hi", "I'm so lost this semester", "I love beating my friends at chess", "help",
+    "what should I do", "this is all so confusing", "not sure what I want", "thanks!",
+]
+FOLLOW_UP_QUERIES = [
+    "Can you tell me more about the first one?", "Which of those is the easiest?",
+    "Are there any others like these?", "Compare the second one with the third one.",
+]
+FALLBACK_COURSES = [
+    {"course_name": "CSCI-B 551", "course_title": "Elements of Artificial Intelligence"},
+    {"course_name": "CSCI-B 565", "course_title": "Data Mining"},
+    {"course_name": "INFO-I 590", "course_title": "Applied Machine Learning"},
+]
+
+
+def parse_mix(spec: str):
+    weights = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIO_ROUTES:
+            raise ValueError(f"Unknown scenario '{name}', expected one of {list(SCENARIO_ROUTES)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summarise(samples, window: float):
+    """Latency percentiles (ms), status counts and throughput for a list of (latency, status) samples"""
+    latencies = [latency * 1000 for latency, status in samples if 200 <= status < 300]
+    statuses = defaultdict(int)
+    for _, status in samples:
+        statuses[str(status)] += 1
+    summary = {
+        "requests": len(samples),
+        "ok": len(latencies),
+        "errors": len(samples) - len(latencies),
+        "statuses": dict(statuses),
+        "throughput_rps": round(len(latencies) / window, 2) if window else None,
+    }
+    if latencies:
+        summary.update({
+            "mean_ms": round(sum(latencies) / len(latencies), 1),
+            "p50_ms": round(percentile(latencies, 0.50), 1),
+            "p95_ms": round(percentile(latencies, 0.95), 1),
+            "p99_ms": round(percentile(latencies, 0.99), 1),
+            "max_ms": round(max(latencies), 1),
+        })
+    return summary
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.mix = parse_mix(args.mix)
+        self.samples = defaultdict(list)  # scenario -> [(latency seconds, status)]
+        self.courses = FALLBACK_COURSES
+        self.measure_from = None
+        self.stop_at = None
+        self.sent = 0
+
+    def account(self, index: int):
+        return {"user_id": f"{self.args.user_prefix}{index:05d}", "password": self.args.password}
+
+    async def setup(self, client: httpx.AsyncClient):
+        if not self.args.no_signup:
+            created = 0
+            for index in range(self.args.users):
+                account = self.account(index)
+                response = await client.post("/signup", json={
+                    **account, "first_name": "Load", "last_name": f"User {index}",
+                    "email": f"{account['user_id']}@example.com"
+                })
+                created += response.status_code == 200
+            print(f"Signed up {created} new load-test users ({self.args.users - created} already existed or failed)")
+
+        response = await client.get("/course_catalog")
+        if response.status_code == 200 and response.json().get("courses"):
+            self.courses = response.json()["courses"]
+        print(f"Inquiry queries drawn from {len(self.courses)} catalog courses")
+
+    def chat_query(self, scenario: str, rng: random.Random) -> str:
+        if scenario == "recommendation":
+            return rng.choice(RECOMMENDATION_TEMPLATES).format(goal=rng.choice(CAREER_GOALS))
+        if scenario == "inquiry":
+            course = rng.choice(self.courses)
+            return rng.choice(INQUIRY_TEMPLATES).format(code=course["course_name"], title=course["course_title"])
+        return rng.choice(CLARIFICATION_QUERIES)
+
+    async def request(self, client: httpx.AsyncClient, scenario: str, rng: random.Random, user: dict, session: dict):
+        if scenario == "catalog":
+            return await client.get("/course_catalog")
+        if scenario == "login":
+            return await client.post("/login", json=user)
+
+        payload = {"user_id": user["user_id"], "query": self.chat_query(scenario, rng)}
+        if session["id"] and session["turns"] < self.args.turns_per_session:
+            payload["session_id"] = session["id"]
+            if rng.random() < self.args.follow_up_rate:
+                payload["query"] = rng.choice(FOLLOW_UP_QUERIES)
+        else:
+            session.update(id=None, turns=0)
+        response = await client.post("/chat", json=payload)
+        if response.status_code == 200:
+            session["id"] = response.json().get("session_id")
+            session["turns"] += 1
+        return response
+
+    async def virtual_user(self, client: httpx.AsyncClient, index: int):
+        rng = random.Random(f"{self.args.seed}:{index}")
+        user = self.account(index % self.args.users)
+        session = {"id": None, "turns": 0}
+        scenarios, weights = list(self.mix), list(self.mix.values())
+        while time.monotonic() < self.stop_at:
+            if self.args.requests and self.sent >= self.args.requests:
+                break
+            self.sent += 1
+            scenario = rng.choices(scenarios, weights)[0]
+            start = time.monotonic()
+            try:
+                status = (await self.request(client, scenario, rng, user, session)).status_code
+            except httpx.HTTPError as e:
+                print(f"{scenario} request failed: {type(e).__name__}: {e}")
+                status = 0
+            if start >= self.measure_from:
+                self.samples[scenario].append((time.monotonic() - start, status))
+            if self.args.think_ms:
+                await asyncio.sleep(rng.expovariate(1000 / self.args.think_ms))
+
+    async def run(self):
+        limits = httpx.Limits(max_connections=self.args.concurrency * 2, max_keepalive_connections=self.args.concurrency)
+        async with httpx.AsyncClient(base_url=self.args.base_url, timeout=self.args.timeout, limits=limits) as client:
+            await self.setup(client)
+            started = time.monotonic()
+            self.measure_from = started + self.args.warmup
+            self.stop_at = self.measure_from + self.args.duration
+            print(f"Running {self.args.concurrency} virtual users for {self.args.warmup:g}s warmup + "
+                  f"{self.args.duration:g}s, mix {self.mix}")
+            await asyncio.gather(*(self.virtual_user(client, index) for index in range(self.args.concurrency)))
+            window = min(time.monotonic(), self.stop_at) - self.measure_from
+
+            # Server-side view of the run (of one worker when there are several)
+            server = {}
+            debug_headers = {"X-Debug-Token": os.environ["DEBUG_TOKEN"]} if os.environ.get("DEBUG_TOKEN") else {}
+            try:
+                response = await client.get("/debug/stats", headers=debug_headers)
+                if response.status_code == 200:
+                    server["stats"] = response.json()
+                response = await client.get("/debug/traces", params={"limit": 1}, headers=debug_headers)
+                if response.status_code == 200:
+                    server["trace_summary"] = response.json()["summary"]
+            except httpx.HTTPError:
+                pass
+        return window, server
+
+    def results(self, window: float, server: dict):
+        by_route = defaultdict(list)
+        for scenario, samples in self.samples.items():
+            by_route[SCENARIO_ROUTES[scenario]].extend(samples)
+        all_samples = [sample for samples in self.samples.values() for sample in samples]
+        return {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+            "config": {key: value for key, value in vars(self.args).items() if key not in ("password", "compare")},
+            "fake_services": {key: value for key, value in os.environ.items()
+                              if key.startswith("FAKE_") or key == "LLM_BACKEND"},
+            "window_seconds": round(window, 2),
+            "overall": summarise(all_samples, window),
+            "routes": {route: summarise(samples, window) for route, samples in sorted(by_route.items())},
+            "scenarios": {scenario: summarise(samples, window) for scenario, samples in sorted(self.samples.items())},
+            "server": server,
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_table(results):
+    print(f"\n{'':22} {'requests':>8} {'errors':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = [(f"route {route}", summary) for route, summary in results["routes"].items()]
+    rows += [(f"  {scenario}", summary) for scenario, summary in results["scenarios"].items()]
+    rows.append(("overall", results["overall"]))
+    for name, summary in rows:
+        print(f"{name:22} {summary['requests']:>8} {summary['errors']:>6} {summary['throughput_rps'] or 0:>8.2f} "
+              f"{summary.get('p50_ms', float('nan')):>9.1f} {summary.get('p95_ms', float('nan')):>9.1f} "
+              f"{summary.get('p99_ms', float('nan')):>9.1f}")
+
+
+def compare(results, baseline_path: str, max_regression: float) -> bool:
+    """Print p95 and throughput changes against a baseline run; False if any route regressed too far"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('git_commit')}):")
+    for key in ("concurrency", "mix", "think_ms", "workers"):
+        if baseline.get("config", {}).get(key) != results["config"].get(key):
+            print(f"  note: {key} differs ({baseline.get('config', {}).get(key)} -> {results['config'].get(key)})")
+    ok = True
+    for section in ("routes", "scenarios"):
+        for name, summary in results[section].items():
+            before = baseline.get(section, {}).get(name)
+            if not before or "p95_ms" not in before or "p95_ms" not in summary:
+                continue
+            p95_change = summary["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+            rps_change = (summary["throughput_rps"] / before["throughput_rps"] - 1
+                          if before.get("throughput_rps") else 0.0)
+            regressed = p95_change > max_regression or rps_change < -max_regression
+            ok = ok and not regressed
+            print(f"  {section[:-1]} {name}: p95 {before['p95_ms']} -> {summary['p95_ms']} ms ({p95_change:+.1%}), "
+                  f"throughput {before.get('throughput_rps')} -> {summary['throughput_rps']} rps ({rps_change:+.1%})"
+                  f"{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def wait_until_up(url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout:g}s")
+
+
+def spawn_services(args):
+    """Start the fake embedding server and the app (with the fake LLM) as subprocesses"""
+    env = dict(os.environ)
+    env.setdefault("LLM_BACKEND", "fake")
+    env.setdefault("DEBUG_ENDPOINTS", "true")
+    env["EMBEDDING_API_URL"] = f"http://127.0.0.1:{args.embed_port}/embed"
+    embed = subprocess.Popen([sys.executable, "fake_services.py", "embed", "--port", str(args.embed_port)],
+                             cwd=BACKEND_DIR, env=env)
+    app = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.app_port),
+                            "--log-level", "warning", "--workers", str(args.workers)],
+                           cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL if args.quiet_server else None,
+                           stderr=subprocess.DEVNULL if args.quiet_server else None)
+    processes = [embed, app]
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.embed_port}/health", 30)
+        wait_until_up(f"http://127.0.0.1:{args.app_port}/health", 60)
+    except RuntimeError:
+        stop_services(processes)
+        raise
+    args.base_url = f"http://127.0.0.1:{args.app_port}"
+    return processes
+
+
+def stop_services(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--spawn", action="store_true", help="Start the app and fake services here")
+    parser.add_argument("--app-port", type=int, default=8010)
+    parser.add_argument("--embed-port", type=int, default=8011)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --spawn")
+    parser.add_argument("--quiet-server", action="store_true", help="Hide the spawned app's output")
+    parser.add_argument("--concurrency", type=int, default=10, help="Virtual users")
+    parser.add_argument("--duration", type=float, default=60.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds before measuring")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests (0: no limit)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, name=weight,...")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause between a user's requests")
+    parser.add_argument("--turns-per-session", type=int, default=4)
+    parser.add_argument("--follow-up-rate", type=float, default=0.3,
+                        help="Share of continued-session turns that refer back to the previous answer")
+    parser.add_argument("--users", type=int, default=50, help="Load-test accounts to log in and chat as")
+    parser.add_argument("--user-prefix", default="loadtest_")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--no-signup", action="store_true", help="Accounts already exist")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Results JSON path (default: benchmarks/results/load-<time>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="Allowed p95 increase / throughput drop before --compare fails")
+    args = parser.parse_args()
+
+    processes = spawn_services(args) if args.spawn else []
+    try:
+        test = LoadTest(args)
+        window, server = asyncio.run(test.run())
+    finally:
+        stop_services(processes)
+
+    results = test.results(window, server)
+    print_table(results)
+
+    output = args.output or os.path.join(
+        BACKEND_DIR, "benchmarks", "results", f"load-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare and not compare(results, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
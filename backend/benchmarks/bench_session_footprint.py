@@ -0,0 +1,60 @@
+"""
+Per-session memory and session-creation latency of CourseRecommenderSystem.
+
+Creates N sessions and reports the memory they retain (measured with tracemalloc)
+and how long each constructor call takes. Run it before and after a change to the
+per-session state to compare.
+
+Usage:
+    python benchmarks/bench_session_footprint.py --sessions 500
+"""
+import argparse
+import gc
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import course_recommendation_system_langgraph as crs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    args = parser.parse_args()
+
+    # Warm up imports and any process-wide state before measuring
+    crs.CourseRecommenderSystem("warmup", None)
+    gc.collect()
+
+    # Latency is timed without tracemalloc, which slows allocation down considerably
+    timings = []
+    for index in range(args.sessions):
+        start = time.perf_counter()
+        crs.CourseRecommenderSystem(f"bench_user_{index}", None)
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+
+    sessions = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for index in range(args.sessions):
+        sessions.append(crs.CourseRecommenderSystem(f"bench_user_{index}", None))
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    timings.sort()
+    print(f"sessions: {args.sessions}")
+    print(f"retained memory per session: {retained / args.sessions / 1024:.1f} KiB "
+          f"(estimated_bytes reports {sessions[0].estimated_bytes() / 1024:.1f} KiB)")
+    print(f"creation latency: mean {statistics.mean(timings) * 1000:.3f} ms  "
+          f"p95 {timings[int(len(timings) * 0.95) - 1] * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+First-turn latency and LLM calls: how the provisional chat title is produced.
+
+  llm_linear:    an LLM-written title after the supervisor (the original topology)
+  llm_parallel:  an LLM-written title in parallel with the decision/supervisor branch
+  extractive:    the current title_generator, extracted locally from the first query
+                 (TitleRefiner writes the LLM title later, off the response path)
+
+Runs the real node functions from course_recommendation_system_langgraph against a
+stand-in LLM that sleeps for a fixed time per call (--title-latency for the title
+call), with embedding and course search stubbed out, so no Anthropic, embedding
+service or database is needed. With --concurrency, that many first turns run at once
+through the LLM admission controller (LLM_MAX_CONCURRENCY), where the title call
+competes with the chat-turn calls for slots.
+
+Usage:
+    python benchmarks/bench_title_parallel.py --llm-latency 0.8 --runs 5
+    python benchmarks/bench_title_parallel.py --concurrency 16 --title-latency 1.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from langgraph.graph import StateGraph, END
+import course_recommendation_system_langgraph as crs
+import speculative_retrieval
+from chat_title import TITLE_PROMPT, clean_llm_title
+
+DECISION_JSON = json.dumps({
+    "action": "recommendation",
+    "career_goal": ["Data Scientist"],
+    "course_name": [],
+    "course_work": ["Machine Learning"],
+    "original_query": "I want to become a data scientist",
+    "reasoning": "Clear career goal"
+})
+
+
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+
+class SleepyLLM:
+    """Stand-in LLM with a fixed per-call latency"""
+    def __init__(self, latency, title_latency):
+        self.latency = latency
+        self.title_latency = title_latency
+        self.calls = 0
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        if "Generate a short, descriptive title" in prompt:
+            await asyncio.sleep(self.title_latency)
+            return _Message("Data Science Pathway")
+        await asyncio.sleep(self.latency)
+        if "classify them into a structured JSON format" in prompt:
+            return _Message(DECISION_JSON)
+        return _Message('{"recommended_courses": [], "recommendation_strategy": "n/a"}')
+
+
+async def llm_title_generator(state):
+    """The previous title node: one LLM call on the first turn"""
+    if not state.get("chat_history"):
+        result = await crs.call_llm(TITLE_PROMPT.format(query=state["query"]))
+        return {"chat_title": clean_llm_title(result.content)}
+    return {}
+
+
+def create_linear_graph():
+    """The original topology: supervisor -> title_generator -> save"""
+    workflow = StateGraph(crs.AgentState)
+    workflow.add_node("decision_agent", crs.decision_agent)
+    workflow.add_node("recommendation_agent", crs.recommendation_agent)
+    workflow.add_node("inquiry_agent", crs.inquiry_agent)
+    workflow.add_node("clarification_agent", crs.clarification_agent)
+    workflow.add_node("supervisor_agent", crs.supervisor_agent)
+    workflow.add_node("title_generator", llm_title_generator)
+    workflow.add_node("save_conversation_agent", crs.save_conversation)
+    workflow.set_entry_point("decision_agent")
+    workflow.add_conditional_edges(
+        "decision_agent",
+        lambda x: x["next"],
+        {
+            "recommendation": "recommendation_agent",
+            "inquiry": "inquiry_agent",
+            "clarification_needed": "clarification_agent"
+        }
+    )
+    workflow.add_edge("recommendation_agent", "supervisor_agent")
+    workflow.add_edge("inquiry_agent", "supervisor_agent")
+    workflow.add_edge("clarification_agent", "supervisor_agent")
+    workflow.add_edge("supervisor_agent", "title_generator")
+    workflow.add_edge("title_generator", "save_conversation_agent")
+    workflow.add_edge("save_conversation_agent", END)
+    return workflow.compile()
+
+
+def create_parallel_graph(title_node):
+    """The current topology with `title_node` as the title generator"""
+    current = crs.title_generator
+    crs.title_generator = title_node
+    try:
+        return crs.create_course_recommendation_graph()
+    finally:
+        crs.title_generator = current
+
+
+async def first_turn(graph, index):
+    state = {
+        "user_id": f"bench_user_{index}",
+        "session_id": f"bench_session_{index}",
+        "query": "I want to become a data scientist",
+        "chat_history": [],
+        "db_session": None,
+        "next": "decision"
+    }
+    start = time.perf_counter()
+    result = await graph.ainvoke(state)
+    assert result.get("chat_title"), "title was not generated"
+    return time.perf_counter() - start, result["chat_title"]
+
+
+async def first_turn_latencies(graph, runs, concurrency):
+    timings = []
+    for _ in range(runs):
+        results = await asyncio.gather(*[first_turn(graph, index) for index in range(concurrency)])
+        timings.extend(latency for latency, _ in results)
+    return timings, results[0][1]
+
+
+async def no_courses(*args, **kwargs):
+    return []
+
+
+async def zero_embeddings(texts, *args, **kwargs):
+    return [[0.0] * 384 for _ in texts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="Seconds per stand-in LLM call")
+    parser.add_argument("--title-latency", type=float, default=None,
+                        help="Seconds per title LLM call (default: --llm-latency)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1, help="First turns in flight at once per run")
+    args = parser.parse_args()
+    title_latency = args.llm_latency if args.title_latency is None else args.title_latency
+
+    crs.llm = SleepyLLM(args.llm_latency, title_latency)
+    crs.intent_router.enabled = False
+    crs.decision_cache.enabled = False
+    crs.recommendation_cache.enabled = False
+
+    # Retrieval stubs: nothing reaches the embedding service or the database
+    crs.aget_course_recommendations = no_courses
+    crs.asearch_courses = no_courses
+    crs.aembed_texts = zero_embeddings
+    speculative_retrieval.asearch_courses = no_courses
+    speculative_retrieval.aembed_texts = zero_embeddings
+    crs.save_chat_message = lambda *a, **k: True
+    crs.save_chat_session = lambda *a, **k: True
+
+    graphs = {
+        "llm_linear": create_linear_graph(),
+        "llm_parallel": create_parallel_graph(llm_title_generator),
+        "extractive": crs.create_course_recommendation_graph(),
+    }
+
+    print(f"LLM latency per call: {args.llm_latency:.2f}s (title {title_latency:.2f}s), "
+          f"runs: {args.runs}, concurrency: {args.concurrency}, "
+          f"LLM_MAX_CONCURRENCY: {crs.llm_admission.max_concurrency}")
+    medians = {}
+    for name, graph in graphs.items():
+        calls_before = crs.llm.calls
+        timings, title = asyncio.run(first_turn_latencies(graph, args.runs, args.concurrency))
+        calls = (crs.llm.calls - calls_before) / len(timings)
+        medians[name] = statistics.median(timings)
+        print(f"{name:>12}: median {medians[name]:.3f}s  min {min(timings):.3f}s  max {max(timings):.3f}s  "
+              f"LLM calls/turn {calls:.1f}  title {title!r}")
+    for baseline in ("llm_linear", "llm_parallel"):
+        saved = medians[baseline] - medians["extractive"]
+        print(f"Extractive vs {baseline}: {saved:.3f}s saved ({saved / medians[baseline] * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List
+
+from chat_history_manager import estimate_tokens
+
+# Per-prompt budgets for the serialised candidate list, in estimated tokens
+RECOMMENDATION_CANDIDATE_TOKEN_BUDGET = int(os.environ.get("RECOMMENDATION_CANDIDATE_TOKEN_BUDGET", 900))
+INQUIRY_CANDIDATE_TOKEN_BUDGET = int(os.environ.get("INQUIRY_CANDIDATE_TOKEN_BUDGET", 1200))
+
+# Length of the description digest sent per candidate
+RECOMMENDATION_DIGEST_CHARS = int(os.environ.get("RECOMMENDATION_DIGEST_CHARS", 200))
+INQUIRY_DIGEST_CHARS = int(os.environ.get("INQUIRY_DIGEST_CHARS", 600))
+
+
+@lru_cache(maxsize=8192)
+def course_digest(description: str, max_chars: int = RECOMMENDATION_DIGEST_CHARS) -> str:
+    """
+    Short digest of a course description: whole leading sentences up to `max_chars`,
+    otherwise the first `max_chars` cut at a word boundary. Memoised, so each course is
+    digested once per process rather than once per request.
+    """
+    text = " ".join((description or "").split())
+    if len(text) <= max_chars:
+        return text
+
+    digest = ""
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        candidate = f"{digest} {sentence}".strip()
+        if len(candidate) > max_chars:
+            break
+        digest = candidate
+    if digest:
+        return digest
+    return text[:max_chars].rsplit(" ", 1)[0].rstrip(",;:") + "..."
+
+
+def compact_candidate(course: Dict, digest_chars: int = RECOMMENDATION_DIGEST_CHARS,
+                      extra_fields: Iterable[str] = ()) -> Dict:
+    """Id, code, title and digest for one course row, plus any requested extra fields that are set"""
+    candidate = {
+        "id": course.get("course_id"),
+        "code": course.get("course_name"),
+        "title": course.get("course_title"),
+        "digest": course_digest(course.get("course_description") or "", digest_chars)
+    }
+    for field in extra_fields:
+        if course.get(field) is not None:
+            candidate[field] = course[field]
+    return candidate
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def serialize_candidates(courses: List[Dict], token_budget: int = RECOMMENDATION_CANDIDATE_TOKEN_BUDGET,
+                         digest_chars: int = RECOMMENDATION_DIGEST_CHARS,
+                         extra_fields: Iterable[str] = ()) -> str:
+    """
+    Compact JSON for a ranked candidate list that fits within `token_budget`.
+
+    Candidates are taken in retrieval order (most similar first). When the next one
+    does not fit with its digest it is sent without it; once even that does not fit
+    the list is cut off.
+    """
+    extra_fields = tuple(extra_fields)
+    budget = token_budget
+    candidates = []
+    for course in courses or []:
+        candidate = compact_candidate(course, digest_chars, extra_fields)
+        cost = estimate_tokens(_dumps(candidate)) + 1
+        if cost > budget:
+            candidate.pop("digest")
+            cost = estimate_tokens(_dumps(candidate)) + 1
+            if cost > budget:
+                break
+        candidates.append(candidate)
+        budget -= cost
+    return _dumps(candidates)
+
+
+def serialize_recommendation_candidates(courses: List[Dict]) -> str:
+    """Candidate list for RECOMMENDATION_PROMPT"""
+    return serialize_candidates(courses, RECOMMENDATION_CANDIDATE_TOKEN_BUDGET, RECOMMENDATION_DIGEST_CHARS)
+
+
+def serialize_inquiry_candidates(courses: List[Dict]) -> str:
+    """Candidate list for INQUIRY_PROMPT, with longer digests and credit/department details"""
+    return serialize_candidates(
+        courses, INQUIRY_CANDIDATE_TOKEN_BUDGET, INQUIRY_DIGEST_CHARS,
+        extra_fields=("department", "min_credits", "max_credits")
+    )
@@ -0,0 +1,211 @@
+import asyncio
+import inspect
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a student and a university course recommendation assistant.
+
+Current summary:
+{summary}
+
+New messages to fold into the summary:
+{messages}
+
+Write an updated summary in at most {max_words} words. Keep the student's career goals, courses that were discussed or recommended, constraints they mentioned (semester, credits, schedule) and any open questions. Return only the summary text.
+"""
+
+# Upper bound on messages waiting to be summarised, in case the summarizer keeps failing
+MAX_PENDING_MESSAGES = 40
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+
+def format_message(message: Dict[str, str]) -> str:
+    return f"{'Human' if message['role'] == 'user' else 'Assistant'}: {message['content']}"
+
+
+class ChatHistoryManager:
+    """
+    Conversation history held within a token budget.
+
+    The last `recent_turns` turns are kept verbatim; older messages are folded into a
+    running summary by `summarizer` (a sync or async callable taking a prompt and
+    returning text). Summarisation runs in the background - an asyncio task when a
+    loop is running, otherwise a daemon thread - so it never delays a response.
+    Messages waiting to be folded are still rendered verbatim while budget allows.
+    The first user message is kept separately (`first_query`) since it may since have
+    been folded into the summary.
+    """
+    __slots__ = ("summarizer", "recent_turns", "token_budget", "summary_tokens", "summary", "messages",
+                 "pending", "turn_count", "first_query", "_lock", "_refreshing", "_refresh_task")
+
+    def __init__(self, summarizer: Optional[Callable] = None, recent_turns: int = 4,
+                 token_budget: int = 2000, summary_tokens: int = 300):
+        self.summarizer = summarizer
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+
+        self.summary = ""
+        self.messages: List[Dict[str, str]] = []  # recent messages kept verbatim
+        self.pending: List[Dict[str, str]] = []   # older messages not yet in the summary
+        self.turn_count = 0
+        self.first_query = ""
+
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._refresh_task = None
+
+    @classmethod
+    def from_env(cls, summarizer: Optional[Callable] = None):
+        """Build a manager from CHAT_HISTORY_* environment variables"""
+        return cls(
+            summarizer=summarizer,
+            recent_turns=int(os.environ.get("CHAT_HISTORY_RECENT_TURNS", 4)),
+            token_budget=int(os.environ.get("CHAT_HISTORY_TOKEN_BUDGET", 2000)),
+            summary_tokens=int(os.environ.get("CHAT_HISTORY_SUMMARY_TOKENS", 300))
+        )
+
+    def to_dict(self) -> Dict:
+        """JSON-serialisable snapshot of the history (settings are not included)"""
+        with self._lock:
+            return {
+                "summary": self.summary,
+                "messages": list(self.messages),
+                "pending": list(self.pending),
+                "turn_count": self.turn_count,
+                "first_query": self.first_query
+            }
+
+    def restore(self, data: Dict):
+        """Load a snapshot produced by to_dict; pending messages are summarised again in the background"""
+        with self._lock:
+            self.summary = data.get("summary", "")
+            self.messages = list(data.get("messages", []))
+            self.pending = list(data.get("pending", []))
+            self.turn_count = data.get("turn_count", len(self.messages) // 2)
+            oldest = (self.pending + self.messages)[:1]
+            self.first_query = data.get("first_query") or (
+                oldest[0]["content"] if oldest and oldest[0]["role"] == "user" and not self.summary else "")
+        self._schedule_refresh()
+
+    def add_turn(self, user_content: str, assistant_content: str):
+        """Record a completed turn and fold overflowing turns into the summary in the background"""
+        with self._lock:
+            if not self.turn_count:
+                self.first_query = user_content
+            self.messages.append({"role": "user", "content": user_content})
+            self.messages.append({"role": "assistant", "content": assistant_content})
+            self.turn_count += 1
+
+            overflow = len(self.messages) - self.recent_turns * 2
+            if overflow > 0:
+                self.pending.extend(self.messages[:overflow])
+                self.messages = self.messages[overflow:]
+            if len(self.pending) > MAX_PENDING_MESSAGES:
+                self.pending = self.pending[-MAX_PENDING_MESSAGES:]
+
+        self._schedule_refresh()
+
+    def render(self) -> str:
+        """History text within the token budget: summary, then as many of the newest messages as fit"""
+        with self._lock:
+            summary = self.summary
+            messages = self.pending + self.messages
+
+        budget = self.token_budget
+        header = []
+        if summary:
+            summary_text = f"Summary of earlier conversation: {summary}"
+            summary_text = summary_text[:min(self.summary_tokens, budget) * 4]
+            header.append(summary_text)
+            budget -= estimate_tokens(summary_text)
+
+        # Fill newest-first so the most recent context always survives
+        lines = []
+        for message in reversed(messages):
+            line = format_message(message)
+            cost = estimate_tokens(line)
+            if cost > budget:
+                if not lines and budget > 0:
+                    lines.append(line[:budget * 4])
+                break
+            lines.append(line)
+            budget -= cost
+
+        return "\n".join(header + list(reversed(lines)))
+
+    def _summary_prompt(self, summary: str, batch: List[Dict[str, str]]) -> str:
+        return SUMMARY_PROMPT.format(
+            summary=summary or "(none yet)",
+            messages="\n".join(format_message(message) for message in batch),
+            max_words=int(self.summary_tokens * 0.75)
+        )
+
+    def _take_pending(self):
+        """Next batch to summarise; an empty batch ends the refresh (checked under the lock, so
+        messages added meanwhile start a new one)"""
+        with self._lock:
+            if not self.pending:
+                self._refreshing = False
+            return list(self.pending), self.summary
+
+    def _apply_summary(self, batch, summary):
+        with self._lock:
+            self.summary = summary.strip()
+            # Drop exactly the summarised messages: add_turn may have trimmed pending
+            # meanwhile, and messages that arrived since stay for the next round
+            summarised = {id(message) for message in batch}
+            self.pending = [message for message in self.pending if id(message) not in summarised]
+
+    def _refresh_failed(self, error: Exception):
+        print(f"Error summarising chat history: {error}")
+        with self._lock:
+            self._refreshing = False
+
+    def _schedule_refresh(self):
+        if not self.summarizer:
+            return
+        with self._lock:
+            if not self.pending or self._refreshing:
+                return
+            self._refreshing = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop:
+            self._refresh_task = loop.create_task(self._refresh_async())
+        else:
+            threading.Thread(target=self._refresh_sync, daemon=True).start()
+
+    async def _refresh_async(self):
+        try:
+            while True:
+                batch, summary = self._take_pending()
+                if not batch:
+                    break
+                result = self.summarizer(self._summary_prompt(summary, batch))
+                if inspect.isawaitable(result):
+                    result = await result
+                self._apply_summary(batch, result)
+        except BaseException as e:
+            self._refresh_failed(e)
+            if not isinstance(e, Exception):
+                raise
+
+    def _refresh_sync(self):
+        try:
+            while True:
+                batch, summary = self._take_pending()
+                if not batch:
+                    break
+                self._apply_summary(batch, self.summarizer(self._summary_prompt(summary, batch)))
+        except Exception as e:
+            self._refresh_failed(e)
@@ -0,0 +1,268 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+
+from postgresql_model import ChatMessage, ChatSession
+from util import AsyncSessionLocal
+
+
+class ChatWriteQueue:
+    """
+    Write-behind queue for chat messages and sessions.
+
+    Messages are buffered in process and written with one multi-row INSERT per flush;
+    session rows are upserted once per flush with the latest last_activity and title,
+    however many turns touched them. A background task flushes when `batch_size`
+    messages are waiting or every `flush_interval` seconds, and `stop()` flushes
+    whatever is left so a graceful shutdown loses nothing.
+
+    When a batch fails, its rows are retried one at a time so a single bad row (e.g. a
+    session whose user_id is not in login) cannot block everyone else's writes. Rows
+    that still fail are requeued, and dropped with a log line after `max_attempts`
+    failures. If the database itself is unreachable nothing is counted against the
+    rows; they are kept and retried, and beyond `max_buffer` messages the oldest are
+    dropped.
+    """
+    def __init__(self, batch_size: int = 100, flush_interval: float = 0.5, max_buffer: int = 10000,
+                 max_attempts: int = 5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_attempts = max_attempts
+
+        self._messages: List[Dict] = []
+        self._sessions: Dict[str, Dict] = {}  # session_id -> coalesced session row
+        self._wakeup = None
+        self._task = None
+        self._flush_lock = None
+        self._stopping = False
+
+        self.enqueued = 0
+        self.flushed_messages = 0
+        self.flushed_sessions = 0
+        self.batches = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.dropped = 0
+        self.failed_rows = 0
+        self.dropped_rows = 0
+        self.last_flush_ms = None
+
+    @classmethod
+    def from_env(cls):
+        """Build a queue from CHAT_WRITE_* environment variables"""
+        return cls(
+            batch_size=int(os.environ.get("CHAT_WRITE_BATCH_SIZE", 100)),
+            flush_interval=float(os.environ.get("CHAT_WRITE_FLUSH_INTERVAL", 0.5)),
+            max_buffer=int(os.environ.get("CHAT_WRITE_MAX_BUFFER", 10000)),
+            max_attempts=int(os.environ.get("CHAT_WRITE_MAX_ATTEMPTS", 5))
+        )
+
+    def _touch_session(self, session_id: str, user_id: Optional[str] = None, title: Optional[str] = None,
+                       at: Optional[datetime] = None):
+        row = self._sessions.get(session_id)
+        if row is None:
+            row = self._sessions[session_id] = {"session_id": session_id, "user_id": None, "title": None,
+                                                "last_activity": None, "attempts": 0}
+        else:
+            self.coalesced += 1
+        if user_id:
+            row["user_id"] = user_id
+        if title:
+            row["title"] = title[:255]
+        if at and (row["last_activity"] is None or at > row["last_activity"]):
+            row["last_activity"] = at
+
+    def add_message(self, user_id: str, session_id: str, message_type: str, content: str,
+                    meta_data: Optional[Dict] = None):
+        """Queue a chat message; the session's last_activity is bumped with it"""
+        now = datetime.now()
+        self._messages.append({
+            "session_id": session_id,
+            "user_id": user_id,
+            "message_type": message_type,
+            "content": content,
+            "timestamp": now,
+            "meta_data": meta_data,
+            "attempts": 0
+        })
+        self._touch_session(session_id, user_id, at=now)
+        self.enqueued += 1
+
+        if len(self._messages) > self.max_buffer:
+            overflow = len(self._messages) - self.max_buffer
+            del self._messages[:overflow]
+            self.dropped += overflow
+        if len(self._messages) >= self.batch_size and self._wakeup:
+            self._wakeup.set()
+
+    def save_session(self, session_id: str, user_id: str, title: Optional[str] = None):
+        """Queue a session upsert"""
+        self._touch_session(session_id, user_id, title, at=datetime.now())
+
+    def set_title(self, session_id: str, title: str):
+        """Queue a title change; merged into the pending upsert if the session has not been written yet"""
+        self._touch_session(session_id, title=title)
+
+    async def flush(self):
+        """Write everything buffered so far"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._messages and not self._sessions:
+                return
+            messages, self._messages = self._messages, []
+            sessions, self._sessions = self._sessions, {}
+
+            start = time.perf_counter()
+            try:
+                await self._write(messages, sessions)
+            except Exception as e:
+                print(f"Chat persistence flush failed ({len(messages)} messages): {e}")
+                self.errors += 1
+                messages, sessions = await self._write_rows(messages, sessions)
+                self._requeue(messages, sessions)
+                return
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            self.flushed_messages += len(messages)
+            self.flushed_sessions += len(sessions)
+            self.batches += 1
+
+    async def _write_rows(self, messages: List[Dict], sessions: Dict[str, Dict]):
+        """
+        Retry a failed batch one row at a time, sessions before their messages.
+        Returns the rows to requeue; rows that failed `max_attempts` times are dropped.
+        """
+        if not await self._database_reachable():
+            return messages, sessions
+
+        failed_sessions = {}
+        for session_id, row in sessions.items():
+            try:
+                await self._write([], {session_id: row})
+                self.flushed_sessions += 1
+            except Exception as e:
+                if self._retry(row, f"session {session_id}", e):
+                    failed_sessions[session_id] = row
+        failed_messages = []
+        for message in messages:
+            try:
+                await self._write([message], {})
+                self.flushed_messages += 1
+            except Exception as e:
+                if self._retry(message, f"{message['message_type']} message in session {message['session_id']}", e):
+                    failed_messages.append(message)
+        return failed_messages, failed_sessions
+
+    def _retry(self, row: Dict, label: str, error: Exception) -> bool:
+        """Count a failed write against a row; False once it has used up its attempts and is dropped"""
+        row["attempts"] += 1
+        self.failed_rows += 1
+        if row["attempts"] < self.max_attempts:
+            return True
+        print(f"Chat persistence dropped {label} after {row['attempts']} failed writes: {error}")
+        self.dropped_rows += 1
+        return False
+
+    async def _database_reachable(self) -> bool:
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(sa.text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+
+    def _requeue(self, messages: List[Dict], sessions: Dict[str, Dict]):
+        """Put failed rows back in front of anything queued since"""
+        self._messages = messages + self._messages
+        newer = self._sessions
+        self._sessions = sessions
+        for row in newer.values():
+            self._touch_session(row["session_id"], row["user_id"], row["title"], row["last_activity"])
+        if len(self._messages) > self.max_buffer:
+            overflow = len(self._messages) - self.max_buffer
+            del self._messages[:overflow]
+            self.dropped += overflow
+
+    async def _write(self, messages: List[Dict], sessions: Dict[str, Dict]):
+        upserts = [row for row in sessions.values() if row["user_id"]]
+        title_updates = [row for row in sessions.values() if not row["user_id"] and row["title"]]
+
+        async with AsyncSessionLocal() as session:
+            # Sessions first: chat_messages.session_id references chat_sessions
+            if upserts:
+                statement = insert(ChatSession).values([
+                    {
+                        "session_id": row["session_id"],
+                        "user_id": row["user_id"],
+                        "title": row["title"],
+                        "last_activity": row["last_activity"] or datetime.now()
+                    }
+                    for row in upserts
+                ])
+                await session.execute(statement.on_conflict_do_update(
+                    index_elements=[ChatSession.session_id],
+                    set_={
+                        "title": sa.func.coalesce(statement.excluded.title, ChatSession.title),
+                        "last_activity": sa.func.greatest(statement.excluded.last_activity, ChatSession.last_activity)
+                    }
+                ))
+            for row in title_updates:
+                await session.execute(
+                    sa.update(ChatSession).where(ChatSession.session_id == row["session_id"]).values(title=row["title"])
+                )
+            if messages:
+                await session.execute(insert(ChatMessage).values([
+                    {key: value for key, value in message.items() if key != "attempts"} for message in messages
+                ]))
+            await session.commit()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        """Start the background flusher on the running event loop"""
+        if self._task and not self._task.done():
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the background flusher and write everything still buffered"""
+        if self._task:
+            # Let an in-flight flush finish rather than cancelling it halfway through
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "running": bool(self._task and not self._task.done()),
+            "buffered_messages": len(self._messages),
+            "buffered_sessions": len(self._sessions),
+            "enqueued": self.enqueued,
+            "flushed_messages": self.flushed_messages,
+            "flushed_sessions": self.flushed_sessions,
+            "batches": self.batches,
+            "coalesced_session_updates": self.coalesced,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "failed_rows": self.failed_rows,
+            "dropped_rows": self.dropped_rows,
+            "last_flush_ms": round(self.last_flush_ms, 1) if self.last_flush_ms is not None else None
+        }
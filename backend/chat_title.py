@@ -0,0 +1,159 @@
+import asyncio
+import inspect
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+TITLE_PROMPT = """
+Generate a short, descriptive title (5 words or less) for a chat session about course recommendations that starts with this query:
+
+User Query: {query}
+
+Title:
+"""
+
+# Function words plus the phrasing students wrap around a goal or course name
+STOPWORDS = {
+    "a", "about", "after", "all", "am", "an", "and", "any", "are", "as", "at", "be", "become", "becoming",
+    "been", "being", "best", "but", "by", "can", "could", "course", "courses", "do", "does", "for", "from",
+    "get", "give", "good", "have", "help", "hey", "hi", "how", "i", "i'd", "i'm", "if", "in", "interested",
+    "into", "is", "it", "just", "know", "like", "looking", "me", "might", "more", "my", "need", "of", "on",
+    "or", "please", "recommend", "recommendations", "should", "so", "some", "suggest", "take", "taking",
+    "tell", "thanks", "that", "the", "there", "thinking", "this", "to", "want", "wanna", "was", "what",
+    "when", "which", "who", "will", "with", "would", "you", "your"
+}
+
+# Course codes such as "CSCI-B 551" are kept intact
+COURSE_CODE_PATTERN = re.compile(r"\b[A-Z]{2,5}-[A-Z]\s?\d{3}\b")
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9+#.'-]*|\d+")
+
+
+def default_title() -> str:
+    return f"Course Conversation {datetime.now().strftime('%Y-%m-%d')}"
+
+
+def extractive_title(query: str, max_words: int = 5, max_chars: int = 50) -> str:
+    """
+    Provisional session title computed locally from the first query: course codes and
+    keywords in their original order with stopwords and duplicates removed, title-cased
+    and truncated. No LLM call is made.
+    """
+    words = COURSE_CODE_PATTERN.findall(query or "")
+    text = COURSE_CODE_PATTERN.sub(" ", query or "")
+
+    seen = {word.casefold() for word in words}
+    for word in WORD_PATTERN.findall(text):
+        word = word.strip(".'-")
+        key = word.casefold()
+        if not word or key in STOPWORDS or key in seen:
+            continue
+        seen.add(key)
+        words.append(word if any(c.isupper() for c in word[1:]) or any(c.isdigit() for c in word) else word.capitalize())
+
+    title = ""
+    for word in words[:max_words]:
+        candidate = f"{title} {word}".strip()
+        if len(candidate) > max_chars:
+            break
+        title = candidate
+    return title or default_title()
+
+
+def clean_llm_title(text: str, max_chars: int = 80) -> str:
+    """Strip quotes, a leading 'Title:' and trailing punctuation from a model-written title"""
+    title = (text or "").strip().splitlines()[0] if (text or "").strip() else ""
+    title = re.sub(r"^title\s*:\s*", "", title, flags=re.IGNORECASE)
+    return title.strip(" \"'*#.").strip()[:max_chars]
+
+
+class TitleRefiner:
+    """
+    Replaces the provisional extractive title with an LLM-written one in the background.
+
+    `generate` takes the title prompt and returns text; `writer(session_id, title)`
+    persists the refined title. Both may be sync or async. Refinement runs as an
+    asyncio task when a loop is running, otherwise in a daemon thread, so it never
+    delays a response. Failures keep the provisional title.
+    """
+    def __init__(self, generate: Optional[Callable] = None, writer: Optional[Callable] = None, enabled: bool = True):
+        self.generate = generate
+        self.writer = writer
+        self.enabled = enabled and generate is not None
+        self._tasks = set()
+
+        self.scheduled = 0
+        self.refined = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls, generate: Optional[Callable] = None, writer: Optional[Callable] = None):
+        """Build a refiner; CHAT_TITLE_REFINE=false keeps the extractive titles"""
+        return cls(generate=generate, writer=writer,
+                   enabled=os.environ.get("CHAT_TITLE_REFINE", "true").lower() == "true")
+
+    def schedule(self, session_id: str, query: str, on_title: Optional[Callable[[str], None]] = None):
+        """Start refining the title for a session's first query"""
+        if not self.enabled:
+            return
+        self.scheduled += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop:
+            task = loop.create_task(self._refine_async(session_id, query, on_title))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            threading.Thread(target=self._refine_sync, args=(session_id, query, on_title), daemon=True).start()
+
+    @staticmethod
+    async def _maybe_await(result):
+        if inspect.isawaitable(result):
+            return await result
+        return result
+
+    async def _refine_async(self, session_id, query, on_title):
+        try:
+            title = clean_llm_title(await self._maybe_await(self.generate(TITLE_PROMPT.format(query=query))))
+            if not title:
+                return
+            if on_title:
+                on_title(title)
+            if self.writer:
+                await self._maybe_await(self.writer(session_id, title))
+            self.refined += 1
+        except Exception as e:
+            print(f"Error refining chat title: {e}")
+            self.errors += 1
+
+    def _refine_sync(self, session_id, query, on_title):
+        try:
+            title = clean_llm_title(self.generate(TITLE_PROMPT.format(query=query)))
+            if not title:
+                return
+            if on_title:
+                on_title(title)
+            if self.writer:
+                self.writer(session_id, title)
+            self.refined += 1
+        except Exception as e:
+            print(f"Error refining chat title: {e}")
+            self.errors += 1
+
+    async def drain(self):
+        """Wait for in-flight refinements (used on shutdown)"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "scheduled": self.scheduled,
+            "refined": self.refined,
+            "errors": self.errors,
+            "in_flight": len(self._tasks)
+        }
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """A call was refused without being attempted because its dependency is failing"""
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} circuit open; next attempt in {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Fails calls to a sick dependency fast instead of letting each one time out.
+
+    After `failure_threshold` consecutive failures the circuit opens and every call
+    raises CircuitOpen for `reset_timeout` seconds. Then one trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+
+    Used as a context manager around the call, from async code or threads:
+
+        async with llm_breaker:
+            result = await llm.ainvoke(prompt)
+
+    Cancellation does not count as a failure.
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0, enabled: bool = True):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.consecutive_failures = 0
+
+        self.calls = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.opened = 0
+
+    @classmethod
+    def from_env(cls, name: str):
+        """Build from <NAME>_BREAKER, <NAME>_BREAKER_FAILURES and <NAME>_BREAKER_RESET environment variables"""
+        return cls(
+            name=name.lower(),
+            failure_threshold=int(os.environ.get(f"{name}_BREAKER_FAILURES", 5)),
+            reset_timeout=float(os.environ.get(f"{name}_BREAKER_RESET", 30.0)),
+            enabled=os.environ.get(f"{name}_BREAKER", "true").lower() == "true"
+        )
+
+    def is_open(self) -> bool:
+        """Whether a call made now would be refused"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() - self._opened_at < self.reset_timeout
+            return self.state == HALF_OPEN and self._trial_in_flight
+
+    def before_call(self):
+        """Raise CircuitOpen if the call must not be attempted"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == OPEN:
+                waited = time.monotonic() - self._opened_at
+                if waited < self.reset_timeout:
+                    self.short_circuited += 1
+                    raise CircuitOpen(self.name, self.reset_timeout - waited)
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._trial_in_flight:
+                    self.short_circuited += 1
+                    raise CircuitOpen(self.name, 0.0)
+                self._trial_in_flight = True
+            self.calls += 1
+
+    def record_success(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+            self.state = CLOSED
+
+    def record_failure(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                    print(f"Circuit {self.name} opened after {self.consecutive_failures} consecutive failures")
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def _release_trial(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+    def __enter__(self):
+        self.before_call()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.record_success()
+        elif issubclass(exc_type, (asyncio.CancelledError, KeyboardInterrupt)):
+            self._release_trial()
+        else:
+            self.record_failure()
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "calls": self.calls,
+            "failures": self.failures,
+            "short_circuited": self.short_circuited,
+            "opened": self.opened
+        }
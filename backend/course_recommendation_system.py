@@ -1,5 +1,4 @@
 from langchain.chains import LLMChain
-from langchain.memory import ConversationBufferMemory
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 from langchain.prompts import PromptTemplate
@@ -12,6 +11,9 @@ from dotenv import load_dotenv
 import random
 import string
 from util import get_course_recommendations
+from chat_history_manager import ChatHistoryManager
+from chat_title import TitleRefiner, extractive_title
+from format_instructions import render_format_instructions
 import re
 from datetime import datetime
 
@@ -335,28 +337,25 @@ Agent response to process: {agent_response}
 Craft a helpful, natural-sounding response to the user that incorporates the specialized agent's information while maintaining a conversational tone.
 """
 
-# Title generation prompt
-TITLE_PROMPT = """
-Generate a short, descriptive title (5 words or less) for a chat session about course recommendations that starts with this query:
-
-User Query: {query}
-
-Title:
-"""
-
 # Initialize output parsers
 decision_parser         = PydanticOutputParser(pydantic_object=DecisionOutput)
 recommendation_parser   = PydanticOutputParser(pydantic_object=RecommendationOutput)
 inquiry_parser          = PydanticOutputParser(pydantic_object=GeneralInquiryOutput)
 clarification_parser    = PydanticOutputParser(pydantic_object=ClarificationOutput)
 
+# Compact output instructions, rendered once at import instead of the full JSON schema per call
+DECISION_FORMAT_INSTRUCTIONS = render_format_instructions(DecisionOutput)
+RECOMMENDATION_FORMAT_INSTRUCTIONS = render_format_instructions(RecommendationOutput)
+INQUIRY_FORMAT_INSTRUCTIONS = render_format_instructions(GeneralInquiryOutput)
+CLARIFICATION_FORMAT_INSTRUCTIONS = render_format_instructions(ClarificationOutput)
+
 # Initialize agent chains
 decision_chain = LLMChain(
     llm=llm,
     prompt=PromptTemplate(
         template=DECISION_PROMPT,
         input_variables=["query"],
-        partial_variables={"format_instructions": decision_parser.get_format_instructions()}
+        partial_variables={"format_instructions": DECISION_FORMAT_INSTRUCTIONS}
     ),
     output_key="decision"
 )
@@ -366,7 +365,7 @@ recommendation_chain = LLMChain(
     prompt=PromptTemplate(
         template=RECOMMENDATION_PROMPT,
         input_variables=["career_goal", "courses"],
-        partial_variables={"format_instructions": recommendation_parser.get_format_instructions()}
+        partial_variables={"format_instructions": RECOMMENDATION_FORMAT_INSTRUCTIONS}
     ),
     output_key="recommendations"
 )
@@ -376,7 +375,7 @@ inquiry_chain = LLMChain(
     prompt=PromptTemplate(
         template=INQUIRY_PROMPT,
         input_variables=["course_name", "course_details"],
-        partial_variables={"format_instructions": inquiry_parser.get_format_instructions()}
+        partial_variables={"format_instructions": INQUIRY_FORMAT_INSTRUCTIONS}
     ),
     output_key="course_info"
 )
@@ -386,7 +385,7 @@ clarification_chain = LLMChain(
     prompt=PromptTemplate(
         template=CLARIFICATION_PROMPT,
         input_variables=["query"],
-        partial_variables={"format_instructions": clarification_parser.get_format_instructions()}
+        partial_variables={"format_instructions": CLARIFICATION_FORMAT_INSTRUCTIONS}
     ),
     output_key="clarification"
 )
@@ -400,20 +399,6 @@ supervisor_chain = LLMChain(
     output_key="final_response"
 )
 
-# Title generation chain
-title_chain = LLMChain(
-    llm=ChatAnthropic(
-        model_name="claude-3-7-sonnet-20250219",
-        temperature=0.7,  # Higher temperature for more creative titles
-        max_tokens=30,    # Keep titles concise
-        api_key=os.getenv("ANTHROPIC_API_KEY")
-    ),
-    prompt=PromptTemplate(
-        template=TITLE_PROMPT,
-        input_variables=["query"]
-    )
-)
-
 def save_chat_message(user_id, session_id, message_type, content):
     """Save chat message to database"""
     # This is a placeholder - will be replaced with actual database query
@@ -438,6 +423,17 @@ def get_user_sessions(user_id):
     # This is a placeholder - will be replaced with actual database query
     return []
 
+def summarise_history(prompt):
+    """Summarizer used by ChatHistoryManager to fold old turns into the running summary"""
+    return llm.invoke(prompt).content
+
+def generate_title(prompt):
+    """Title writer used by TitleRefiner to replace the provisional title in the background"""
+    return llm.invoke(prompt).content
+
+# Background LLM refinement of the provisional extractive titles
+title_refiner = TitleRefiner.from_env(generate=generate_title)
+
 # Generate a random session ID
 def generate_session_id(user_id):
     random_str = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
@@ -450,14 +446,17 @@ class CourseRecommenderSystem:
         self.user_id = user_id
         self.session_id = generate_session_id(user_id)
         self.session_created_at = datetime.now().isoformat()
-        self.memory = ConversationBufferMemory(memory_key="chat_history")
+        self.history = ChatHistoryManager.from_env(summarizer=summarise_history)
         self.last_decision = None
         self.chat_title = None
         self.all_sessions = {}  # In-memory storage for sessions
     
     def generate_chat_title(self, first_query):
         """
-        Generate a descriptive title for the chat session based on the first query.
+        Generate a provisional title for the chat session based on the first query.
+        
+        The title is extracted locally, without an LLM call; title_refiner replaces it
+        in the background.
         
         Args:
             first_query: The user's first message in the conversation
@@ -465,21 +464,14 @@ class CourseRecommenderSystem:
         Returns:
             A descriptive title for the chat session
         """
-        try:
-            # Generate the title
-            title = title_chain.run(query=first_query).strip()
-            
-            # Fallback if generation fails or returns empty
-            if not title:
-                # Extract keywords from the query
-                words = first_query.split()
-                title = " ".join(words[:4]) + ("..." if len(words) > 4 else "")
-            
-            return title
-        except Exception as e:
-            print(f"Error generating title: {e}")
-            # Fallback to default title with timestamp
-            return f"Course Conversation {datetime.now().strftime('%Y-%m-%d')}"
+        return extractive_title(first_query)
+    
+    def _apply_refined_title(self, title):
+        """Adopt the background-refined title and save it with the session metadata"""
+        self.chat_title = title
+        metadata = self.all_sessions.get(self.session_id)
+        if metadata:
+            self._save_session_metadata(dict(metadata, title=title, last_active=datetime.now().isoformat()))
     
     def save_chat_session(self, title=None):
         """
@@ -491,16 +483,8 @@ class CourseRecommenderSystem:
         Returns:
             Dictionary with session metadata
         """
-        # Get the first message if available
-        chat_history = self.memory.load_memory_variables({}).get("chat_history", "")
-        messages = chat_history.split("\n")
-        first_query = ""
-        
-        # Extract the first user query from chat history
-        for message in messages:
-            if message.startswith("Human:"):
-                first_query = message.replace("Human:", "").strip()
-                break
+        # The first user query is kept by the history even after it has been summarised
+        first_query = self.history.first_query
         
         # Generate title if not provided
         if not title and first_query:
@@ -573,7 +557,7 @@ class CourseRecommenderSystem:
     
     def process_query(self, query):
         # Check if this is the first query (no chat history)
-        is_first_query = len(self.memory.load_memory_variables({}).get("chat_history", "")) == 0
+        is_first_query = self.history.turn_count == 0
         
         # Save user message
         save_chat_message(self.user_id, self.session_id, "user", query)
@@ -617,18 +601,16 @@ class CourseRecommenderSystem:
                 agent_response = clarification_result
             
             # Step 3: Supervisor Agent generates final response
-            chat_history = self.memory.load_memory_variables({})["chat_history"]
+            # Token-budgeted history: rolling summary plus the most recent turns
+            chat_history = self.history.render()
             final_response = supervisor_chain.run(
                 chat_history=chat_history,
                 query=query,
                 agent_response=agent_response
             )
             
-            # Update memory with the interaction
-            self.memory.save_context(
-                {"input": query},
-                {"output": final_response}
-            )
+            # Update history with the interaction (older turns are summarised in the background)
+            self.history.add_turn(query, final_response)
             print(type(agent_response))
             print(agent_response)
 
@@ -645,6 +627,7 @@ class CourseRecommenderSystem:
                 self.chat_title = self.generate_chat_title(query)
                 self.save_chat_session(title=self.chat_title)
                 print(f"Generated chat title: {self.chat_title}")
+                title_refiner.schedule(self.session_id, query, on_title=self._apply_refined_title)
             
             
             return final_response, agent_response, self.chat_title
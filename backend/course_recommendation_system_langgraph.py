@@ -1,17 +1,39 @@
 from typing import Dict, TypedDict, List, Optional, Annotated, Literal
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
 from langchain.memory import ConversationBufferMemory
 from langchain_anthropic import ChatAnthropic
+import anthropic
 from langchain.prompts import PromptTemplate
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from langchain.output_parsers import PydanticOutputParser
+import asyncio
 import json
 import os
+import threading
+import time
+from collections import Counter, OrderedDict
 from dotenv import load_dotenv
 import random
 import string
 from datetime import datetime
-from util import get_course_recommendations
+from util import aget_course_recommendations, aembed_texts, asearch_courses, aget_eligibility_fingerprint, aget_catalog_version
+from intent_router import IntentRouter, extract_career_goal, extract_course_reference
+from speculative_retrieval import SpeculativeRetrieval, SPECULATIVE_RETRIEVAL_ENABLED
+from semantic_cache import SemanticCache
+from decision_cache import DecisionCache
+from chat_history_manager import ChatHistoryManager
+from format_instructions import render_format_instructions
+from response_renderer import SupervisorBypass, render_retrieval_only, render_structured
+from chat_title import TitleRefiner, extractive_title
+from chat_persistence import ChatWriteQueue
+from session_store import SessionStore
+from session_locks import SessionTurns
+from llm_admission import LLMAdmission, AdmissionRejected, INTERACTIVE, BACKGROUND
+from circuit_breaker import CircuitBreaker, CircuitOpen
+import tracing
+from metrics import LLM_LATENCY
+from candidate_serializer import serialize_recommendation_candidates, serialize_inquiry_candidates
+from fake_services import FakeChatAnthropic, ResponseRecorder
 import re
 
 # Load environment variables
@@ -272,7 +294,7 @@ For each recommended course, provide:
 - Assess interdisciplinary connections
 
 Career goal: {career_goal}
-Available courses: {courses}
+Available courses (id, code, title and a digest of the description; use them for course_id, course_code, course_title and course_description): {courses}
 
 {format_instructions}
 """
@@ -288,7 +310,7 @@ Please provide comprehensive information about the requested course, including:
 - Related courses that might also interest the student
 
 Course requested: {course_name}
-Course details: {course_details}
+Course details (id, code, title, a digest of the description, department and credits): {course_details}
 
 {format_instructions}
 """
@@ -325,30 +347,132 @@ Agent response to process: {agent_response}
 Craft a helpful, natural-sounding response to the user that incorporates the specialized agent's information while maintaining a conversational tone.
 """
 
-TITLE_PROMPT = """
-Generate a short, descriptive title (5 words or less) for a chat session about course recommendations that starts with this query:
-
-User Query: {query}
-
-Title:
-"""
-
 # Initialize output parsers
 decision_parser = PydanticOutputParser(pydantic_object=DecisionOutput)
 recommendation_parser = PydanticOutputParser(pydantic_object=RecommendationOutput)
 inquiry_parser = PydanticOutputParser(pydantic_object=GeneralInquiryOutput)
 clarification_parser = PydanticOutputParser(pydantic_object=ClarificationOutput)
 
-# Initialize LLM
-llm = ChatAnthropic(
-    model_name=os.getenv("ANTHROPIC_MODEL", "claude-3-haiku-20240307"),
-    temperature=0.3,
-    api_key=os.getenv("ANTHROPIC_API_KEY"),
-    max_tokens=4092,
-    timeout=10.0,  # Add timeout
-    max_retries=1  # Reduce retries
+# Compact output instructions, rendered once at import instead of the full JSON schema per call
+DECISION_FORMAT_INSTRUCTIONS = render_format_instructions(DecisionOutput)
+RECOMMENDATION_FORMAT_INSTRUCTIONS = render_format_instructions(RecommendationOutput)
+INQUIRY_FORMAT_INSTRUCTIONS = render_format_instructions(GeneralInquiryOutput)
+CLARIFICATION_FORMAT_INSTRUCTIONS = render_format_instructions(ClarificationOutput)
+
+# Initialize LLM. LLM_BACKEND=fake answers offline (see fake_services); LLM_RECORD_PATH
+# appends the real model's responses to a JSONL file the fake can replay
+if os.getenv("LLM_BACKEND", "anthropic").lower() == "fake":
+    llm = FakeChatAnthropic.from_env()
+else:
+    llm = ChatAnthropic(
+        model_name=os.getenv("ANTHROPIC_MODEL", "claude-3-haiku-20240307"),
+        temperature=0.3,
+        api_key=os.getenv("ANTHROPIC_API_KEY"),
+        max_tokens=4092,
+        timeout=10.0,  # Add timeout
+        max_retries=0,  # Retried in call_llm, where each attempt is counted and traced
+        callbacks=[ResponseRecorder(os.environ["LLM_RECORD_PATH"])] if os.getenv("LLM_RECORD_PATH") else None
+    )
+
+# Retries after a rate-limit, overload or connection error
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 1))
+
+def is_retryable_llm_error(error: Exception) -> bool:
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+# Token bucket plus concurrency cap shared by every LLM call in this process
+llm_admission = LLMAdmission.from_env()
+
+# Calls to the LLM fail fast while the provider keeps failing
+llm_breaker = CircuitBreaker.from_env("LLM")
+
+# Overall budget for one chat turn, and the least time left worth starting an LLM call with
+CHAT_DEADLINE_SECONDS = float(os.environ.get("CHAT_DEADLINE_SECONDS", 20.0))
+MIN_LLM_SECONDS = float(os.environ.get("CHAT_MIN_LLM_SECONDS", 2.0))
+SUPERVISOR_MIN_SECONDS = float(os.environ.get("CHAT_SUPERVISOR_MIN_SECONDS", 4.0))
+
+# Turns answered without one of their LLM calls, by the node that degraded
+degraded_turns = Counter()
+
+DEGRADED_MESSAGE = ("I'm sorry, I couldn't finish answering in time. "
+                    "Please try again in a moment or rephrase your question.")
+CATALOG_UNAVAILABLE_MESSAGE = ("I'm sorry, I can't search the course catalog right now, so I can't look up "
+                               "courses for this question. Please try again in a moment.")
+
+class DeadlineExceeded(Exception):
+    """Too little of the turn's deadline is left to start or finish an LLM call"""
+
+def remaining_budget(state) -> float:
+    """Seconds left before the turn's deadline (infinite when the state has none)"""
+    deadline = state.get("deadline")
+    return float("inf") if deadline is None else deadline - time.monotonic()
+
+async def call_llm(prompt, priority=INTERACTIVE, deadline=None, min_seconds=0.0):
+    """Invoke the LLM once admitted; raises AdmissionRejected when over capacity.
+    
+    Chat turn nodes use the default interactive priority; background work passes
+    BACKGROUND so it yields to queued chat turns. With a `deadline` (time.monotonic()
+    value), the call is not started with less than `min_seconds` left and is cut off
+    at the deadline, both raising DeadlineExceeded. CircuitOpen is raised without a
+    call while the LLM breaker is open.
+    """
+    # Refuse before queueing for admission when the breaker is already open
+    if llm_breaker.enabled and llm_breaker.is_open():
+        llm_breaker.before_call()
+    
+    async def admitted_call():
+        queued_at = time.perf_counter()
+        async with llm_admission.slot(priority):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                for attempt in range(LLM_MAX_RETRIES + 1):
+                    try:
+                        async with llm_breaker:
+                            result = await llm.ainvoke(prompt)
+                        break
+                    except Exception as e:
+                        if attempt >= LLM_MAX_RETRIES or not is_retryable_llm_error(e):
+                            raise
+                        await asyncio.sleep(0.25 * 2 ** attempt)
+                outcome = "ok"
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                LLM_LATENCY.observe(time.perf_counter() - started, tracing.current_node() or priority, outcome)
+        if priority == INTERACTIVE:
+            tracing.record_llm_call(result, getattr(llm, "model", None), time.perf_counter() - started,
+                                    admission_wait=started - queued_at, retries=attempt)
+        return result
+    
+    if deadline is None:
+        return await admitted_call()
+    budget = deadline - time.monotonic()
+    if budget <= max(min_seconds, 0.0):
+        raise DeadlineExceeded(f"{max(budget, 0.0):.1f}s left of the turn deadline")
+    try:
+        return await asyncio.wait_for(admitted_call(), timeout=budget)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("turn deadline reached during the LLM call")
+
+# Local embedding router that answers confident classifications without the decision LLM
+intent_router = IntentRouter.from_env(
+    seed_exemplars=DecisionOutput.model_config["json_schema_extra"]["examples"]
 )
 
+# Parsed decision outputs keyed by normalised query text
+decision_cache = DecisionCache.from_env()
+
+# Recommendation responses keyed by career goal embedding, scoped by student eligibility and
+# invalidated when course_details changes
+recommendation_cache = SemanticCache.from_env("RECOMMENDATION_CACHE", version_source=aget_catalog_version)
+
+# Templated final responses that skip the supervisor LLM call when no rephrasing is needed
+supervisor_bypass = SupervisorBypass.from_env()
+
 # Define the state for the graph
 class AgentState(TypedDict):
     # User and session information
@@ -358,10 +482,13 @@ class AgentState(TypedDict):
     # Conversation state
     query: str
     chat_history: List[Dict[str, str]]
+    history_context: str
     
     # Decision making
     decision: Optional[DecisionOutput]
     action: Optional[str]
+    speculative_retrieval: Optional[SpeculativeRetrieval]
+    query_embedding: Optional[List[float]]  # embedding of the raw query, when the router computed one
     
     # Agent outputs
     raw_agent_response: Optional[str]
@@ -369,30 +496,32 @@ class AgentState(TypedDict):
     
     # Final outputs
     final_response: Optional[str]
+    supervisor_bypassed: bool
     chat_title: Optional[str]
     
+    # Deadline budget (time.monotonic() value) and graceful degradation
+    deadline: Optional[float]
+    degraded: Optional[str]
+    retrieved_courses: Optional[List[Dict]]
+    
     # Database session
     db_session: any
     
     # Control flow
     next: str
 
-# Database helper functions (placeholders)
+# Chat messages and sessions are written behind the response by a batching queue
+chat_write_queue = ChatWriteQueue.from_env()
+
+# Database helper functions
 def save_chat_message(user_id, session_id, message_type, content):
-    """Save chat message to database"""
-    print(f"Saving {message_type} message for user {user_id} in session {session_id}")
+    """Queue a chat message for the next batched insert"""
+    chat_write_queue.add_message(user_id, session_id, message_type, content)
     return True
 
 def save_chat_session(session_id, user_id, title, metadata=None):
-    """Save chat session metadata to database"""
-    session_data = {
-        "session_id": session_id,
-        "user_id": user_id,
-        "title": title,
-        "created_at": datetime.now().isoformat(),
-        "metadata": metadata or {}
-    }
-    print(f"Saving session metadata: {json.dumps(session_data, indent=2)}")
+    """Queue a chat session upsert (metadata is kept in memory only; chat_sessions has no column for it)"""
+    chat_write_queue.save_session(session_id, user_id, title)
     return True
 
 def get_user_sessions(user_id):
@@ -400,153 +529,384 @@ def get_user_sessions(user_id):
     return []
 
 # Agent functions for LangGraph
-def decision_agent(state: AgentState) -> Dict:
-    """Decision agent that determines the intent of the query"""
-    decision_prompt = PromptTemplate(
-        template=DECISION_PROMPT,
-        input_variables=["query"],
-        partial_variables={"format_instructions": decision_parser.get_format_instructions()}
-    )
+async def cached_decision(query: str) -> Optional[DecisionOutput]:
+    """Return a previously classified decision for an equivalent query, if any"""
+    cached = await decision_cache.get(query)
+    if not cached:
+        return None
     
-    result = llm.invoke(decision_prompt.format(query=state["query"]))
+    decision = DecisionOutput(**cached)
+    decision.original_query = query
+    tracing.note("decision_source", "cache")
+    return decision
+
+async def embed_query(query: str, speculation: Optional[SpeculativeRetrieval] = None) -> Optional[List[float]]:
+    """Embedding of the raw query, shared with the speculative search when one is running"""
+    try:
+        if speculation:
+            return await speculation.query_embedding()
+        return (await aembed_texts([query]))[0]
+    except Exception as e:
+        print(f"Query embedding failed: {e}")
+        return None
+
+async def route_decision(query: str, query_embedding: Optional[List[float]] = None) -> Optional[DecisionOutput]:
+    """Classify the query with the intent router, or return None to defer to the LLM"""
+    routed = await intent_router.aclassify(query, query_embedding)
+    if not routed:
+        return None
+    
+    action, confidence, exemplar = routed
+    tracing.note("decision_source", "router")
+    # The router only labels the query; entities come from common phrasings, and an
+    # empty slot makes the agents search with the raw query
+    return DecisionOutput(
+        action=action,
+        career_goal=extract_career_goal(query) if action == "recommendation" else [],
+        course_name=extract_course_reference(query) if action == "inquiry" else [],
+        course_work=[],
+        original_query=query,
+        reasoning=f"Routed locally: {confidence:.2f} similarity to exemplar '{exemplar}'"
+    )
+
+async def llm_decision(query: str, deadline: Optional[float] = None) -> Optional[DecisionOutput]:
+    """Classify the query with the decision LLM, or return None if its output cannot be parsed"""
+    runtime = get_agent_runtime()
+    result = await call_llm(runtime.prompts["decision"].format(query=query), deadline=deadline,
+                            min_seconds=MIN_LLM_SECONDS)
     
     try:
-        decision = decision_parser.parse(result.content)
-        return {
-            "decision": decision,
-            "action": decision.action,
-            "next": decision.action  # This determines the next node to visit
-        }
+        decision = runtime.parsers["decision"].parse(result.content)
     except Exception as e:
         print(f"Error in decision agent: {e}")
+        return None
+    
+    tracing.note("decision_source", "llm")
+    decision_cache.put(query, decision.model_dump())
+    return decision
+
+async def decision_agent(state: AgentState) -> Dict:
+    """Decision agent that determines the intent of the query"""
+    # Optionally start retrieval on the raw query while the query is being classified
+    speculation = None
+    if SPECULATIVE_RETRIEVAL_ENABLED:
+        speculation = SpeculativeRetrieval(state["user_id"], state["query"])
+    
+    degraded = None
+    query_embedding = None
+    try:
+        try:
+            decision = await cached_decision(state["query"])
+            if not decision and intent_router.enabled:
+                query_embedding = await embed_query(state["query"], speculation)
+                decision = await route_decision(state["query"], query_embedding)
+            if not decision:
+                decision = await llm_decision(state["query"], state.get("deadline"))
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            # Without a classification, answer with catalog search results for the raw query
+            print(f"Decision agent degraded to retrieval-only results: {e}")
+            degraded_turns["decision_agent"] += 1
+            tracing.note("degraded", type(e).__name__)
+            degraded = "retrieval_only"
+            decision = DecisionOutput(
+                action="recommendation",
+                career_goal=extract_career_goal(state["query"]),
+                course_name=[],
+                course_work=[],
+                original_query=state["query"],
+                reasoning=f"Decision LLM unavailable ({type(e).__name__}); searching the catalog directly"
+            )
+    except BaseException:
+        if speculation:
+            speculation.discard()
+        raise
+    
+    if speculation and (not decision or decision.action != "recommendation"):
+        speculation.discard()
+        speculation = None
+    
+    if not decision:
         return {
             "action": "clarification_needed",
             "next": "clarification_needed"
         }
+    
+    return {
+        "decision": decision,
+        "action": decision.action,
+        "next": decision.action,  # This determines the next node to visit
+        "speculative_retrieval": speculation,
+        "query_embedding": query_embedding,
+        "degraded": degraded
+    }
+
+def retrieval_only(node: str, courses, reason: Exception) -> Dict:
+    """Specialist result carrying the retrieved courses instead of an LLM answer"""
+    print(f"{node} degraded to retrieval-only results: {reason}")
+    degraded_turns[node] += 1
+    tracing.note("degraded", "retrieval_only")
+    return {
+        "raw_agent_response": None,
+        "retrieved_courses": courses,
+        "degraded": "retrieval_only",
+        "next": "supervisor_agent"
+    }
+
+def retrieval_failed(node: str, reason: Exception) -> Dict:
+    """Specialist result when the catalog search itself failed (embedding service down or its breaker open)"""
+    print(f"{node} degraded, catalog search failed: {reason}")
+    degraded_turns[node] += 1
+    tracing.note("degraded", "no_retrieval")
+    return {
+        "raw_agent_response": None,
+        "retrieved_courses": None,
+        "degraded": "no_retrieval",
+        "next": "supervisor_agent"
+    }
 
-def recommendation_agent(state: AgentState) -> Dict:
+async def recommendation_agent(state: AgentState) -> Dict:
     """Recommendation agent for course recommendations"""
     decision = state["decision"]
-    courses = get_course_recommendations(
-        state["user_id"],
-        decision.career_goal,
-        state["db_session"]
-    )
+    speculation = state.get("speculative_retrieval")
     
-    recommendation_prompt = PromptTemplate(
-        template=RECOMMENDATION_PROMPT,
-        input_variables=["career_goal", "courses"],
-        partial_variables={"format_instructions": recommendation_parser.get_format_instructions()}
-    )
+    # Without a stated goal the raw query is the search key, and its embedding may already exist
+    goal_text = ' '.join(decision.career_goal) if decision.career_goal else state["query"]
+    goal_embedding = state.get("query_embedding") if goal_text == state["query"] else None
+    
+    # Serve a cached response for a similar career goal and identical eligibility
+    eligibility = None
+    if recommendation_cache.enabled:
+        try:
+            if goal_embedding is None:
+                goal_embedding = (await aembed_texts([goal_text]))[0]
+            eligibility = await aget_eligibility_fingerprint(state["user_id"])
+            cached_response = await recommendation_cache.lookup(eligibility, goal_embedding)
+            if cached_response:
+                tracing.note("cache_hit")
+                if speculation:
+                    speculation.discard("cache_hit")
+                return {
+                    "raw_agent_response": cached_response,
+                    "next": "supervisor_agent"
+                }
+        except Exception as e:
+            print(f"Recommendation cache lookup failed: {e}")
+            eligibility = None
     
-    result = llm.invoke(
-        recommendation_prompt.format(
-            career_goal=decision.career_goal,
-            courses=json.dumps(courses)
+    # Reuse the speculative retrieval when the decided goal matches the raw query
+    courses = None
+    if speculation:
+        courses = await speculation.resolve(goal_text, goal_embedding=goal_embedding)
+        tracing.note("speculative_retrieval_reused", courses is not None)
+    if courses is None:
+        try:
+            if goal_embedding is not None:
+                courses = await asearch_courses(state["user_id"], goal_embedding)
+            else:
+                courses = await aget_course_recommendations(
+                    state["user_id"],
+                    goal_text
+                )
+        except Exception as e:
+            return retrieval_failed("recommendation_agent", e)
+    
+    if state.get("degraded"):
+        return retrieval_only("recommendation_agent", courses, "decision was degraded")
+    try:
+        result = await call_llm(
+            get_agent_runtime().prompts["recommendation"].format(
+                career_goal=decision.career_goal or f'not stated; the student asked: "{state["query"]}"',
+                courses=serialize_recommendation_candidates(courses)
+            ),
+            deadline=state.get("deadline"),
+            min_seconds=MIN_LLM_SECONDS
         )
-    )
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        return retrieval_only("recommendation_agent", courses, e)
+    
+    # Only cache well-formed recommendations built from a non-empty candidate set
+    if eligibility and courses and clean_and_parse_json(result.content):
+        recommendation_cache.store(eligibility, goal_embedding, result.content)
     
     return {
         "raw_agent_response": result.content,
+        "retrieved_courses": courses,
         "next": "supervisor_agent"  # Updated to match new node name
     }
 
-def inquiry_agent(state: AgentState) -> Dict:
+async def inquiry_agent(state: AgentState) -> Dict:
     """Inquiry agent for course information"""
     decision = state["decision"]
-    course_details = get_course_recommendations(
-        state["user_id"],
-        decision.course_name,
-        state["db_session"]
-    )
-    
-    inquiry_prompt = PromptTemplate(
-        template=INQUIRY_PROMPT,
-        input_variables=["course_name", "course_details"],
-        partial_variables={"format_instructions": inquiry_parser.get_format_instructions()}
-    )
+    course_name = decision.course_name or state["query"]
+    try:
+        if not decision.course_name and state.get("query_embedding") is not None:
+            course_details = await asearch_courses(state["user_id"], state["query_embedding"])
+        else:
+            course_details = await aget_course_recommendations(
+                state["user_id"],
+                course_name
+            )
+    except Exception as e:
+        return retrieval_failed("inquiry_agent", e)
     
-    result = llm.invoke(
-        inquiry_prompt.format(
-            course_name=decision.course_name,
-            course_details=json.dumps(course_details)
+    try:
+        result = await call_llm(
+            get_agent_runtime().prompts["inquiry"].format(
+                course_name=course_name,
+                course_details=serialize_inquiry_candidates(course_details)
+            ),
+            deadline=state.get("deadline"),
+            min_seconds=MIN_LLM_SECONDS
         )
-    )
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        return retrieval_only("inquiry_agent", course_details, e)
     
     return {
         "raw_agent_response": result.content,
+        "retrieved_courses": course_details,
         "next": "supervisor_agent"
     }
 
-def clarification_agent(state: AgentState) -> Dict:
+async def clarification_agent(state: AgentState) -> Dict:
     """Clarification agent for unclear queries"""
-    clarification_prompt = PromptTemplate(
-        template=CLARIFICATION_PROMPT,
-        input_variables=["query"],
-        partial_variables={"format_instructions": clarification_parser.get_format_instructions()}
-    )
-    
-    result = llm.invoke(
-        clarification_prompt.format(query=state["query"])
-    )
+    try:
+        result = await call_llm(
+            get_agent_runtime().prompts["clarification"].format(query=state["query"]),
+            deadline=state.get("deadline"),
+            min_seconds=MIN_LLM_SECONDS
+        )
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        # Fall back to a generic clarifying question
+        print(f"Clarification agent degraded to a generic question: {e}")
+        degraded_turns["clarification_agent"] += 1
+        tracing.note("degraded", "generic_clarification")
+        return {
+            "raw_agent_response": json.dumps(ClarificationOutput.model_config["json_schema_extra"]["examples"][0]),
+            "degraded": "generic_clarification",
+            "next": "supervisor_agent"
+        }
     
     return {
         "raw_agent_response": result.content,
         "next": "supervisor_agent"
     }
 
-def supervisor_agent(state: AgentState) -> Dict:
+def validated_agent_output(action: Optional[str], parsed_response: Optional[Dict]):
+    """Validate parsed specialist JSON against the output model for the action, or None"""
+    model = {
+        "recommendation": RecommendationOutput,
+        "inquiry": GeneralInquiryOutput,
+        "clarification_needed": ClarificationOutput
+    }.get(action)
+    if not model or not isinstance(parsed_response, dict):
+        return None
+    try:
+        return model.model_validate(parsed_response)
+    except ValidationError:
+        return None
+
+async def supervisor_agent(state: AgentState) -> Dict:
     """Supervisor agent that generates the final response"""
-    chat_history_str = "\n".join([
-        f"{'Human' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}"
-        for msg in state.get("chat_history", [])
-    ])
-    
-    supervisor_prompt = PromptTemplate(
-        template=SUPERVISOR_PROMPT,
-        input_variables=["chat_history", "query", "agent_response"]
-    )
+    # Token-budgeted history (rolling summary plus recent turns) rendered by the session
+    chat_history_str = state.get("history_context", "")
     
-    result = llm.invoke(
-        supervisor_prompt.format(
-            chat_history=chat_history_str,
-            query=state["query"],
-            agent_response=state["raw_agent_response"]
-        )
-    )
+    # The catalog search failed, so there is nothing to answer from
+    if state.get("degraded") == "no_retrieval":
+        tracing.note("bypassed", "no_retrieval")
+        return {
+            "final_response": CATALOG_UNAVAILABLE_MESSAGE,
+            "parsed_agent_response": None,
+            "supervisor_bypassed": True,
+            "next": "save_conversation_agent"
+        }
+    
+    # The specialist had no LLM answer: list the courses it retrieved
+    if state.get("raw_agent_response") is None and state.get("retrieved_courses") is not None:
+        tracing.note("bypassed", "retrieval_only")
+        return {
+            "final_response": render_retrieval_only(state["retrieved_courses"]),
+            "parsed_agent_response": None,
+            "supervisor_bypassed": True,
+            "next": "save_conversation_agent"
+        }
     
     # Parse the agent response
     parsed_response = None
     if state["raw_agent_response"]:
         parsed_response = clean_and_parse_json(state["raw_agent_response"])
+    validated = validated_agent_output(state.get("action"), parsed_response)
+    
+    # Well-formed recommendation/clarification output is rendered from a template
+    # unless the query needs to be stitched into the earlier conversation
+    rendered = supervisor_bypass.render(state.get("action"), validated, state["query"], chat_history_str)
+    if rendered is not None:
+        tracing.note("bypassed", "template")
+        return {
+            "final_response": rendered,
+            "parsed_agent_response": parsed_response,
+            "supervisor_bypassed": True,
+            "next": "save_conversation_agent"
+        }
+    
+    start = time.perf_counter()
+    try:
+        result = await call_llm(
+            get_agent_runtime().prompts["supervisor"].format(
+                chat_history=chat_history_str,
+                query=state["query"],
+                agent_response=state["raw_agent_response"]
+            ),
+            deadline=state.get("deadline"),
+            min_seconds=SUPERVISOR_MIN_SECONDS
+        )
+    except Exception as e:
+        # Out of time or LLM capacity: answer with the specialist's structured output as is,
+        # or with the retrieved courses when that output is unusable
+        print(f"Supervisor agent degraded to the specialist output: {e}")
+        degraded_turns["supervisor_agent"] += 1
+        tracing.note("degraded", "specialist_output")
+        final_response = render_structured(state.get("action"), validated)
+        if final_response is None and state.get("retrieved_courses"):
+            final_response = render_retrieval_only(state["retrieved_courses"])
+        return {
+            "final_response": final_response or DEGRADED_MESSAGE,
+            "parsed_agent_response": parsed_response,
+            "supervisor_bypassed": True,
+            "degraded": "specialist_output",
+            "next": "save_conversation_agent"
+        }
+    supervisor_bypass.record_llm_latency(time.perf_counter() - start)
     
     return {
         "final_response": result.content,
         "parsed_agent_response": parsed_response,
-        "next": "title_generator"
+        "supervisor_bypassed": False,
+        "next": "save_conversation_agent"
     }
 
-def title_generator(state: AgentState) -> Dict:
-    """Generate title for the chat session"""
+async def title_generator(state: AgentState) -> Dict:
+    """Provisional title for the chat session.
+    
+    Extracted locally from the first query so the first response never waits on a
+    title LLM call; CourseRecommenderSystem refines it in the background. Runs in
+    parallel with the decision/specialist/supervisor branch, so it must not write the
+    shared "next" routing key.
+    """
     # Only generate title if this is the first message
     if not state.get("chat_history") or len(state["chat_history"]) == 0:
-        title_prompt = PromptTemplate(
-            template=TITLE_PROMPT,
-            input_variables=["query"]
-        )
-        
-        result = llm.invoke(
-            title_prompt.format(query=state["query"])
-        )
-        
-        return {
-            "chat_title": result.content.strip(),
-            "next": "save_conversation_agent"  # Updated to match new node name
-        }
+        return {"chat_title": extractive_title(state["query"])}
     
-    return {"next": "save_conversation_agent"}  # Updated to match new node name
+    return {}
 
-def save_conversation(state: AgentState) -> Dict:
+async def save_conversation(state: AgentState) -> Dict:
     """Save the conversation to database"""
     # Your save logic here
     save_chat_message(state["user_id"], state["session_id"], "user", state["query"])
@@ -561,21 +921,26 @@ def save_conversation(state: AgentState) -> Dict:
     
     return {"next": END}
 
+# Nodes whose LLM output is forwarded token by token by CourseRecommenderSystem.stream_query
+STREAMED_NODES = {"supervisor_agent"}
+
 # Create the graph
 def create_course_recommendation_graph():
     workflow = StateGraph(AgentState)
     
-    # Add nodes
-    workflow.add_node("decision_agent", decision_agent)
-    workflow.add_node("recommendation_agent", recommendation_agent)
-    workflow.add_node("inquiry_agent", inquiry_agent)
-    workflow.add_node("clarification_agent", clarification_agent)
-    workflow.add_node("supervisor_agent", supervisor_agent)
-    workflow.add_node("title_generator", title_generator)
-    workflow.add_node("save_conversation_agent", save_conversation)
+    # Add nodes, each recorded as a span in the turn's trace
+    workflow.add_node("decision_agent", tracing.traced_node("decision_agent", decision_agent))
+    workflow.add_node("recommendation_agent", tracing.traced_node("recommendation_agent", recommendation_agent))
+    workflow.add_node("inquiry_agent", tracing.traced_node("inquiry_agent", inquiry_agent))
+    workflow.add_node("clarification_agent", tracing.traced_node("clarification_agent", clarification_agent))
+    workflow.add_node("supervisor_agent", tracing.traced_node("supervisor_agent", supervisor_agent))
+    workflow.add_node("title_generator", tracing.traced_node("title_generator", title_generator))
+    workflow.add_node("save_conversation_agent", tracing.traced_node("save_conversation_agent", save_conversation))
     
-    # Set entry point
-    workflow.set_entry_point("decision_agent")
+    # Fan out from the entry point: the title only depends on the query, so it is
+    # generated alongside the decision -> specialist -> supervisor branch
+    workflow.add_edge(START, "decision_agent")
+    workflow.add_edge(START, "title_generator")
     
     # Add conditional edges based on decision
     workflow.add_conditional_edges(
@@ -593,14 +958,87 @@ def create_course_recommendation_graph():
     workflow.add_edge("inquiry_agent", "supervisor_agent")
     workflow.add_edge("clarification_agent", "supervisor_agent")
     
-    # Supervisor goes to title generation
-    workflow.add_edge("supervisor_agent", "title_generator")
-    
-    # Title generation goes to save
-    workflow.add_edge("title_generator", "save_conversation_agent")
+    # Save waits for both the supervisor response and the title
+    workflow.add_edge(["supervisor_agent", "title_generator"], "save_conversation_agent")
     
     return workflow.compile()
 
+class AgentRuntime:
+    """
+    Process-wide objects shared by every chat session: the compiled graph, the prompt
+    templates with their format instructions already filled in, and the output parsers.
+    Built once at startup (see app.py lifespan) instead of per session or per call.
+    """
+    def __init__(self):
+        self.parsers = {
+            "decision": decision_parser,
+            "recommendation": recommendation_parser,
+            "inquiry": inquiry_parser,
+            "clarification": clarification_parser
+        }
+        self.prompts = {
+            "decision": PromptTemplate(
+                template=DECISION_PROMPT,
+                input_variables=["query"],
+                partial_variables={"format_instructions": DECISION_FORMAT_INSTRUCTIONS}
+            ),
+            "recommendation": PromptTemplate(
+                template=RECOMMENDATION_PROMPT,
+                input_variables=["career_goal", "courses"],
+                partial_variables={"format_instructions": RECOMMENDATION_FORMAT_INSTRUCTIONS}
+            ),
+            "inquiry": PromptTemplate(
+                template=INQUIRY_PROMPT,
+                input_variables=["course_name", "course_details"],
+                partial_variables={"format_instructions": INQUIRY_FORMAT_INSTRUCTIONS}
+            ),
+            "clarification": PromptTemplate(
+                template=CLARIFICATION_PROMPT,
+                input_variables=["query"],
+                partial_variables={"format_instructions": CLARIFICATION_FORMAT_INSTRUCTIONS}
+            ),
+            "supervisor": PromptTemplate(
+                template=SUPERVISOR_PROMPT,
+                input_variables=["chat_history", "query", "agent_response"]
+            )
+        }
+        self.graph = create_course_recommendation_graph()
+
+_agent_runtime = None
+
+def init_agent_runtime():
+    """Build the shared runtime (called from the FastAPI lifespan)"""
+    global _agent_runtime
+    _agent_runtime = AgentRuntime()
+    return _agent_runtime
+
+def get_agent_runtime():
+    """The shared runtime, built on first use when the app lifespan has not done it"""
+    if _agent_runtime is None:
+        return init_agent_runtime()
+    return _agent_runtime
+
+async def summarise_history(prompt):
+    """Summarizer used by ChatHistoryManager to fold old turns into the running summary"""
+    result = await call_llm(prompt, priority=BACKGROUND)
+    return result.content
+
+async def generate_title(prompt):
+    """Title writer used by TitleRefiner to replace the provisional title in the background"""
+    result = await call_llm(prompt, priority=BACKGROUND)
+    return result.content
+
+# One turn at a time per session; optionally cancel a turn superseded by a newer message
+session_turns = SessionTurns.from_env()
+
+# Recent per-node traces of chat turns, for /debug/traces
+trace_buffer = tracing.TraceBuffer.from_env()
+
+SUPERSEDED_MESSAGE = "This message was superseded by a newer one in the same conversation."
+
+# Background LLM refinement of the provisional extractive titles
+title_refiner = TitleRefiner.from_env(generate=generate_title, writer=chat_write_queue.set_title)
+
 # Generate a random session ID
 def generate_session_id(user_id):
     random_str = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
@@ -608,44 +1046,84 @@ def generate_session_id(user_id):
 
 # Updated CourseRecommenderSystem class
 class CourseRecommenderSystem:
-    def __init__(self, user_id, db_session):
+    # Per-session state only; the graph, prompts and parsers live in the shared AgentRuntime
+    __slots__ = ("db", "user_id", "session_id", "session_created_at", "history", "last_decision",
+                 "chat_title", "all_sessions", "store")
+    
+    # Fixed per-session footprint, measured with tracemalloc (benchmarks/bench_session_footprint.py)
+    BASE_BYTES = 1024
+    # Per-message overhead of the history dicts on top of the text itself
+    MESSAGE_BYTES = 250
+    
+    def __init__(self, user_id, db_session, session_id=None, store=None):
         self.db = db_session
         self.user_id = user_id
-        self.session_id = generate_session_id(user_id)
+        self.session_id = session_id or generate_session_id(user_id)
         self.session_created_at = datetime.now().isoformat()
-        self.chat_history = []
-        self.graph = create_course_recommendation_graph()
+        self.history = ChatHistoryManager.from_env(summarizer=summarise_history)
         self.last_decision = None
         self.chat_title = None
         self.all_sessions = {}  # In-memory storage for sessions
+        self.store = store  # Optional SessionStore that receives a snapshot after every turn
+    
+    def to_state(self):
+        """JSON-serialisable snapshot of the conversation for a SessionStore"""
+        return {
+            "user_id": self.user_id,
+            "session_id": self.session_id,
+            "session_created_at": self.session_created_at,
+            "chat_title": self.chat_title,
+            "history": self.history.to_dict(),
+            "session_metadata": self.all_sessions.get(self.session_id)
+        }
+    
+    @classmethod
+    def from_state(cls, state, db_session=None, store=None):
+        """Rebuild a session from a to_state snapshot"""
+        recommender = cls(state["user_id"], db_session, session_id=state["session_id"], store=store)
+        recommender.session_created_at = state.get("session_created_at", recommender.session_created_at)
+        recommender.chat_title = state.get("chat_title")
+        recommender.history.restore(state.get("history", {}))
+        if state.get("session_metadata"):
+            recommender.all_sessions[recommender.session_id] = state["session_metadata"]
+        return recommender
+    
+    def _persist(self):
+        """Snapshot the session to the shared store in the background"""
+        if self.store:
+            self.store.save_in_background(self.session_id, self.user_id, self.history.turn_count, self.to_state())
+    
+    @property
+    def graph(self):
+        """The compiled graph shared by all sessions"""
+        return get_agent_runtime().graph
+    
+    @property
+    def chat_history(self):
+        """Recent messages kept verbatim (older turns live in the history summary)"""
+        return self.history.messages
+    
+    def estimated_bytes(self):
+        """Rough in-memory size of this session, used by SessionManager's memory ceiling"""
+        messages = self.history.messages + self.history.pending
+        text = sum(len(message["content"]) for message in messages) + len(self.history.summary)
+        return self.BASE_BYTES + text + self.MESSAGE_BYTES * len(messages) + 512 * len(self.all_sessions)
     
     def generate_chat_title(self, first_query):
-        """Generate a descriptive title for the chat session based on the first query."""
-        try:
-            title_prompt = PromptTemplate(
-                template=TITLE_PROMPT,
-                input_variables=["query"]
-            )
-            
-            result = llm.invoke(title_prompt.format(query=first_query))
-            title = result.content.strip()
-            
-            if not title:
-                words = first_query.split()
-                title = " ".join(words[:4]) + ("..." if len(words) > 4 else "")
-            
-            return title
-        except Exception as e:
-            print(f"Error generating title: {e}")
-            return f"Course Conversation {datetime.now().strftime('%Y-%m-%d')}"
+        """Provisional title for the chat session based on the first query (no LLM call)."""
+        return extractive_title(first_query)
+    
+    def _apply_refined_title(self, title):
+        """Adopt the background-refined title for this session"""
+        self.chat_title = title
+        if self.session_id in self.all_sessions:
+            self.all_sessions[self.session_id]["title"] = title
+        self._persist()
     
     def save_chat_session(self, title=None):
         """Save the current chat session with metadata including title."""
-        chat_history = self.chat_history if self.chat_history else []
-        first_query = ""
-        
-        if chat_history and len(chat_history) > 0:
-            first_query = chat_history[0].get("content", "")
+        # The first user query is kept by the history even after it has been summarised
+        first_query = self.history.first_query
         
         if not title and first_query:
             title = self.generate_chat_title(first_query)
@@ -692,78 +1170,339 @@ class CourseRecommenderSystem:
         
         return list(all_sessions.values())
     
-    def process_query(self, query):
-        """Process a user query through the graph"""
-        # Check if this is the first query (no chat history)
-        is_first_query = len(self.chat_history) == 0
-        
-        # Prepare initial state
-        initial_state = {
+    def _initial_state(self, query):
+        """Build the graph input for a user query"""
+        return {
             "user_id": self.user_id,
             "session_id": self.session_id,
             "query": query,
-            "chat_history": self.chat_history,
+            "chat_history": list(self.history.messages),
+            "history_context": self.history.render(),
             "db_session": self.db,
+            "deadline": time.monotonic() + CHAT_DEADLINE_SECONDS,
+            "degraded": None,
+            "retrieved_courses": None,
             "next": "decision"
         }
+    
+    def _finalize_turn(self, query, is_first_query, result):
+        """Record a completed graph run in the session and return the response tuple"""
+        # Update chat history (older turns are summarised in the background)
+        self.history.add_turn(query, result["final_response"])
+        
+        # If this is the first query, generate and save a title
+        if is_first_query and result.get("chat_title"):
+            self.chat_title = result["chat_title"]
+            self.save_chat_session(title=self.chat_title)
+            print(f"Generated chat title: {self.chat_title}")
+            title_refiner.schedule(self.session_id, query, on_title=self._apply_refined_title)
         
+        self._persist()
+        
+        return (
+            result["final_response"],
+            result.get("parsed_agent_response"),
+            result.get("chat_title", self.chat_title)
+        )
+    
+    def _error_turn(self, query, e):
+        """Record a failed graph run in the session and return the fallback message"""
+        print(f"Error processing query: {e}")
+        error_message = f"I'm sorry, I encountered an error while processing your request. Please try again with a clearer question about your course needs or career goals."
+        
+        # Still save the chat history even on error
+        self.history.add_turn(query, error_message)
+        self._persist()
+        
+        return error_message
+    
+    async def process_query(self, query):
+        """Process a user query through the graph (one turn at a time per session)"""
         try:
-            # Run the graph
-            result = self.graph.invoke(initial_state)
-            
-            # Update chat history
-            self.chat_history.append({"role": "user", "content": query})
-            self.chat_history.append({"role": "assistant", "content": result["final_response"]})
-            
-            # If this is the first query, generate and save a title
-            if is_first_query and result.get("chat_title"):
-                self.chat_title = result["chat_title"]
-                self.save_chat_session(title=self.chat_title)
-                print(f"Generated chat title: {self.chat_title}")
-            
-            return (
-                result["final_response"],
-                result.get("parsed_agent_response"),
-                result.get("chat_title", self.chat_title)
-            )
-            
-        except Exception as e:
-            print(f"Error processing query: {e}")
-            error_message = f"I'm sorry, I encountered an error while processing your request. Please try again with a clearer question about your course needs or career goals."
-            
-            # Still save the chat history even on error
-            self.chat_history.append({"role": "user", "content": query})
-            self.chat_history.append({"role": "assistant", "content": error_message})
-            
-            return error_message, None, self.chat_title
+            async with session_turns.turn(self.session_id):
+                # Check if this is the first query (no chat history)
+                is_first_query = self.history.turn_count == 0
+                
+                try:
+                    # Run the graph
+                    result = await self.graph.ainvoke(self._initial_state(query))
+                    return self._finalize_turn(query, is_first_query, result)
+                    
+                except AdmissionRejected:
+                    # Over LLM capacity: nothing is recorded and the caller answers 429
+                    raise
+                except Exception as e:
+                    return self._error_turn(query, e), None, self.chat_title
+        except asyncio.CancelledError:
+            if session_turns.was_superseded():
+                return SUPERSEDED_MESSAGE, None, self.chat_title
+            raise
+    
+    async def stream_query(self, query):
+        """
+        Process a user query through the graph, yielding progress events as they happen.
+        
+        Yields (event, data) tuples:
+            ("stage", {"node": ..., ...})  when a graph node finishes
+            ("token", {"text": ...})       for each chunk of supervisor_agent output
+            ("done", {"response": ..., "json_response": ..., "chat_title": ..., "session_id": ...})
+        
+        Turns of the same session are serialised; a turn superseded under the
+        latest-wins policy ends with a "done" event carrying "superseded": True.
+        AdmissionRejected propagates when LLM capacity is exhausted.
+        """
+        result = None
+        superseded = False
+        
+        try:
+            async with session_turns.turn(self.session_id):
+                is_first_query = self.history.turn_count == 0
+                
+                try:
+                    async for mode, chunk in self.graph.astream(
+                        self._initial_state(query),
+                        stream_mode=["updates", "messages", "values"]
+                    ):
+                        if mode == "messages":
+                            message, metadata = chunk
+                            if metadata.get("langgraph_node") in STREAMED_NODES and message.content:
+                                text = message.content if isinstance(message.content, str) else "".join(
+                                    part.get("text", "") for part in message.content if isinstance(part, dict)
+                                )
+                                if text:
+                                    yield "token", {"text": text}
+                        elif mode == "updates":
+                            for node, update in chunk.items():
+                                stage = {"node": node}
+                                if node == "decision_agent" and update:
+                                    stage["action"] = update.get("action")
+                                yield "stage", stage
+                                # A templated response produces no LLM tokens, so send it in one piece
+                                if node == "supervisor_agent" and update and update.get("supervisor_bypassed"):
+                                    yield "token", {"text": update["final_response"]}
+                        else:
+                            result = chunk
+                    
+                    response, agent_response, chat_title = self._finalize_turn(query, is_first_query, result)
+                
+                except AdmissionRejected:
+                    raise
+                except Exception as e:
+                    response, agent_response, chat_title = self._error_turn(query, e), None, self.chat_title
+        except asyncio.CancelledError:
+            if not session_turns.was_superseded():
+                raise
+            response, agent_response, chat_title = SUPERSEDED_MESSAGE, None, self.chat_title
+            superseded = True
+        
+        done = {
+            "response": response,
+            "json_response": agent_response,
+            "chat_title": chat_title,
+            "session_id": self.session_id
+        }
+        if superseded:
+            done["superseded"] = True
+        if result and result.get("degraded"):
+            done["degraded"] = result["degraded"]
+        yield "done", done
 
 # Session Manager for managing multiple sessions
 class SessionManager:
-    def __init__(self):
-        """Initialize the session manager."""
-        self.active_sessions = {}
+    """
+    Active chat sessions indexed by session id.
     
-    def get_or_create_session(self, user_id, db_session):
-        """Get an existing session or create a new one for a user."""
-        if user_id in self.active_sessions:
-            return self.active_sessions[user_id]
+    A user may hold several sessions at once (up to `max_sessions_per_user`). Sessions
+    idle for longer than `idle_ttl` seconds are dropped, and the least recently used
+    sessions are evicted whenever the count exceeds `max_sessions` or the estimated
+    memory exceeds `max_bytes`. Evicted conversations stay in the database; only the
+    in-memory state is released.
+    
+    With a `store`, every turn is snapshotted there and `aget_session_by_id` rehydrates
+    sessions this process has not seen, so follow-ups can land on any worker and
+    survive restarts. A session already in memory costs one version-only read per
+    turn; its full state is loaded only when another worker has advanced it, so a
+    turn never builds on (and then fails to save over) an older copy.
+    """
+    def __init__(self, max_sessions=5000, max_bytes=512 * 1024 * 1024, idle_ttl=1800.0, max_sessions_per_user=10,
+                 store=None):
+        """Initialize the session manager."""
+        self.store = store
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.max_sessions_per_user = max_sessions_per_user
+        
+        self.active_sessions = OrderedDict()  # session_id -> CourseRecommenderSystem, least recently used first
+        self.user_sessions = {}  # user_id -> OrderedDict of session_ids, oldest first
+        self._last_used = {}  # session_id -> time.monotonic() of last access
+        self._sizes = {}  # session_id -> estimated bytes at last access
+        self.total_bytes = 0
+        self._lock = threading.Lock()
         
-        recommender = CourseRecommenderSystem(user_id, db_session)
-        self.active_sessions[user_id] = recommender
+        self.created = 0
+        self.hits = 0
+        self.misses = 0
+        self.rehydrated = 0
+        self.store_reads = 0
+        self.version_probes = 0
+        self.stale_in_memory = 0
+        self.store_errors = 0
+        self.evictions = Counter()
+    
+    @classmethod
+    def from_env(cls):
+        """Build a session manager from SESSION_* environment variables"""
+        return cls(
+            max_sessions=int(os.environ.get("SESSION_MAX_ACTIVE", 5000)),
+            max_bytes=int(os.environ.get("SESSION_MAX_BYTES", 512 * 1024 * 1024)),
+            idle_ttl=float(os.environ.get("SESSION_IDLE_TTL", 1800)),
+            max_sessions_per_user=int(os.environ.get("SESSION_MAX_PER_USER", 10)),
+            store=SessionStore.from_env()
+        )
+    
+    def _touch(self, recommender):
+        """Mark a session as most recently used and refresh its size estimate"""
+        session_id = recommender.session_id
+        self.active_sessions[session_id] = recommender
+        self.active_sessions.move_to_end(session_id)
+        self.user_sessions.setdefault(recommender.user_id, OrderedDict())[session_id] = None
+        self.user_sessions[recommender.user_id].move_to_end(session_id)
+        self._last_used[session_id] = time.monotonic()
+        size = recommender.estimated_bytes()
+        self.total_bytes += size - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = size
+    
+    def _remove(self, session_id, reason):
+        recommender = self.active_sessions.pop(session_id)
+        user_sessions = self.user_sessions.get(recommender.user_id)
+        if user_sessions is not None:
+            user_sessions.pop(session_id, None)
+            if not user_sessions:
+                del self.user_sessions[recommender.user_id]
+        self._last_used.pop(session_id, None)
+        self.total_bytes -= self._sizes.pop(session_id, 0)
+        self.evictions[reason] += 1
+    
+    def _evict(self):
+        """Drop idle sessions, then least recently used ones until under the ceilings"""
+        now = time.monotonic()
+        while self.active_sessions:
+            session_id = next(iter(self.active_sessions))
+            if now - self._last_used[session_id] <= self.idle_ttl:
+                break
+            self._remove(session_id, "idle")
+        while len(self.active_sessions) > self.max_sessions:
+            self._remove(next(iter(self.active_sessions)), "count")
+        while self.total_bytes > self.max_bytes and len(self.active_sessions) > 1:
+            self._remove(next(iter(self.active_sessions)), "memory")
+    
+    def create_session(self, user_id, db_session):
+        """Start a new session for a user, evicting the user's oldest beyond the per-user limit."""
+        recommender = CourseRecommenderSystem(user_id, db_session, store=self.store)
+        with self._lock:
+            self._touch(recommender)
+            user_sessions = self.user_sessions[user_id]
+            while len(user_sessions) > self.max_sessions_per_user:
+                self._remove(next(iter(user_sessions)), "per_user")
+            self.created += 1
+            self._evict()
         return recommender
     
+    def get_or_create_session(self, user_id, db_session):
+        """Get the user's most recently used session or create a new one."""
+        with self._lock:
+            user_sessions = self.user_sessions.get(user_id)
+            if user_sessions:
+                recommender = self.active_sessions[next(reversed(user_sessions))]
+                self._touch(recommender)
+                self._evict()
+                if recommender.session_id in self.active_sessions:
+                    return recommender
+        return self.create_session(user_id, db_session)
+    
     def get_session_by_id(self, session_id):
         """Get a specific session by ID."""
-        for user_id, session in self.active_sessions.items():
-            if session.session_id == session_id:
-                return session
-        return None
+        with self._lock:
+            recommender = self.active_sessions.get(session_id)
+            if recommender is not None and time.monotonic() - self._last_used[session_id] > self.idle_ttl:
+                self._remove(session_id, "idle")
+                recommender = None
+            if recommender is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touch(recommender)
+            self._evict()
+            return recommender
+    
+    async def aget_session_by_id(self, session_id, db_session=None):
+        """
+        Get a session by ID, rehydrating it from the store on a miss, or on a hit when
+        another worker has stored a newer version than the one in memory.
+        """
+        recommender = self.get_session_by_id(session_id)
+        if not self.store:
+            return recommender
+        
+        try:
+            if recommender is not None:
+                # Version-only read: the in-memory copy is used unless it is behind
+                self.version_probes += 1
+                stored_version = await self.store.version(session_id)
+                if stored_version is None or stored_version <= recommender.history.turn_count:
+                    return recommender
+                self.stale_in_memory += 1
+            self.store_reads += 1
+            state = await self.store.load(session_id, newer_than=recommender.history.turn_count if recommender else -1)
+        except Exception as e:
+            print(f"Session store read failed for {session_id}: {e}")
+            self.store_errors += 1
+            return recommender
+        if not state:
+            return recommender
+        
+        rehydrated = CourseRecommenderSystem.from_state(state, db_session, store=self.store)
+        with self._lock:
+            self._touch(rehydrated)
+            self.rehydrated += 1
+            self._evict()
+        return rehydrated
     
     def list_user_sessions(self, user_id):
         """List all sessions for a user."""
-        if user_id in self.active_sessions:
-            return self.active_sessions[user_id].list_user_sessions(user_id)
-        return get_user_sessions(user_id)
+        with self._lock:
+            recommenders = [self.active_sessions[session_id] for session_id in self.user_sessions.get(user_id, ())]
+        sessions = {}
+        for recommender in recommenders:
+            for session in recommender.list_user_sessions(user_id):
+                sessions[session["session_id"]] = session
+        for session in get_user_sessions(user_id):
+            sessions.setdefault(session["session_id"], session)
+        return list(sessions.values())
+    
+    def stats(self):
+        with self._lock:
+            self._evict()
+            return {
+                "sessions": len(self.active_sessions),
+                "users": len(self.user_sessions),
+                "estimated_bytes": self.total_bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_seconds": self.idle_ttl,
+                "max_sessions_per_user": self.max_sessions_per_user,
+                "created": self.created,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rehydrated": self.rehydrated,
+                "store_reads": self.store_reads,
+                "version_probes": self.version_probes,
+                "stale_in_memory": self.stale_in_memory,
+                "store_errors": self.store_errors,
+                "evictions": dict(self.evictions),
+                "store": self.store.stats() if self.store else None
+            }
 
 # Example usage
 if __name__ == "__main__":
@@ -783,7 +1522,7 @@ if __name__ == "__main__":
     # Example 1: Career goal query
     query = "I want to become a data scientist. What courses should I take?"
     print(f"\nUser: {query}")
-    response, agent_response, title = course_rec_system.process_query(query)
+    response, agent_response, title = asyncio.run(course_rec_system.process_query(query))
     print(f"Response: {response[:200]}...")
     print(f"Chat Title: {title}")
     
@@ -793,7 +1532,7 @@ if __name__ == "__main__":
     
     query2 = "Can you tell me about the Machine Learning course?"
     print(f"\nUser 2: {query2}")
-    response2, agent_response2, title2 = course_rec_system2.process_query(query2)
+    response2, agent_response2, title2 = asyncio.run(course_rec_system2.process_query(query2))
     print(f"Response: {response2[:200]}...")
     print(f"Chat Title: {title2}")
     
@@ -803,14 +1542,14 @@ if __name__ == "__main__":
     
     query3 = "I'm feeling overwhelmed with all the options. Can you help me?"
     print(f"\nUser 3: {query3}")
-    response3, agent_response3, title3 = course_rec_system3.process_query(query3)
+    response3, agent_response3, title3 = asyncio.run(course_rec_system3.process_query(query3))
     print(f"Response: {response3[:200]}...")
     print(f"Chat Title: {title3}")
     
     # Example 4: Follow-up conversation
     print(f"\nUser: Following up on data science...")
     follow_up_query = "What about machine learning prerequisites?"
-    follow_up_response, follow_up_agent, _ = course_rec_system.process_query(follow_up_query)
+    follow_up_response, follow_up_agent, _ = asyncio.run(course_rec_system.process_query(follow_up_query))
     print(f"Follow-up Response: {follow_up_response[:200]}...")
     
     # List all sessions
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from postgresql_model import DecisionCacheEntry
+from util import AsyncSessionLocal
+
+
+def normalise_query(query: str) -> str:
+    """Case-fold, strip punctuation and collapse whitespace so trivially different queries share a key"""
+    text = re.sub(r"[^\w\s]", " ", query.casefold())
+    return " ".join(text.split())
+
+
+class DecisionCache:
+    """
+    LRU + TTL cache of parsed decision outputs keyed by normalised query text.
+
+    With `persist` enabled, misses fall through to the iu_catalog.decision_cache table
+    and new entries are written there in the background, so every worker shares them.
+    """
+    def __init__(self, max_entries: int = 2048, ttl: float = 86400.0, enabled: bool = True, persist: bool = False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.persist = persist
+
+        self._entries = OrderedDict()  # key -> (decision dict, created_at epoch seconds)
+        self._pending_writes = set()
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.persist_errors = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from DECISION_CACHE_* environment variables"""
+        return cls(
+            max_entries=int(os.environ.get("DECISION_CACHE_MAX_ENTRIES", 2048)),
+            ttl=float(os.environ.get("DECISION_CACHE_TTL", 86400)),
+            enabled=os.environ.get("DECISION_CACHE_ENABLED", "true").lower() == "true",
+            persist=os.environ.get("DECISION_CACHE_PERSIST", "false").lower() == "true"
+        )
+
+    def _set_local(self, key: str, decision: Dict, created_at: float):
+        self._entries[key] = (decision, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _load(self, key: str) -> Optional[Dict]:
+        """Read an unexpired entry from Postgres"""
+        try:
+            async with AsyncSessionLocal() as session:
+                row = (await session.execute(
+                    select(DecisionCacheEntry.decision, DecisionCacheEntry.created_at).where(
+                        DecisionCacheEntry.query_key == key,
+                        DecisionCacheEntry.created_at >= datetime.now() - timedelta(seconds=self.ttl)
+                    )
+                )).first()
+        except Exception as e:
+            print(f"Decision cache read failed: {e}")
+            self.persist_errors += 1
+            return None
+        if not row:
+            return None
+        self._set_local(key, row.decision, row.created_at.timestamp())
+        return row.decision
+
+    async def _save(self, key: str, decision: Dict):
+        """Upsert an entry into Postgres"""
+        try:
+            async with AsyncSessionLocal() as session:
+                statement = insert(DecisionCacheEntry).values(query_key=key, decision=decision)
+                await session.execute(statement.on_conflict_do_update(
+                    index_elements=[DecisionCacheEntry.query_key],
+                    set_={"decision": statement.excluded.decision, "created_at": datetime.now()}
+                ))
+                await session.commit()
+        except Exception as e:
+            print(f"Decision cache write failed: {e}")
+            self.persist_errors += 1
+
+    async def get(self, query: str) -> Optional[Dict]:
+        """Return the cached decision for a query, or None"""
+        if not self.enabled:
+            return None
+        key = normalise_query(query)
+        entry = self._entries.get(key)
+        if entry and time.time() - entry[1] <= self.ttl:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        if entry:
+            del self._entries[key]
+
+        if self.persist:
+            decision = await self._load(key)
+            if decision:
+                self.persistent_hits += 1
+                return decision
+
+        self.misses += 1
+        return None
+
+    def put(self, query: str, decision: Dict):
+        """Cache a decision; the Postgres write (if enabled) happens off the request path"""
+        if not self.enabled:
+            return
+        key = normalise_query(query)
+        self._set_local(key, decision, time.time())
+        if self.persist:
+            task = asyncio.create_task(self._save(key, decision))
+            self._pending_writes.add(task)
+            task.add_done_callback(self._pending_writes.discard)
+
+    def stats(self) -> Dict:
+        hits = self.hits + self.persistent_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "persist": self.persist,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "persist_errors": self.persist_errors
+        }
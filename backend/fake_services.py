@@ -0,0 +1,521 @@
+"""
+Offline stand-ins for the Anthropic LLM and the embedding API, for benchmarks and
+CI-like runs without network access.
+
+- FakeChatAnthropic replaces ChatAnthropic in the LangGraph module when
+  LLM_BACKEND=fake. It replays responses recorded from the real model
+  (LLM_RECORD_PATH, see ResponseRecorder) or synthesises schema-valid JSON
+  for each agent prompt, after a configurable latency.
+- The fake /embed server answers like vectorizer/ with deterministic 384-d
+  hashed bag-of-words vectors, so texts sharing words are similar. Point
+  EMBEDDING_API_URL at it:
+
+      python fake_services.py embed --port 8001
+
+Latency specs (milliseconds), for FAKE_LLM_LATENCY and FAKE_EMBED_LATENCY:
+    fixed:<ms>
+    lognormal:<median_ms>:<sigma>
+    long_tail:<median_ms>:<tail_probability>:<tail_ms>   (Pareto tail from tail_ms, capped at 20x)
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict, Field, PrivateAttr
+
+from chat_history_manager import estimate_tokens
+from chat_title import COURSE_CODE_PATTERN, extractive_title
+
+EMBEDDING_DIMENSIONS = 384
+FAKE_EMBEDDING_MODEL = "fake-hashed-bag-of-words"
+
+
+class LatencyModel:
+    """Seconds to wait per call, drawn from a fixed, lognormal or long-tailed distribution"""
+    KINDS = ("fixed", "lognormal", "long_tail")
+
+    def __init__(self, kind: str = "fixed", median_ms: float = 0.0, sigma: float = 0.0,
+                 tail_probability: float = 0.0, tail_ms: float = 0.0):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}', expected one of {self.KINDS}")
+        self.kind = kind
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.tail_probability = tail_probability
+        self.tail_ms = tail_ms
+
+    @classmethod
+    def parse(cls, spec: str):
+        """Build from a spec such as "fixed:200", "lognormal:400:0.35" or "long_tail:400:0.05:3000" """
+        kind, *values = spec.strip().split(":")
+        values = [float(value) for value in values]
+        if kind == "fixed":
+            return cls("fixed", median_ms=values[0] if values else 0.0)
+        if kind == "lognormal":
+            return cls("lognormal", median_ms=values[0], sigma=values[1] if len(values) > 1 else 0.5)
+        if kind == "long_tail":
+            return cls("long_tail", median_ms=values[0], sigma=0.25, tail_probability=values[1],
+                       tail_ms=values[2] if len(values) > 2 else values[0] * 10)
+        raise ValueError(f"Unknown latency distribution '{kind}', expected one of {cls.KINDS}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.median_ms / 1000
+        ms = self.median_ms * math.exp(rng.gauss(0.0, self.sigma))
+        if self.kind == "long_tail" and rng.random() < self.tail_probability:
+            ms += self.tail_ms * min(rng.paretovariate(1.5), 20.0)
+        return ms / 1000
+
+    def __repr__(self):
+        return (f"LatencyModel({self.kind}, median_ms={self.median_ms}, sigma={self.sigma}, "
+                f"tail_probability={self.tail_probability}, tail_ms={self.tail_ms})")
+
+
+def seeded_rng(seed: int, *parts) -> random.Random:
+    """RNG that depends only on the seed and the given parts, not on call order"""
+    digest = hashlib.sha256(":".join(str(part) for part in (seed, *parts)).encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+EMBEDDING_TOKEN_PATTERN = re.compile(r"[a-z0-9+#]+")
+
+
+@lru_cache(maxsize=65536)
+def _token_vector(token: str, dimensions: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(token.encode()).digest()[:8], "big")
+    return np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+
+
+def fake_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> List[float]:
+    """
+    Deterministic unit vector for a text: the normalised sum of one random vector per
+    word, so cosine similarity tracks word overlap. Stable across processes and machines.
+    """
+    tokens = EMBEDDING_TOKEN_PATTERN.findall((text or "").lower()) or [""]
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token, count in Counter(tokens).items():
+        vector += _token_vector(token, dimensions) * (1.0 + math.log(count))
+    vector /= np.linalg.norm(vector) or 1.0
+    return vector.tolist()
+
+
+def create_embed_app(latency: Optional[LatencyModel] = None, ms_per_text: float = 0.0, seed: int = 0):
+    """FastAPI app with the /embed, /health and /info endpoints of vectorizer/, backed by fake_embedding"""
+    from fastapi import FastAPI, HTTPException
+    from pydantic import BaseModel
+
+    latency = latency or LatencyModel("fixed")
+    counter = {"requests": 0}
+
+    class EmbeddingRequest(BaseModel):
+        texts: List[str]
+        batch_size: Optional[int] = 32
+
+    app = FastAPI(title="Fake Text Embedding API")
+
+    @app.post("/embed")
+    async def embed(request: EmbeddingRequest):
+        if not request.texts:
+            raise HTTPException(status_code=400, detail="At least one text string must be provided")
+        counter["requests"] += 1
+        delay = latency.sample(seeded_rng(seed, "embed", counter["requests"]))
+        await asyncio.sleep(delay + ms_per_text * len(request.texts) / 1000)
+        return {
+            "embeddings": [fake_embedding(text) for text in request.texts],
+            "model_id": FAKE_EMBEDDING_MODEL,
+            "dimensions": EMBEDDING_DIMENSIONS
+        }
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy", "model": FAKE_EMBEDDING_MODEL, "device": "cpu"}
+
+    @app.get("/info")
+    async def info():
+        return {
+            "model_id": FAKE_EMBEDDING_MODEL,
+            "embedding_dimension": EMBEDDING_DIMENSIONS,
+            "latency": repr(latency),
+            "requests": counter["requests"]
+        }
+
+    return app
+
+
+# Opening phrase of each agent prompt, mapped to the kind of answer it expects
+PROMPT_KINDS = (
+    ("classify them into a structured JSON format", "decision"),
+    ("Advanced Course Recommendation Agent", "recommendation"),
+    ("course information expert", "inquiry"),
+    ("query that needs clarification", "clarification"),
+    ("Course Recommendation System Supervisor", "supervisor"),
+    ("Generate a short, descriptive title", "title"),
+    ("running summary of a conversation", "summary"),
+)
+
+# Rough stand-ins for the decision LLM: an explicit career goal, else a course question
+CAREER_PATTERN = re.compile(
+    r"\b(?:become|becoming|want to be|wanna be|work as|working as|job as|career (?:in|as)|"
+    r"switch(?:ing)? to|transition(?:ing)? (?:in)?to|get into)\s+(?:an?\s+|the\s+)?([^.?!,;]+)",
+    re.IGNORECASE
+)
+INQUIRY_PATTERN = re.compile(
+    r"\b(?:tell me about|what is|what's|who teaches|prerequisites? (?:for|of)|topics (?:in|of|covered in)|"
+    r"when is|information (?:on|about)|details (?:on|about))\s+(?:the\s+)?([^.?!,;]+)",
+    re.IGNORECASE
+)
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z+#-]{3,}")
+KEYWORD_STOPWORDS = {"with", "this", "that", "from", "course", "courses", "introduction", "students"}
+
+
+def prompt_kind(prompt: str) -> str:
+    for marker, kind in PROMPT_KINDS:
+        if marker in prompt:
+            return kind
+    return "other"
+
+
+def prompt_field(prompt: str, label: str) -> str:
+    """Value after `label` on its line in a rendered prompt (empty if absent)"""
+    match = re.search(rf"^{re.escape(label)}(?: \([^)]*\))?:[ \t]*(.*)$", prompt, re.MULTILINE)
+    return match.group(1).strip() if match else ""
+
+
+def prompt_candidates(prompt: str, label: str) -> List[Dict]:
+    """Candidate courses serialised into a rendered prompt by candidate_serializer"""
+    try:
+        candidates = json.loads(prompt_field(prompt, label) or "[]")
+    except json.JSONDecodeError:
+        return []
+    return [candidate for candidate in candidates if isinstance(candidate, dict)]
+
+
+def _keywords(text: str, limit: int = 3) -> List[str]:
+    """The longest distinct words of a text, capitalised, as stand-in skills or topics"""
+    words = {}
+    for word in WORD_PATTERN.findall(text or ""):
+        if word.lower() not in KEYWORD_STOPWORDS:
+            words.setdefault(word.lower(), word.capitalize())
+    return sorted(words.values(), key=len, reverse=True)[:limit]
+
+
+def synthesize_decision(prompt: str) -> Dict:
+    query = prompt_field(prompt, "User query")
+    career = CAREER_PATTERN.search(query)
+    code = COURSE_CODE_PATTERN.search(query)
+    inquiry = INQUIRY_PATTERN.search(query)
+    if career:
+        goal = career.group(1).strip().title()
+        return {"action": "recommendation", "career_goal": [goal], "course_name": [], "course_work": _keywords(goal),
+                "original_query": query, "reasoning": f"The user states a career goal: {goal}."}
+    if code or inquiry:
+        course = code.group(0) if code else inquiry.group(1).strip()
+        return {"action": "inquiry", "career_goal": [], "course_name": [course], "course_work": _keywords(course),
+                "original_query": query, "reasoning": f"The user asks about a specific course: {course}."}
+    return {"action": "clarification_needed", "career_goal": [], "course_name": [], "course_work": [],
+            "original_query": query, "reasoning": "The query has no clear career goal or course reference."}
+
+
+def synthesize_recommendation(prompt: str) -> Dict:
+    # The goal list is rendered into the prompt as a Python list literal
+    goal = re.sub(r"[\[\]'\"]", "", prompt_field(prompt, "Career goal")).strip()
+    if not goal or goal.startswith("not stated"):
+        goal = "your career goal"
+    candidates = prompt_candidates(prompt, "Available courses")
+    while len(candidates) < 5:
+        index = len(candidates) + 1
+        candidates.append({"id": f"{900000 + index}", "code": f"FAKE-X {100 + index}",
+                           "title": f"Elective Topic {index}", "digest": "A general elective in the catalog."})
+    courses = []
+    for candidate in candidates[:5]:
+        title = candidate.get("title") or "Untitled course"
+        digest = candidate.get("digest") or title
+        courses.append({
+            "course_id": str(candidate.get("id")),
+            "course_code": str(candidate.get("code")),
+            "course_title": title,
+            "course_description": digest,
+            "skill_development": _keywords(f"{title} {digest}") or ["Problem Solving"],
+            "career_alignment": f"Builds skills used in {goal} roles.",
+            "relevance_reasoning": f"{title} covers material that a {goal} applies day to day: {digest}"
+        })
+    return {
+        "recommended_courses": courses,
+        "recommendation_strategy": f"These courses build the foundation and applied skills for {goal}, "
+                                   f"ordered from the closest match to broader electives.",
+        "additional_guidance": "Check prerequisites and semester offerings before registering."
+    }
+
+
+def synthesize_inquiry(prompt: str) -> Dict:
+    course_name = prompt_field(prompt, "Course requested")
+    candidates = prompt_candidates(prompt, "Course details")
+    if not candidates:
+        return {"course_information": {"course_name": course_name, "description": "No matching course was found."},
+                "additional_details": "Try the course code, for example CSCI-B 551."}
+    course = candidates[0]
+    information = {"course_id": course.get("id"), "course_name": course.get("code"),
+                   "course_title": course.get("title"), "description": course.get("digest")}
+    for field in ("department", "min_credits", "max_credits"):
+        if course.get(field) is not None:
+            information[field] = course[field]
+    related = [candidate.get("code") for candidate in candidates[1:4] if candidate.get("code")]
+    return {"course_information": information,
+            "additional_details": f"Related courses: {', '.join(related)}." if related else None}
+
+
+def synthesize_clarification(prompt: str) -> Dict:
+    query = prompt_field(prompt, "Original query")
+    return {
+        "clarification_question": f"Could you tell me a bit more about what you are looking for with \"{query}\"? "
+                                  f"For example, a career you are working towards or a course you want to know about.",
+        "possible_intents": ["Career-based course recommendations", "Details about a specific course",
+                             "Help planning next semester"]
+    }
+
+
+def synthesize_supervisor(prompt: str) -> str:
+    query = prompt_field(prompt, "Most recent query")
+    agent_response = prompt.split("Agent response to process:", 1)[-1].strip()
+    try:
+        output = json.loads(agent_response[:agent_response.rindex("}") + 1])
+    except ValueError:
+        output = None
+    if not isinstance(output, dict):
+        return f"Here is what I found about \"{query}\":\n\n{agent_response[:800]}"
+    if output.get("recommended_courses"):
+        lines = [output.get("recommendation_strategy", ""), ""]
+        for index, course in enumerate(output["recommended_courses"], start=1):
+            lines.append(f"**{index}. {course.get('course_code')} - {course.get('course_title')}**")
+            lines.append(f"{course.get('course_description')} {course.get('career_alignment')}")
+            lines.append("")
+        return "\n".join(lines).strip()
+    if output.get("clarification_question"):
+        return output["clarification_question"]
+    information = output.get("course_information") or output
+    return "\n".join(f"- {key.replace('_', ' ').capitalize()}: {value}" for key, value in information.items())
+
+
+def synthesize_summary(prompt: str) -> str:
+    summary = prompt.split("Current summary:", 1)[-1].split("New messages to fold into the summary:", 1)
+    current = summary[0].strip()
+    new = summary[1].split("Write an updated summary", 1)[0].strip() if len(summary) > 1 else ""
+    max_words = int(re.search(r"at most (\d+) words", prompt).group(1)) if "at most" in prompt else 150
+    return " ".join(f"{current} {new}".split()[-max_words:])
+
+
+def synthesize_response(prompt: str, kind: Optional[str] = None) -> str:
+    """Schema-valid response text for a rendered agent prompt"""
+    kind = kind or prompt_kind(prompt)
+    if kind == "decision":
+        return json.dumps(synthesize_decision(prompt))
+    if kind == "recommendation":
+        return json.dumps(synthesize_recommendation(prompt))
+    if kind == "inquiry":
+        return json.dumps(synthesize_inquiry(prompt))
+    if kind == "clarification":
+        return json.dumps(synthesize_clarification(prompt))
+    if kind == "supervisor":
+        return synthesize_supervisor(prompt)
+    if kind == "title":
+        return extractive_title(prompt_field(prompt, "User Query"))
+    if kind == "summary":
+        return synthesize_summary(prompt)
+    return "I can help you find courses for a career goal or answer questions about a specific course."
+
+
+def messages_text(messages) -> str:
+    """Prompt text of a message list, as hashed by ResponseRecorder and the replay lookup"""
+    return "\n".join(message.content if isinstance(message.content, str) else json.dumps(message.content)
+                     for message in messages)
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode()).hexdigest()
+
+
+class ResponseRecorder(BaseCallbackHandler):
+    """Appends each prompt hash, kind and response of a real chat model to a JSONL file for replay"""
+    def __init__(self, path: str):
+        self.path = path
+        self._prompts = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._prompts[run_id] = messages_text(messages[0])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt = self._prompts.pop(run_id, None)
+        if prompt is None:
+            return
+        message = response.generations[0][0].message
+        usage = getattr(message, "usage_metadata", None) or {}
+        record = {"prompt_sha256": prompt_hash(prompt), "kind": prompt_kind(prompt), "response": message.content,
+                  "input_tokens": usage.get("input_tokens"), "output_tokens": usage.get("output_tokens")}
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._prompts.pop(run_id, None)
+
+
+class FakeChatAnthropic(BaseChatModel):
+    """
+    Drop-in for ChatAnthropic that answers offline.
+
+    Each call waits for a sampled time-to-first-token plus `ms_per_token` per output
+    token (streamed in small chunks when the caller streams), then returns the
+    recorded response for the prompt if there is one, otherwise a synthesised one.
+    Latency, and so the whole run, is reproducible for a given `seed`.
+    With replay_match="kind", prompts that were not recorded get a recorded
+    response of the same agent kind instead of a synthesised one.
+    """
+    model: str = "claude-3-haiku-20240307"
+    latency: LatencyModel = Field(default_factory=lambda: LatencyModel.parse("lognormal:400:0.35"))
+    ms_per_token: float = 8.0
+    replay_path: Optional[str] = None
+    replay_match: str = "exact"
+    seed: int = 0
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    _recorded: Dict = PrivateAttr(default_factory=dict)
+    _by_kind: Dict = PrivateAttr(default_factory=dict)
+    _occurrences: Counter = PrivateAttr(default_factory=Counter)
+    _calls: Counter = PrivateAttr(default_factory=Counter)
+    _sources: Counter = PrivateAttr(default_factory=Counter)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context):
+        super().model_post_init(__context)
+        if self.replay_path and os.path.exists(self.replay_path):
+            with open(self.replay_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._recorded[record["prompt_sha256"]] = record
+                        self._by_kind.setdefault(record["kind"], []).append(record)
+            print(f"Fake LLM loaded {len(self._recorded)} recorded responses from {self.replay_path}")
+
+    @classmethod
+    def from_env(cls):
+        """Build from ANTHROPIC_MODEL and the FAKE_LLM_* environment variables"""
+        return cls(
+            model=os.environ.get("ANTHROPIC_MODEL", "claude-3-haiku-20240307"),
+            latency=LatencyModel.parse(os.environ.get("FAKE_LLM_LATENCY", "lognormal:400:0.35")),
+            ms_per_token=float(os.environ.get("FAKE_LLM_MS_PER_TOKEN", 8.0)),
+            replay_path=os.environ.get("FAKE_LLM_REPLAY") or None,
+            replay_match=os.environ.get("FAKE_LLM_REPLAY_MATCH", "exact"),
+            seed=int(os.environ.get("FAKE_LLM_SEED", 0))
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-anthropic-chat"
+
+    def _respond(self, messages):
+        """(response text, usage, time to first token, seconds per output token) for a call"""
+        prompt = messages_text(messages)
+        digest = prompt_hash(prompt)
+        kind = prompt_kind(prompt)
+        with self._lock:
+            occurrence = self._occurrences[digest]
+            self._occurrences[digest] += 1
+        record = self._recorded.get(digest)
+        source = "replayed"
+        if record is None and self.replay_match == "kind" and self._by_kind.get(kind):
+            candidates = self._by_kind[kind]
+            record = candidates[int(digest, 16) % len(candidates)]
+        if record is None:
+            source = "synthesised"
+            text = synthesize_response(prompt, kind)
+        else:
+            text = record["response"]
+        with self._lock:
+            self._calls[kind] += 1
+            self._sources[source] += 1
+        input_tokens = (record or {}).get("input_tokens") or estimate_tokens(prompt)
+        output_tokens = (record or {}).get("output_tokens") or estimate_tokens(text)
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                 "total_tokens": input_tokens + output_tokens}
+        first_token = self.latency.sample(seeded_rng(self.seed, digest, occurrence))
+        return text, usage, first_token, self.ms_per_token / 1000
+
+    def _message(self, text: str, usage: Dict) -> AIMessage:
+        return AIMessage(content=text, usage_metadata=usage,
+                         response_metadata={"model": self.model, "stop_reason": "end_turn"})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text, usage, first_token, per_token = self._respond(messages)
+        time.sleep(first_token + per_token * usage["output_tokens"])
+        return ChatResult(generations=[ChatGeneration(message=self._message(text, usage))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text, usage, first_token, per_token = self._respond(messages)
+        await asyncio.sleep(first_token + per_token * usage["output_tokens"])
+        return ChatResult(generations=[ChatGeneration(message=self._message(text, usage))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        text, usage, first_token, per_token = self._respond(messages)
+        await asyncio.sleep(first_token)
+        # About four tokens per chunk, cut at whitespace
+        chunks = re.findall(r"\S*\s*", text)
+        chunks = ["".join(chunks[i:i + 3]) for i in range(0, len(chunks), 3) if "".join(chunks[i:i + 3])]
+        for index, piece in enumerate(chunks):
+            await asyncio.sleep(per_token * estimate_tokens(piece))
+            last = index == len(chunks) - 1
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=piece,
+                usage_metadata=usage if last else None,
+                response_metadata={"model": self.model, "stop_reason": "end_turn"} if last else {}
+            ))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"recorded_responses": len(self._recorded), "latency": repr(self.latency),
+                    "ms_per_token": self.ms_per_token, "calls": dict(self._calls), "sources": dict(self._sources)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    embed = subparsers.add_parser("embed", help="Run the fake embedding API")
+    embed.add_argument("--host", default=os.environ.get("HOST", "127.0.0.1"))
+    embed.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8001)))
+    embed.add_argument("--latency", default=os.environ.get("FAKE_EMBED_LATENCY", "lognormal:15:0.3"))
+    embed.add_argument("--ms-per-text", type=float, default=float(os.environ.get("FAKE_EMBED_MS_PER_TEXT", 1.0)))
+    embed.add_argument("--seed", type=int, default=int(os.environ.get("FAKE_EMBED_SEED", 0)))
+    respond = subparsers.add_parser("respond", help="Print the fake LLM response for a prompt read from stdin")
+    respond.add_argument("--kind", default=None)
+    args = parser.parse_args()
+
+    if args.command == "embed":
+        import uvicorn
+        app = create_embed_app(LatencyModel.parse(args.latency), args.ms_per_text, args.seed)
+        print(f"Fake embedding API on http://{args.host}:{args.port}/embed ({args.latency})")
+        uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    else:
+        import sys
+        print(synthesize_response(sys.stdin.read(), args.kind))
+
+
+if __name__ == "__main__":
+    main()
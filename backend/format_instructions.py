@@ -0,0 +1,116 @@
+import json
+import typing
+from typing import Any, Dict, List, Optional, Type
+
+from annotated_types import MaxLen, MinLen
+from pydantic import BaseModel
+
+FORMAT_HEADER = "Respond with a single JSON object only (no prose before or after it) with these fields:"
+
+
+def _is_model(annotation) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+
+def _unwrap_optional(annotation):
+    if typing.get_origin(annotation) is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def _type_name(annotation) -> str:
+    annotation = _unwrap_optional(annotation)
+    origin = typing.get_origin(annotation)
+    if origin in (list, List):
+        args = typing.get_args(annotation)
+        if args and _is_model(args[0]):
+            return "list of objects"
+        return f"list of {_type_name(args[0])}s" if args else "list"
+    if origin in (dict, Dict) or annotation is dict:
+        return "object"
+    if _is_model(annotation):
+        return "object"
+    return {str: "string", int: "integer", float: "number", bool: "boolean"}.get(annotation, "value")
+
+
+def _nested_model(annotation) -> Optional[Type[BaseModel]]:
+    annotation = _unwrap_optional(annotation)
+    if _is_model(annotation):
+        return annotation
+    args = typing.get_args(annotation)
+    if typing.get_origin(annotation) in (list, List) and args and _is_model(args[0]):
+        return args[0]
+    return None
+
+
+def _length_note(metadata) -> str:
+    min_length = next((m.min_length for m in metadata if isinstance(m, MinLen)), None)
+    max_length = next((m.max_length for m in metadata if isinstance(m, MaxLen)), None)
+    if min_length is not None and min_length == max_length:
+        return f"exactly {min_length} items"
+    if min_length is not None and max_length is not None:
+        return f"{min_length}-{max_length} items"
+    if min_length is not None:
+        return f"at least {min_length} items"
+    if max_length is not None:
+        return f"at most {max_length} items"
+    return ""
+
+
+def _field_lines(model: Type[BaseModel], indent: str = "") -> List[str]:
+    lines = []
+    for name, field in model.model_fields.items():
+        notes = [_type_name(field.annotation)]
+        length = _length_note(field.metadata)
+        if length:
+            notes.append(length)
+        if not field.is_required():
+            notes.append("optional")
+        description = f": {field.description}" if field.description else ""
+        lines.append(f"{indent}- {name} ({', '.join(notes)}){description}")
+
+        nested = _nested_model(field.annotation)
+        if nested:
+            lines.extend(_field_lines(nested, indent + "  "))
+    return lines
+
+
+def _shorten_example(value: Any, shortened: List[str], key: Optional[str] = None) -> Any:
+    """
+    Keep only the first element of lists of objects so the example stays short; the
+    names of the shortened lists are appended to `shortened`.
+    """
+    if isinstance(value, dict):
+        return {name: _shorten_example(item, shortened, name) for name, item in value.items()}
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        if len(value) > 1 and key and key not in shortened:
+            shortened.append(key)
+        return [_shorten_example(value[0], shortened)]
+    return value
+
+
+def render_format_instructions(model: Type[BaseModel], example: Optional[Dict] = None,
+                               include_example: bool = True) -> str:
+    """
+    Compact output instructions for a pydantic model: one line per field (nested models
+    indented) and at most one example, taken from the model's json_schema_extra examples
+    and shortened unless `example` is given. A shortened example says which lists show
+    only their first item, so it does not contradict the item counts above. A fraction
+    of the size of PydanticOutputParser.get_format_instructions(), which embeds the full
+    JSON schema.
+    """
+    lines = [FORMAT_HEADER] + _field_lines(model)
+    if include_example:
+        shortened = []
+        if example is None:
+            examples = (model.model_config.get("json_schema_extra") or {}).get("examples") or []
+            example = _shorten_example(examples[0], shortened) if examples else None
+        if example is not None:
+            label = "Example"
+            if shortened:
+                label += (f" (only the first item of {', '.join(shortened)} is shown; "
+                          f"return the number of items given above)")
+            lines.append(f"{label}: " + json.dumps(example, separators=(",", ":"), ensure_ascii=False))
+    return "\n".join(lines)
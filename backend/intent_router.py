@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import re
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from chat_title import COURSE_CODE_PATTERN
+from util import aembed_texts
+
+DEFAULT_EXEMPLAR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts", "intent_exemplars.json")
+
+# Seconds to wait before retrying exemplar embedding after the embedding API failed
+INDEX_RETRY_INTERVAL = 60.0
+
+# Phrasings that introduce a career goal or a course reference, used to fill the
+# decision's entity slots when a query is routed without the LLM
+CAREER_GOAL_PATTERN = re.compile(
+    r"\b(?:become|becoming|want to be|wanna be|work as|working as|job as|career (?:in|as)|"
+    r"switch(?:ing)? to|transition(?:ing)? (?:in)?to|get into|interested in)\s+(?:an?\s+|the\s+)?([^.?!,;]+)",
+    re.IGNORECASE
+)
+COURSE_REFERENCE_PATTERN = re.compile(
+    r"\b(?:tell me about|what is|what's|who teaches|prerequisites? (?:for|of)|topics (?:in|of|covered in)|"
+    r"when is|information (?:on|about)|details (?:on|about))\s+(?:the\s+)?([^.?!,;]+)",
+    re.IGNORECASE
+)
+# Trailing clauses that are not part of the goal ("... after graduating", "... work")
+GOAL_TAIL_PATTERN = re.compile(
+    r"\s+(?:after|when|once|so|because|and|but|in the future|someday|one day|which|where|work|roles?)\b.*$",
+    re.IGNORECASE
+)
+
+
+def extract_career_goal(query: str) -> List[str]:
+    """The career goal phrase of a query ("data scientist"), or [] if it names none"""
+    match = CAREER_GOAL_PATTERN.search(query or "")
+    if not match:
+        return []
+    goal = match.group(1)
+    # "switching to a career as a ..." nests one phrasing in another
+    nested = CAREER_GOAL_PATTERN.match(goal)
+    while nested:
+        goal = nested.group(1)
+        nested = CAREER_GOAL_PATTERN.match(goal)
+    goal = GOAL_TAIL_PATTERN.sub("", goal).strip()
+    return [goal] if goal else []
+
+
+def extract_course_reference(query: str) -> List[str]:
+    """Course codes in a query, else the course phrase after "tell me about ..." and the like, else []"""
+    codes = COURSE_CODE_PATTERN.findall(query or "")
+    if codes:
+        return codes
+    match = COURSE_REFERENCE_PATTERN.search(query or "")
+    return [match.group(1).strip()] if match else []
+
+
+def normalise_exemplars(entries: List[Dict]) -> List[Dict[str, str]]:
+    """
+    Reduce exemplar entries to {"query": ..., "action": ...}.
+
+    Accepts plain {"query": ..., "action": ...} objects or DecisionOutput-shaped
+    objects ({"original_query": ..., "action": ...}).
+    """
+    exemplars = []
+    for entry in entries:
+        query = entry.get("query") or entry.get("original_query")
+        if query and entry.get("action"):
+            exemplars.append({"query": query, "action": entry["action"]})
+    return exemplars
+
+
+def load_exemplar_file(path: str) -> List[Dict[str, str]]:
+    """Load labelled exemplars from a JSON file"""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as file:
+        return normalise_exemplars(json.load(file))
+
+
+class IntentRouter:
+    """
+    Nearest-neighbour intent classifier over labelled exemplar queries.
+
+    Exemplars are embedded once through the embedding API. A query is routed locally
+    when its best-matching label is at least `threshold` similar and beats the
+    runner-up label by `margin`; otherwise the caller falls back to the LLM.
+    """
+    def __init__(self, exemplars: List[Dict[str, str]], threshold: float = 0.80,
+                 margin: float = 0.05, enabled: bool = True, latency_window: int = 1000):
+        self.exemplars = exemplars
+        self.threshold = threshold
+        self.margin = margin
+        self.enabled = enabled and bool(exemplars)
+
+        self._matrix = None
+        self._labels = None
+        self._index_failed_at = None
+        self._lock = asyncio.Lock()
+
+        self._calls = 0
+        self._routed = Counter()
+        self._fallbacks = 0
+        self._errors = 0
+        self._latencies_ms = deque(maxlen=latency_window)
+
+    @classmethod
+    def from_env(cls, seed_exemplars: Optional[List[Dict[str, str]]] = None):
+        """Build a router from INTENT_ROUTER_* environment variables"""
+        exemplars = normalise_exemplars(seed_exemplars or [])
+        exemplars += load_exemplar_file(os.environ.get("INTENT_ROUTER_EXEMPLARS", DEFAULT_EXEMPLAR_FILE))
+        return cls(
+            exemplars,
+            threshold=float(os.environ.get("INTENT_ROUTER_THRESHOLD", 0.80)),
+            margin=float(os.environ.get("INTENT_ROUTER_MARGIN", 0.05)),
+            enabled=os.environ.get("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+        )
+
+    async def _ensure_index(self) -> bool:
+        """Embed the exemplars on first use; returns False while the embedding API is unavailable"""
+        if self._matrix is not None:
+            return True
+        async with self._lock:
+            if self._matrix is not None:
+                return True
+            if self._index_failed_at and time.monotonic() - self._index_failed_at < INDEX_RETRY_INTERVAL:
+                return False
+            try:
+                embeddings = await aembed_texts([exemplar["query"] for exemplar in self.exemplars])
+                matrix = np.asarray(embeddings, dtype=np.float32)
+                matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+                self._labels = np.array([exemplar["action"] for exemplar in self.exemplars])
+                self._matrix = matrix
+                print(f"Intent router indexed {len(self.exemplars)} exemplars")
+                return True
+            except Exception as e:
+                print(f"Intent router could not embed exemplars: {e}")
+                self._index_failed_at = time.monotonic()
+                return False
+
+    async def aclassify(self, query: str, query_embedding: Optional[List[float]] = None) -> Optional[Tuple[str, float, str]]:
+        """
+        Classify a query against the exemplars, embedding it unless `query_embedding` is given.
+
+        Returns:
+            (action, confidence, closest exemplar query) when confident, otherwise None
+        """
+        if not self.enabled:
+            return None
+
+        start = time.perf_counter()
+        self._calls += 1
+        try:
+            if not await self._ensure_index():
+                self._errors += 1
+                return None
+
+            if query_embedding is None:
+                query_embedding = (await aembed_texts([query]))[0]
+            query_vector = np.array(query_embedding, dtype=np.float32)
+            query_vector /= np.linalg.norm(query_vector) + 1e-12
+            similarities = self._matrix @ query_vector
+
+            # Best similarity per label
+            best_by_label = {}
+            for label in np.unique(self._labels):
+                label_similarities = np.where(self._labels == label, similarities, -1.0)
+                index = int(np.argmax(label_similarities))
+                best_by_label[str(label)] = (float(label_similarities[index]), index)
+            ranked = sorted(best_by_label.items(), key=lambda item: item[1][0], reverse=True)
+
+            action, (confidence, index) = ranked[0]
+            runner_up = ranked[1][1][0] if len(ranked) > 1 else -1.0
+
+            if confidence >= self.threshold and confidence - runner_up >= self.margin:
+                self._routed[action] += 1
+                return action, confidence, self.exemplars[index]["query"]
+
+            self._fallbacks += 1
+            return None
+        except Exception as e:
+            print(f"Intent router error: {e}")
+            self._errors += 1
+            return None
+        finally:
+            self._latencies_ms.append((time.perf_counter() - start) * 1000)
+
+    def stats(self) -> Dict:
+        """Hit rate and latency figures for tuning the threshold"""
+        routed = sum(self._routed.values())
+        latencies = sorted(self._latencies_ms)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2)
+
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "margin": self.margin,
+            "exemplars": len(self.exemplars),
+            "calls": self._calls,
+            "routed": routed,
+            "routed_by_action": dict(self._routed),
+            "llm_fallbacks": self._fallbacks,
+            "errors": self._errors,
+            "hit_rate": round(routed / self._calls, 4) if self._calls else None,
+            "latency_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)}
+        }
@@ -0,0 +1,467 @@
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+
+class AdmissionRejected(Exception):
+    """An LLM call was refused because the queue is full or the wait would be too long"""
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"LLM capacity exhausted ({reason}); retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Whole seconds for an HTTP Retry-After header"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class PostgresSlots:
+    """
+    Concurrency slots shared by every worker process through Postgres advisory locks.
+
+    Slot i is the session-level advisory lock (namespace, i); holding it means holding
+    a dedicated connection for the duration of the call, so each worker keeps its own
+    small pool sized to the slot count.
+
+    Each attempt tries a single slot, one round trip. A caller starts at a random slot
+    and moves to the next one on each attempt, sleeping `backoff(attempt)` in between,
+    so waiting workers do not sweep every lock on every poll.
+    """
+    def __init__(self, database_url: str, async_database_url: str, slots: int = 8, namespace: int = 7001,
+                 min_backoff: float = 0.01, max_backoff: float = 0.5):
+        self.database_url = database_url
+        self.async_database_url = async_database_url
+        self.slots = slots
+        self.namespace = namespace
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._engine = None
+        self._async_engine = None
+        self.attempts = 0
+        self.contended = 0
+
+    def first_slot(self) -> int:
+        return random.randrange(self.slots)
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to sleep after `attempt` failed attempts: exponential, with full jitter"""
+        return random.uniform(self.min_backoff, min(self.max_backoff, self.min_backoff * 2 ** attempt))
+
+    def try_acquire(self, slot: int):
+        """Take slot `slot % slots`, returning a handle, or None if it is held"""
+        if self._engine is None:
+            self._engine = create_engine(self.database_url, pool_size=self.slots, max_overflow=0)
+        slot %= self.slots
+        self.attempts += 1
+        connection = self._engine.connect()
+        try:
+            if connection.execute(text("SELECT pg_try_advisory_lock(:ns, :slot)"),
+                                  {"ns": self.namespace, "slot": slot}).scalar():
+                return connection, slot
+        except Exception:
+            connection.close()
+            raise
+        connection.close()
+        self.contended += 1
+        return None
+
+    def release(self, handle):
+        connection, slot = handle
+        try:
+            connection.execute(text("SELECT pg_advisory_unlock(:ns, :slot)"), {"ns": self.namespace, "slot": slot})
+        finally:
+            connection.close()
+
+    async def atry_acquire(self, slot: int):
+        if self._async_engine is None:
+            self._async_engine = create_async_engine(self.async_database_url, pool_size=self.slots, max_overflow=0)
+        slot %= self.slots
+        self.attempts += 1
+        connection = await self._async_engine.connect()
+        try:
+            if (await connection.execute(text("SELECT pg_try_advisory_lock(:ns, :slot)"),
+                                         {"ns": self.namespace, "slot": slot})).scalar():
+                return connection, slot
+        except Exception:
+            await connection.close()
+            raise
+        await connection.close()
+        self.contended += 1
+        return None
+
+    async def arelease(self, handle):
+        connection, slot = handle
+        try:
+            await connection.execute(text("SELECT pg_advisory_unlock(:ns, :slot)"), {"ns": self.namespace, "slot": slot})
+        finally:
+            await connection.close()
+
+    def stats(self) -> Dict:
+        return {"slots": self.slots, "attempts": self.attempts, "contended": self.contended}
+
+
+class _Waiter:
+    """
+    A queued caller. `wake()` may be called from any thread; the caller blocks in
+    `wait()` (threads) or `await_wake()` (asyncio) until woken or the timeout passes.
+    """
+    __slots__ = ("_event", "_loop")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self._loop = loop
+        self._event = asyncio.Event() if loop else threading.Event()
+
+    def clear(self):
+        self._event.clear()
+
+    def wake(self):
+        if self._loop:
+            try:
+                self._loop.call_soon_threadsafe(self._event.set)
+            except RuntimeError:
+                pass  # the waiter's event loop has closed
+        else:
+            self._event.set()
+
+    def wait(self, timeout: float):
+        self._event.wait(timeout)
+
+    async def await_wake(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+
+class _PriorityClass:
+    """Queue and counters for one priority class"""
+    __slots__ = ("name", "max_queue", "max_wait", "queue", "in_flight", "admitted", "queued",
+                 "rejected_queue_full", "rejected_timeout", "wait_seconds", "max_wait_seen")
+
+    def __init__(self, name: str, max_queue: int, max_wait: float):
+        self.name = name
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.queue = deque()
+        self.in_flight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seen = 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": len(self.queue),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "mean_wait_ms": round(self.wait_seconds / self.admitted * 1000, 1) if self.admitted else None,
+            "max_wait_ms": round(self.max_wait_seen * 1000, 1)
+        }
+
+
+class LLMAdmission:
+    """
+    Admission control for LLM calls: a token bucket (`rate` calls per second, bursts of
+    up to `burst`) plus at most `max_concurrency` calls in flight in this process.
+
+    Calls belong to a priority class. Interactive calls (chat turns) wait in FIFO order
+    for up to `max_wait` seconds; with `max_queue` of them already waiting, or once the
+    wait runs out, the call is rejected with AdmissionRejected carrying a Retry-After
+    estimate. Background calls (title refinement, history summaries) have their own
+    queue and wait limits, start only while no interactive call is queued, and never
+    hold more than `background_share` of the concurrency slots, so queued chat turns
+    always go first and background work cannot crowd them out.
+
+    Queued callers sleep until a release, an admission or an abandoned wait wakes the
+    head of each queue, or until the next token is due; nothing polls.
+
+    With `shared_slots` (PostgresSlots), a slot from the cross-process pool is also
+    held for each call, so the concurrency cap applies to all workers together.
+
+    Works from async code (`slot()`) and from threads (`sync_slot()`).
+    """
+    def __init__(self, max_concurrency: int = 8, rate: float = 5.0, burst: int = 10, max_queue: int = 32,
+                 max_wait: float = 5.0, enabled: bool = True, shared_slots: Optional[PostgresSlots] = None,
+                 background_share: float = 0.25, background_max_queue: int = 256,
+                 background_max_wait: float = 60.0):
+        self.enabled = enabled
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.shared_slots = shared_slots
+        self.background_share = background_share
+        # At least one slot, so background work still progresses on a small pool
+        self.background_slots = max(1, int(max_concurrency * background_share))
+
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._classes = {
+            INTERACTIVE: _PriorityClass(INTERACTIVE, max_queue, max_wait),
+            BACKGROUND: _PriorityClass(BACKGROUND, background_max_queue, background_max_wait)
+        }
+        self.in_flight = 0
+        self.hold_seconds = 0.0
+        self.released = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build from LLM_ADMISSION* / LLM_* environment variables"""
+        max_concurrency = int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+        shared_slots = None
+        if os.environ.get("LLM_ADMISSION_BACKEND", "local").lower() == "postgres":
+            from util import DATABASE_URL, ASYNC_DATABASE_URL
+            shared_slots = PostgresSlots(
+                DATABASE_URL,
+                ASYNC_DATABASE_URL,
+                slots=int(os.environ.get("LLM_GLOBAL_SLOTS", max_concurrency)),
+                namespace=int(os.environ.get("LLM_ADMISSION_LOCK_KEY", 7001))
+            )
+        return cls(
+            max_concurrency=max_concurrency,
+            rate=float(os.environ.get("LLM_RATE", 5.0)),
+            burst=int(os.environ.get("LLM_BURST", 10)),
+            max_queue=int(os.environ.get("LLM_MAX_QUEUE", 32)),
+            max_wait=float(os.environ.get("LLM_MAX_WAIT", 5.0)),
+            enabled=os.environ.get("LLM_ADMISSION", "true").lower() == "true",
+            shared_slots=shared_slots,
+            background_share=float(os.environ.get("LLM_BACKGROUND_SHARE", 0.25)),
+            background_max_queue=int(os.environ.get("LLM_BACKGROUND_MAX_QUEUE", 256)),
+            background_max_wait=float(os.environ.get("LLM_BACKGROUND_MAX_WAIT", 60.0))
+        )
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        else:
+            self._tokens = float(self.burst)
+        self._refilled_at = now
+
+    def retry_after(self, priority: str = INTERACTIVE) -> float:
+        """Rough seconds until a new caller of `priority` could be admitted"""
+        ahead = len(self._classes[INTERACTIVE].queue) + 1
+        if priority == BACKGROUND:
+            ahead += len(self._classes[BACKGROUND].queue)
+        estimate = ahead / self.rate if self.rate > 0 else 0.0
+        if self.released:
+            mean_hold = self.hold_seconds / self.released
+            estimate = max(estimate, mean_hold * ahead / self.max_concurrency)
+        return max(1.0, estimate)
+
+    def check(self, priority: str = INTERACTIVE):
+        """Raise AdmissionRejected now if a new call would be refused for a full queue"""
+        cls = self._classes[priority]
+        if self.enabled and len(cls.queue) >= cls.max_queue:
+            cls.rejected_queue_full += 1
+            raise AdmissionRejected("queue full", self.retry_after(priority))
+
+    def _wake_heads(self):
+        """Wake the first waiter of each class to re-check capacity (call with the lock held)"""
+        for cls in self._classes.values():
+            if cls.queue:
+                cls.queue[0].wake()
+
+    def _try_admit(self, waiter: _Waiter, cls: _PriorityClass) -> float:
+        """
+        Admit `waiter` if it is next in line and capacity allows. Returns 0 when admitted,
+        otherwise the seconds until the next token (math.inf if only a wake-up can help).
+        """
+        with self._lock:
+            # Cleared under the lock, so a wake-up after this check is never lost
+            waiter.clear()
+            if cls.queue and cls.queue[0] is not waiter:
+                return math.inf
+            if cls.name == BACKGROUND and (self._classes[INTERACTIVE].queue
+                                           or cls.in_flight >= self.background_slots):
+                return math.inf
+            now = time.monotonic()
+            self._refill(now)
+            if self.in_flight >= self.max_concurrency:
+                return math.inf
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+            self._tokens -= 1
+            self.in_flight += 1
+            cls.in_flight += 1
+            if cls.queue and cls.queue[0] is waiter:
+                cls.queue.popleft()
+                # The next in line (or background work held back by this one) may fit too
+                self._wake_heads()
+            return 0.0
+
+    def _wait_time(self, delay: float, deadline: float, cls: _PriorityClass) -> float:
+        """Seconds to sleep before the next admission attempt; raise if the deadline comes first"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or (delay != math.inf and delay > remaining):
+            raise self._timed_out(cls)
+        return min(delay, remaining)
+
+    def _enqueue(self, waiter, cls: _PriorityClass):
+        with self._lock:
+            if len(cls.queue) >= cls.max_queue:
+                cls.rejected_queue_full += 1
+                raise AdmissionRejected("queue full", self.retry_after(cls.name))
+            cls.queue.append(waiter)
+            cls.queued += 1
+
+    def _abandon(self, waiter, cls: _PriorityClass):
+        with self._lock:
+            try:
+                cls.queue.remove(waiter)
+            except ValueError:
+                pass
+            self._wake_heads()
+
+    def _timed_out(self, cls: _PriorityClass) -> AdmissionRejected:
+        cls.rejected_timeout += 1
+        return AdmissionRejected("wait exceeded", self.retry_after(cls.name))
+
+    def _record_admit(self, started: float, cls: _PriorityClass):
+        waited = time.monotonic() - started
+        cls.admitted += 1
+        cls.wait_seconds += waited
+        cls.max_wait_seen = max(cls.max_wait_seen, waited)
+
+    def _release_local(self, admitted_at: float, cls: _PriorityClass):
+        with self._lock:
+            self.in_flight -= 1
+            cls.in_flight -= 1
+            self.hold_seconds += time.monotonic() - admitted_at
+            self.released += 1
+            self._wake_heads()
+
+    async def _aadmit(self, cls: _PriorityClass):
+        started = time.monotonic()
+        deadline = started + cls.max_wait
+        waiter = _Waiter(asyncio.get_running_loop())
+        if self._try_admit(waiter, cls):
+            self._enqueue(waiter, cls)
+            try:
+                # Retried right after enqueueing, in case capacity was freed in between
+                delay = self._try_admit(waiter, cls)
+                while delay:
+                    await waiter.await_wake(self._wait_time(delay, deadline, cls))
+                    delay = self._try_admit(waiter, cls)
+            except BaseException:
+                self._abandon(waiter, cls)
+                raise
+
+        handle = None
+        if self.shared_slots:
+            slot = self.shared_slots.first_slot()
+            attempt = 0
+            try:
+                handle = await self.shared_slots.atry_acquire(slot)
+                while handle is None:
+                    await asyncio.sleep(self._wait_time(self.shared_slots.backoff(attempt), deadline, cls))
+                    attempt += 1
+                    handle = await self.shared_slots.atry_acquire(slot + attempt)
+            except BaseException:
+                self._release_local(time.monotonic(), cls)
+                raise
+        self._record_admit(started, cls)
+        return handle
+
+    def _admit(self, cls: _PriorityClass):
+        started = time.monotonic()
+        deadline = started + cls.max_wait
+        waiter = _Waiter()
+        if self._try_admit(waiter, cls):
+            self._enqueue(waiter, cls)
+            try:
+                delay = self._try_admit(waiter, cls)
+                while delay:
+                    waiter.wait(self._wait_time(delay, deadline, cls))
+                    delay = self._try_admit(waiter, cls)
+            except BaseException:
+                self._abandon(waiter, cls)
+                raise
+
+        handle = None
+        if self.shared_slots:
+            slot = self.shared_slots.first_slot()
+            attempt = 0
+            try:
+                handle = self.shared_slots.try_acquire(slot)
+                while handle is None:
+                    time.sleep(self._wait_time(self.shared_slots.backoff(attempt), deadline, cls))
+                    attempt += 1
+                    handle = self.shared_slots.try_acquire(slot + attempt)
+            except BaseException:
+                self._release_local(time.monotonic(), cls)
+                raise
+        self._record_admit(started, cls)
+        return handle
+
+    @asynccontextmanager
+    async def slot(self, priority: str = INTERACTIVE):
+        """Hold an admission slot for one LLM call (async)"""
+        if not self.enabled:
+            yield
+            return
+        cls = self._classes[priority]
+        handle = await self._aadmit(cls)
+        admitted_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release_local(admitted_at, cls)
+            if handle is not None:
+                try:
+                    await self.shared_slots.arelease(handle)
+                except Exception as e:
+                    print(f"Error releasing shared LLM slot: {e}")
+
+    @contextmanager
+    def sync_slot(self, priority: str = INTERACTIVE):
+        """Hold an admission slot for one LLM call (blocking; for threads)"""
+        if not self.enabled:
+            yield
+            return
+        cls = self._classes[priority]
+        handle = self._admit(cls)
+        admitted_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release_local(admitted_at, cls)
+            if handle is not None:
+                try:
+                    self.shared_slots.release(handle)
+                except Exception as e:
+                    print(f"Error releasing shared LLM slot: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            tokens = self._tokens
+        return {
+            "enabled": self.enabled,
+            "backend": "postgres" if self.shared_slots else "local",
+            "max_concurrency": self.max_concurrency,
+            "background_slots": self.background_slots,
+            "rate": self.rate,
+            "in_flight": self.in_flight,
+            "tokens": round(tokens, 2),
+            "shared_slots": self.shared_slots.stats() if self.shared_slots else None,
+            **{name: cls.stats() for name, cls in self._classes.items()}
+        }
@@ -147,7 +147,7 @@ class ChatMessage(Base):
     message_type = Column(String(10), nullable=False)
     content = Column(TEXT, nullable=False)
     timestamp = Column(DateTime, server_default=func.now())
-    meta_data = Column(JSONB)
+    meta_data = Column("metadata", JSONB)  # "metadata" is reserved on declarative models
     
    
     
@@ -224,5 +224,21 @@ class RecommendationHistory(Base):
     selection_made = Column(JSONB)
     query_text = Column(TEXT)
     timestamp = Column(DateTime, server_default=func.now())
+
+class DecisionCacheEntry(Base):
+    __tablename__ = 'decision_cache'
+    __table_args__ = {'schema': 'iu_catalog'}
     
-   
\ No newline at end of file
+    query_key = Column(TEXT, primary_key=True)
+    decision = Column(JSONB, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+class SessionStateEntry(Base):
+    __tablename__ = 'session_state'
+    __table_args__ = {'schema': 'iu_catalog'}
+    
+    session_id = Column(String(100), primary_key=True)
+    user_id = Column(String(20), nullable=False)
+    version = Column(Integer, nullable=False)
+    state = Column(JSONB, nullable=False)
+    updated_at = Column(DateTime, server_default=func.now())
@@ -0,0 +1,156 @@
+import os
+import re
+import time
+from collections import Counter, deque
+from typing import Dict, Optional
+
+# Follow-up phrasing that only makes sense against earlier turns, so the supervisor LLM
+# has to stitch the answer into the conversation
+CONTEXT_REFERENCE_PATTERN = re.compile(
+    r"\b(it|its|that|those|these|them|they|this one|previous|earlier|above|before|again|instead|"
+    r"also|another|other|others|else|more|compare|first one|second one|last one)\b",
+    re.IGNORECASE
+)
+
+
+def needs_context(query: str, history_context: str) -> bool:
+    """Whether the query refers back to an earlier turn of a conversation that has one"""
+    return bool(history_context) and bool(CONTEXT_REFERENCE_PATTERN.search(query or ""))
+
+
+def render_recommendation(output) -> str:
+    """User-facing markdown for a validated RecommendationOutput"""
+    lines = [output.recommendation_strategy.strip(), "", "Here are the courses I recommend:", ""]
+    for index, course in enumerate(output.recommended_courses, start=1):
+        lines.append(f"**{index}. {course.course_code} - {course.course_title}**")
+        lines.append(course.course_description.strip())
+        if course.skill_development:
+            lines.append(f"- Skills you'll build: {', '.join(course.skill_development)}")
+        lines.append(f"- Career fit: {course.career_alignment.strip()}")
+        lines.append(f"- Why it's relevant: {course.relevance_reasoning.strip()}")
+        lines.append("")
+    if output.additional_guidance:
+        lines.append(output.additional_guidance.strip())
+    return "\n".join(lines).strip()
+
+
+def render_clarification(output) -> str:
+    """User-facing text for a validated ClarificationOutput"""
+    text = output.clarification_question.strip()
+    if output.possible_intents:
+        options = "\n".join(f"- {intent}" for intent in output.possible_intents)
+        text = f"{text}\n\nFor example, I can help with:\n{options}"
+    return text
+
+
+def render_inquiry(output) -> str:
+    """User-facing text for a validated GeneralInquiryOutput"""
+    lines = []
+    for key, value in output.course_information.items():
+        if isinstance(value, (list, tuple)):
+            value = ", ".join(str(item) for item in value)
+        lines.append(f"- {key.replace('_', ' ').capitalize()}: {value}")
+    if output.professor_name:
+        lines.append(f"- Instructor: {output.professor_name}")
+    if output.total_strength:
+        lines.append(f"- Enrollment capacity: {output.total_strength}")
+    if output.additional_details:
+        lines.extend(["", output.additional_details.strip()])
+    return "\n".join(lines).strip()
+
+
+def render_retrieval_only(courses, limit: int = 5) -> str:
+    """Plain list of catalog search results, used when no LLM answer can be produced in time"""
+    if not courses:
+        return ("I couldn't put together a full answer right now and found no matching courses. "
+                "Please try again in a moment.")
+    lines = ["I couldn't put together a full answer right now, but these courses best match your question:", ""]
+    for index, course in enumerate(courses[:limit], start=1):
+        lines.append(f"**{index}. {course.get('course_name')} - {course.get('course_title')}**")
+        description = (course.get("course_description") or "").strip()
+        if description:
+            lines.append(description if len(description) <= 300 else description[:297].rstrip() + "...")
+        lines.append("")
+    return "\n".join(lines).strip()
+
+
+def render_structured(action: Optional[str], output) -> Optional[str]:
+    """Template rendering of any validated specialist output, or None if there is no template for it"""
+    if output is None:
+        return None
+    if action == "recommendation":
+        return render_recommendation(output)
+    if action == "clarification_needed":
+        return render_clarification(output)
+    if action == "inquiry":
+        return render_inquiry(output)
+    return None
+
+
+class SupervisorBypass:
+    """
+    Decides when supervisor_agent can render the specialist output with a template
+    instead of an LLM call, and keeps counters for /debug/stats.
+
+    The saving per bypassed turn is estimated from the recent latency of supervisor
+    LLM calls, since the skipped call itself is never made.
+    """
+    def __init__(self, enabled: bool = True, latency_window: int = 200):
+        self.enabled = enabled
+        self.turns = 0
+        self.bypassed = 0
+        self.fallbacks = Counter()
+        self.render_ms = deque(maxlen=latency_window)
+        self.llm_ms = deque(maxlen=latency_window)
+
+    @classmethod
+    def from_env(cls):
+        """Build from the SUPERVISOR_BYPASS environment variable (default: enabled)"""
+        return cls(enabled=os.environ.get("SUPERVISOR_BYPASS", "true").lower() == "true")
+
+    def render(self, action: Optional[str], output, query: str, history_context: str) -> Optional[str]:
+        """
+        Return the templated response for a validated specialist output, or None when the
+        supervisor LLM is needed. `output` is None when the specialist JSON did not parse.
+        """
+        self.turns += 1
+        if not self.enabled:
+            reason = "disabled"
+        elif output is None:
+            reason = "parse_failed"
+        elif needs_context(query, history_context):
+            reason = "context_needed"
+        elif action not in ("recommendation", "clarification_needed"):
+            reason = "unsupported_action"
+        else:
+            reason = None
+
+        if reason:
+            self.fallbacks[reason] += 1
+            return None
+
+        start = time.perf_counter()
+        text = render_recommendation(output) if action == "recommendation" else render_clarification(output)
+        self.render_ms.append((time.perf_counter() - start) * 1000)
+        self.bypassed += 1
+        return text
+
+    def record_llm_latency(self, seconds: float):
+        self.llm_ms.append(seconds * 1000)
+
+    def stats(self) -> Dict:
+        llm_ms = sum(self.llm_ms) / len(self.llm_ms) if self.llm_ms else None
+        render_ms = sum(self.render_ms) / len(self.render_ms) if self.render_ms else None
+        saved_per_bypass = llm_ms - (render_ms or 0.0) if llm_ms is not None else None
+        return {
+            "enabled": self.enabled,
+            "turns": self.turns,
+            "bypassed": self.bypassed,
+            "bypass_rate": round(self.bypassed / self.turns, 4) if self.turns else None,
+            "fallbacks": dict(self.fallbacks),
+            "mean_render_ms": round(render_ms, 3) if render_ms is not None else None,
+            "mean_supervisor_llm_ms": round(llm_ms, 1) if llm_ms is not None else None,
+            "estimated_saved_ms_per_bypass": round(saved_per_bypass, 1) if saved_per_bypass is not None else None,
+            "estimated_saved_ms_per_turn": round(saved_per_bypass * self.bypassed / self.turns, 1)
+            if saved_per_bypass is not None and self.turns else None
+        }
@@ -0,0 +1,147 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Cache keyed by embedding similarity within a scope.
+
+    A lookup returns the value of the most similar unexpired entry in the same scope
+    if its cosine similarity is at least `similarity_threshold`. Entries are evicted
+    least-recently-used first once `max_entries` is reached, and all entries are
+    dropped when `version_source` reports a new data version.
+    """
+    def __init__(self, max_entries: int = 512, ttl: float = 3600.0, similarity_threshold: float = 0.92,
+                 version_source: Optional[Callable[[], Awaitable[str]]] = None,
+                 version_check_interval: float = 60.0, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.version_source = version_source
+        self.version_check_interval = version_check_interval
+        self.enabled = enabled
+
+        self._entries = OrderedDict()  # id -> (scope, embedding, value, created_at)
+        self._scopes = {}  # scope -> set of entry ids
+        self._ids = itertools.count()
+        self._version = None
+        self._version_checked_at = 0.0
+        self._version_lock = asyncio.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _remove(self, entry_id):
+        scope = self._entries.pop(entry_id)[0]
+        ids = self._scopes.get(scope)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._scopes[scope]
+
+    def invalidate(self):
+        """Drop every entry"""
+        self._entries.clear()
+        self._scopes.clear()
+        self.invalidations += 1
+
+    async def _check_version(self):
+        """Invalidate the cache if the underlying data changed since the last check"""
+        if not self.version_source or time.monotonic() - self._version_checked_at < self.version_check_interval:
+            return
+        async with self._version_lock:
+            if time.monotonic() - self._version_checked_at < self.version_check_interval:
+                return
+            try:
+                version = await self.version_source()
+            except Exception as e:
+                print(f"Semantic cache version check failed: {e}")
+                return
+            finally:
+                self._version_checked_at = time.monotonic()
+            if self._version is not None and version != self._version:
+                print(f"Data version changed ({self._version} -> {version}), invalidating semantic cache")
+                self.invalidate()
+            self._version = version
+
+    @staticmethod
+    def _normalise(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) + 1e-12)
+
+    async def lookup(self, scope: str, embedding) -> Optional[Any]:
+        """Return the cached value closest to `embedding` within `scope`, or None"""
+        if not self.enabled:
+            return None
+        await self._check_version()
+
+        query = self._normalise(embedding)
+        now = time.monotonic()
+        best_id, best_similarity = None, -1.0
+        for entry_id in list(self._scopes.get(scope, ())):
+            _, entry_embedding, _, created_at = self._entries[entry_id]
+            if now - created_at > self.ttl:
+                self._remove(entry_id)
+                self.expirations += 1
+                continue
+            similarity = float(entry_embedding @ query)
+            if similarity > best_similarity:
+                best_id, best_similarity = entry_id, similarity
+
+        if best_id is not None and best_similarity >= self.similarity_threshold:
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][2]
+
+        self.misses += 1
+        return None
+
+    def store(self, scope: str, embedding, value: Any):
+        """Add an entry, evicting the least recently used entries beyond max_entries"""
+        if not self.enabled:
+            return
+        entry_id = next(self._ids)
+        self._entries[entry_id] = (scope, self._normalise(embedding), value, time.monotonic())
+        self._scopes.setdefault(scope, set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "scopes": len(self._scopes),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "similarity_threshold": self.similarity_threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "data_version": self._version
+        }
+
+    @classmethod
+    def from_env(cls, prefix: str, **kwargs):
+        """Build a cache from <prefix>_* environment variables"""
+        return cls(
+            max_entries=int(os.environ.get(f"{prefix}_MAX_ENTRIES", 512)),
+            ttl=float(os.environ.get(f"{prefix}_TTL", 3600)),
+            similarity_threshold=float(os.environ.get(f"{prefix}_SIMILARITY", 0.92)),
+            version_check_interval=float(os.environ.get(f"{prefix}_VERSION_CHECK_INTERVAL", 60)),
+            enabled=os.environ.get(f"{prefix}_ENABLED", "true").lower() == "true",
+            **kwargs
+        )
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+import zlib
+from contextlib import asynccontextmanager
+from typing import Dict
+
+
+class _SessionEntry:
+    __slots__ = ("lock", "users", "tasks")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0  # turns holding or waiting for the lock
+        self.tasks = set()  # tasks of those turns, for latest-wins cancellation
+
+
+class SessionTurns:
+    """
+    Serialises turns within a chat session while different sessions run in parallel.
+
+    Each session gets its own asyncio.Lock, created on first use and dropped when no
+    turn holds or waits for it. The session -> lock table is split into `stripes`
+    shards, each guarded by its own threading.Lock, so lookups from many sessions (or
+    threads) do not contend on one mutex and two sessions never share a lock.
+
+    With `latest_wins`, a new turn cancels any earlier turn of the same session that
+    is still running or queued, so a superseded question stops spending LLM calls.
+    """
+    def __init__(self, stripes: int = 64, latest_wins: bool = False):
+        self.latest_wins = latest_wins
+        self._stripes = [({}, threading.Lock()) for _ in range(stripes)]
+        self._superseded = weakref.WeakSet()
+
+        self.turns = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.superseded = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build from SESSION_LOCK_STRIPES and SESSION_LATEST_WINS environment variables"""
+        return cls(
+            stripes=int(os.environ.get("SESSION_LOCK_STRIPES", 64)),
+            latest_wins=os.environ.get("SESSION_LATEST_WINS", "false").lower() == "true"
+        )
+
+    def _stripe(self, session_id: str):
+        return self._stripes[zlib.crc32(session_id.encode()) % len(self._stripes)]
+
+    def _enter(self, session_id: str, task) -> _SessionEntry:
+        entries, guard = self._stripe(session_id)
+        with guard:
+            entry = entries.get(session_id)
+            if entry is None:
+                entry = entries[session_id] = _SessionEntry()
+            entry.users += 1
+            if self.latest_wins:
+                for other in entry.tasks:
+                    if not other.done():
+                        self._superseded.add(other)
+                        other.cancel()
+                        self.superseded += 1
+            entry.tasks.add(task)
+        return entry
+
+    def _exit(self, session_id: str, entry: _SessionEntry, task):
+        entries, guard = self._stripe(session_id)
+        with guard:
+            entry.tasks.discard(task)
+            entry.users -= 1
+            if entry.users == 0:
+                entries.pop(session_id, None)
+
+    @asynccontextmanager
+    async def turn(self, session_id: str):
+        """Hold the session's lock for the duration of one turn"""
+        task = asyncio.current_task()
+        entry = self._enter(session_id, task)
+        try:
+            if entry.lock.locked():
+                self.waited += 1
+                start = time.perf_counter()
+                await entry.lock.acquire()
+                self.wait_seconds += time.perf_counter() - start
+            else:
+                await entry.lock.acquire()
+            try:
+                self.turns += 1
+                yield
+            finally:
+                entry.lock.release()
+        finally:
+            self._exit(session_id, entry, task)
+
+    def was_superseded(self, task=None) -> bool:
+        """Whether `task` (default: the current task) was cancelled by a newer turn; clears the mark"""
+        task = task or asyncio.current_task()
+        if task in self._superseded:
+            self._superseded.discard(task)
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+            return True
+        return False
+
+    def stats(self) -> Dict:
+        active = 0
+        for entries, guard in self._stripes:
+            with guard:
+                active += len(entries)
+        return {
+            "latest_wins": self.latest_wins,
+            "stripes": len(self._stripes),
+            "active_sessions": active,
+            "turns": self.turns,
+            "waited": self.waited,
+            "mean_wait_ms": round(self.wait_seconds / self.waited * 1000, 1) if self.waited else None,
+            "superseded": self.superseded
+        }
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from postgresql_model import SessionStateEntry
+from util import AsyncSessionLocal
+
+
+class SessionStore(ABC):
+    """
+    Durable snapshots of chat session state, shared by every worker that points at
+    the same store.
+
+    Each snapshot carries a version (the session's turn count); writes never replace
+    a newer version, and `load` returns nothing when the caller already holds the
+    latest one. `version` reads just the version, so a worker can confirm its
+    in-memory copy is current without fetching the state.
+    """
+    def __init__(self):
+        self._pending = set()
+        self.saves = 0
+        self.save_errors = 0
+        self.stale_saves = 0
+
+    @abstractmethod
+    async def load(self, session_id: str, newer_than: int = -1) -> Optional[Dict]:
+        """Return the stored state if its version is greater than `newer_than`, else None"""
+
+    @abstractmethod
+    async def version(self, session_id: str) -> Optional[int]:
+        """Version of the stored snapshot, or None if there is none"""
+
+    @abstractmethod
+    async def save(self, session_id: str, user_id: str, version: int, state: Dict) -> bool:
+        """Write a snapshot unless the store already holds a newer version; False if it did"""
+
+    @abstractmethod
+    async def purge(self, older_than: float):
+        """Delete snapshots not updated in the last `older_than` seconds"""
+
+    async def _save_logged(self, session_id, user_id, version, state):
+        try:
+            if await self.save(session_id, user_id, version, state):
+                self.saves += 1
+            else:
+                # Another worker advanced the session first; this turn's state is not kept
+                print(f"Session store rejected stale snapshot of {session_id} (version {version})")
+                self.stale_saves += 1
+        except Exception as e:
+            print(f"Session store write failed for {session_id}: {e}")
+            self.save_errors += 1
+
+    def save_in_background(self, session_id: str, user_id: str, version: int, state: Dict):
+        """Write a snapshot off the request path"""
+        task = asyncio.create_task(self._save_logged(session_id, user_id, version, state))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def drain(self):
+        """Wait for snapshot writes still in flight (used on shutdown)"""
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            "backend": type(self).__name__,
+            "saves": self.saves,
+            "save_errors": self.save_errors,
+            "stale_saves": self.stale_saves,
+            "pending_writes": len(self._pending)
+        }
+
+    @staticmethod
+    def from_env() -> Optional["SessionStore"]:
+        """Build the store selected by SESSION_STORE (postgres, sqlite or none)"""
+        kind = os.environ.get("SESSION_STORE", "none").lower()
+        if kind == "postgres":
+            return PostgresSessionStore()
+        if kind == "sqlite":
+            return SQLiteSessionStore(os.environ.get("SESSION_STORE_PATH", "sessions.sqlite3"))
+        return None
+
+
+class PostgresSessionStore(SessionStore):
+    """Snapshots in iu_catalog.session_state"""
+    async def load(self, session_id, newer_than=-1):
+        async with AsyncSessionLocal() as session:
+            row = (await session.execute(
+                select(SessionStateEntry.state).where(
+                    SessionStateEntry.session_id == session_id,
+                    SessionStateEntry.version > newer_than
+                )
+            )).first()
+        return row.state if row else None
+
+    async def version(self, session_id):
+        async with AsyncSessionLocal() as session:
+            return (await session.execute(
+                select(SessionStateEntry.version).where(SessionStateEntry.session_id == session_id)
+            )).scalar()
+
+    async def save(self, session_id, user_id, version, state):
+        async with AsyncSessionLocal() as session:
+            statement = insert(SessionStateEntry).values(
+                session_id=session_id, user_id=user_id, version=version, state=state, updated_at=datetime.now()
+            )
+            result = await session.execute(statement.on_conflict_do_update(
+                index_elements=[SessionStateEntry.session_id],
+                set_={
+                    "version": statement.excluded.version,
+                    "state": statement.excluded.state,
+                    "updated_at": statement.excluded.updated_at
+                },
+                where=SessionStateEntry.version <= statement.excluded.version
+            ))
+            await session.commit()
+        return result.rowcount > 0
+
+    async def purge(self, older_than):
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(SessionStateEntry).where(
+                SessionStateEntry.updated_at < datetime.now() - timedelta(seconds=older_than)
+            ))
+            await session.commit()
+
+
+class SQLiteSessionStore(SessionStore):
+    """Snapshots in a local SQLite file, for development or several workers on one host"""
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS session_state ("
+                "session_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, version INTEGER NOT NULL, "
+                "state TEXT NOT NULL, updated_at TEXT NOT NULL)"
+            )
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _load(self, session_id, newer_than):
+        row = self._connect().execute(
+            "SELECT state FROM session_state WHERE session_id = ? AND version > ?", (session_id, newer_than)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _version(self, session_id):
+        row = self._connect().execute(
+            "SELECT version FROM session_state WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _save(self, session_id, user_id, version, state):
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO session_state (session_id, user_id, version, state, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET version = excluded.version, state = excluded.state, "
+                "updated_at = excluded.updated_at WHERE session_state.version <= excluded.version",
+                (session_id, user_id, version, json.dumps(state), datetime.now().isoformat())
+            )
+        return cursor.rowcount > 0
+
+    def _purge(self, older_than):
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM session_state WHERE updated_at < ?",
+                ((datetime.now() - timedelta(seconds=older_than)).isoformat(),)
+            )
+
+    async def load(self, session_id, newer_than=-1):
+        return await asyncio.to_thread(self._load, session_id, newer_than)
+
+    async def version(self, session_id):
+        return await asyncio.to_thread(self._version, session_id)
+
+    async def save(self, session_id, user_id, version, state):
+        return await asyncio.to_thread(self._save, session_id, user_id, version, state)
+
+    async def purge(self, older_than):
+        await asyncio.to_thread(self._purge, older_than)
@@ -0,0 +1,104 @@
+import asyncio
+import os
+from collections import Counter
+from typing import Dict, List, Optional
+
+from util import aembed_texts, asearch_courses, cosine_similarity
+
+SPECULATIVE_RETRIEVAL_ENABLED = os.environ.get("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+
+# Minimum cosine similarity between the decided career goal and the raw query for the
+# speculative results to be reused
+SPECULATION_SIMILARITY_THRESHOLD = float(os.environ.get("SPECULATION_SIMILARITY_THRESHOLD", 0.85))
+
+
+class SpeculationCounters:
+    """Process-wide counters for tuning speculative retrieval"""
+    def __init__(self):
+        self.started = 0
+        self.hits = 0
+        self.wasted = Counter()  # reason -> count
+
+    def stats(self) -> Dict:
+        wasted = sum(self.wasted.values())
+        resolved = self.hits + wasted
+        return {
+            "enabled": SPECULATIVE_RETRIEVAL_ENABLED,
+            "similarity_threshold": SPECULATION_SIMILARITY_THRESHOLD,
+            "started": self.started,
+            "hits": self.hits,
+            "wasted": wasted,
+            "wasted_by_reason": dict(self.wasted),
+            "hit_rate": round(self.hits / resolved, 4) if resolved else None
+        }
+
+
+speculation_counters = SpeculationCounters()
+
+
+class SpeculativeRetrieval:
+    """
+    Course retrieval on the raw query, started while the decision agent is still running.
+
+    The recommendation agent calls `resolve` with the decided career goal to reuse the
+    results when the goal is close enough to the query; every other path calls `discard`.
+    The query embedding is available early through `query_embedding()`, so the intent
+    router can classify with it instead of embedding the query again.
+    """
+    def __init__(self, user_id: str, query: str, top_n: int = 10):
+        self.query = query
+        self._embedding = asyncio.get_running_loop().create_future()
+        # Nobody may ask for the embedding; do not log its failure as never retrieved
+        self._embedding.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self.task = asyncio.create_task(self._retrieve(user_id, query, top_n))
+        # A search cancelled before it embedded the query never will
+        self.task.add_done_callback(lambda task: self._embedding.done() or self._embedding.cancel())
+        speculation_counters.started += 1
+
+    async def _retrieve(self, user_id, query, top_n):
+        try:
+            query_embedding = (await aembed_texts([query]))[0]
+        except Exception as e:
+            self._embedding.set_exception(e)
+            raise
+        self._embedding.set_result(query_embedding)
+        courses = await asearch_courses(user_id, query_embedding, top_n)
+        return query_embedding, courses
+
+    async def query_embedding(self) -> List[float]:
+        """Embedding of the raw query, as soon as the speculative search has it"""
+        return await asyncio.shield(self._embedding)
+
+    async def resolve(self, career_goal, goal_embedding=None,
+                      threshold: float = SPECULATION_SIMILARITY_THRESHOLD) -> Optional[List[Dict]]:
+        """Return the speculative courses if they match the career goal, otherwise None"""
+        goal = ' '.join(career_goal) if isinstance(career_goal, list) else (career_goal or "")
+        try:
+            query_embedding, courses = await self.task
+            if goal.strip().lower() == self.query.strip().lower():
+                similarity = 1.0
+            else:
+                if goal_embedding is None:
+                    goal_embedding = (await aembed_texts([goal]))[0]
+                similarity = cosine_similarity(query_embedding, goal_embedding)
+        except Exception as e:
+            print(f"Speculative retrieval failed: {e}")
+            speculation_counters.wasted["error"] += 1
+            return None
+
+        if similarity >= threshold:
+            speculation_counters.hits += 1
+            return courses
+
+        print(f"Discarding speculative retrieval: goal similarity {similarity:.2f} < {threshold:.2f}")
+        speculation_counters.wasted["goal_mismatch"] += 1
+        return None
+
+    def discard(self, reason: str = "not_recommendation"):
+        """Drop the speculation without using it, e.g. because the query was not a recommendation request"""
+        if not self.task.done():
+            self.task.cancel()
+        elif not self.task.cancelled():
+            # Retrieve any exception so asyncio does not log it as never retrieved
+            self.task.exception()
+        speculation_counters.wasted[reason] += 1
@@ -0,0 +1,230 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# USD per million input/output tokens, matched by model-name prefix (longest first).
+# LLM_PRICE_PER_MTOK="input,output" overrides the table for every model.
+MODEL_PRICES = {
+    "claude-3-haiku": (0.25, 1.25),
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-7-sonnet": (3.00, 15.00),
+    "claude-3-sonnet": (3.00, 15.00),
+    "claude-3-opus": (15.00, 75.00),
+}
+
+_current_trace = contextvars.ContextVar("turn_trace", default=None)
+_current_span = contextvars.ContextVar("node_span", default=None)
+_current_node = contextvars.ContextVar("graph_node", default=None)
+
+
+def model_price(model: Optional[str]):
+    """(input, output) USD per million tokens for a model, or None if unknown"""
+    override = os.environ.get("LLM_PRICE_PER_MTOK")
+    if override:
+        input_price, output_price = (float(part) for part in override.split(","))
+        return input_price, output_price
+    for prefix in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model and model.startswith(prefix):
+            return MODEL_PRICES[prefix]
+    return None
+
+
+class TurnTrace:
+    """Node spans and LLM calls of one chat turn"""
+    def __init__(self, session_id: Optional[str] = None, user_id: Optional[str] = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.session_id = session_id
+        self.user_id = user_id
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+        self.status = "ok"
+        self.spans: List[Dict] = []
+
+    def offset_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def finish(self, status: str = "ok"):
+        self.duration_ms = self.offset_ms()
+        self.status = status
+
+    def to_dict(self, include_session_id: bool = False) -> Dict:
+        """Serialisable trace; the session id is included only with `include_session_id`"""
+        calls = [call for span in self.spans for call in span["llm_calls"]]
+        costs = [call["cost_usd"] for call in calls if call["cost_usd"] is not None]
+        trace = {
+            "trace_id": self.trace_id,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms if self.duration_ms is not None else self.offset_ms(), 1),
+            "status": self.status,
+            "llm_calls": len(calls),
+            "input_tokens": sum(call["input_tokens"] for call in calls),
+            "output_tokens": sum(call["output_tokens"] for call in calls),
+            "cost_usd": round(sum(costs), 6) if costs else None,
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"])
+        }
+        if include_session_id:
+            trace["session_id"] = self.session_id
+        return trace
+
+
+def current_trace() -> Optional[TurnTrace]:
+    return _current_trace.get()
+
+
+def current_node() -> Optional[str]:
+    """Name of the graph node running in this context, traced or not"""
+    return _current_node.get()
+
+
+@contextmanager
+def node_span(node: str):
+    """Record one graph node run in the current turn's trace (no-op outside a trace)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    span = {"node": node, "start_ms": round(trace.offset_ms(), 1), "duration_ms": None, "status": "ok",
+            "llm_calls": []}
+    token = _current_span.set(span)
+    start = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        span["status"] = type(e).__name__
+        raise
+    finally:
+        span["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        _current_span.reset(token)
+        trace.spans.append(span)
+
+
+def traced_node(name: str, fn):
+    """Wrap an async graph node so each run is recorded as a span"""
+    @functools.wraps(fn)
+    async def wrapper(state):
+        token = _current_node.set(name)
+        try:
+            with node_span(name):
+                return await fn(state)
+        finally:
+            _current_node.reset(token)
+    return wrapper
+
+
+def note(key: str, value=True):
+    """Attach a fact (cache hit, routing source, ...) to the running node's span"""
+    span = _current_span.get()
+    if span is not None:
+        span[key] = value
+
+
+def record_llm_call(result, model: Optional[str], duration: float, admission_wait: float = 0.0, retries: int = 0):
+    """Add an LLM call, with token usage read from the response message, to the running node's span"""
+    span = _current_span.get()
+    if span is None:
+        return
+    usage = getattr(result, "usage_metadata", None) or {}
+    metadata = getattr(result, "response_metadata", None) or {}
+    model = metadata.get("model") or model
+    input_tokens = int(usage.get("input_tokens") or 0)
+    output_tokens = int(usage.get("output_tokens") or 0)
+    price = model_price(model)
+    span["llm_calls"].append({
+        "model": model,
+        "duration_ms": round(duration * 1000, 1),
+        "admission_wait_ms": round(admission_wait * 1000, 1),
+        "retries": retries,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost_usd": round((input_tokens * price[0] + output_tokens * price[1]) / 1e6, 6) if price else None
+    })
+
+
+class TraceBuffer:
+    """The most recent `capacity` turn traces, kept in memory for /debug/traces"""
+    def __init__(self, capacity: int = 200, enabled: bool = True):
+        self.enabled = enabled
+        self._traces = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build from TRACE_ENABLED and TRACE_BUFFER_SIZE environment variables"""
+        return cls(
+            capacity=int(os.environ.get("TRACE_BUFFER_SIZE", 200)),
+            enabled=os.environ.get("TRACE_ENABLED", "true").lower() == "true"
+        )
+
+    @contextmanager
+    def turn(self, session_id: Optional[str] = None, user_id: Optional[str] = None):
+        """Trace the chat turn run inside the block; yields the TurnTrace (None when disabled)"""
+        if not self.enabled:
+            yield None
+            return
+        trace = TurnTrace(session_id, user_id)
+        token = _current_trace.set(trace)
+        status = "ok"
+        try:
+            yield trace
+        except BaseException as e:
+            status = type(e).__name__
+            raise
+        finally:
+            _current_trace.reset(token)
+            trace.finish(status)
+            with self._lock:
+                self._traces.append(trace)
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        with self._lock:
+            traces = list(self._traces)[-limit:]
+        return [trace.to_dict() for trace in reversed(traces)]
+
+    def summary(self) -> Dict:
+        """Per-node latency percentiles, LLM tokens and cost over the buffered traces"""
+        with self._lock:
+            traces = list(self._traces)
+        durations = defaultdict(list)
+        tokens = defaultdict(lambda: [0, 0])
+        costs = defaultdict(float)
+        for trace in traces:
+            for span in trace.spans:
+                if span["duration_ms"] is None:
+                    continue
+                durations[span["node"]].append(span["duration_ms"])
+                for call in span["llm_calls"]:
+                    tokens[span["node"]][0] += call["input_tokens"]
+                    tokens[span["node"]][1] += call["output_tokens"]
+                    costs[span["node"]] += call["cost_usd"] or 0.0
+
+        def percentile(values, p):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(len(values) * p))]
+
+        turns = [trace.duration_ms for trace in traces if trace.duration_ms is not None]
+        return {
+            "turns": len(traces),
+            "turn_p50_ms": round(percentile(turns, 0.50), 1) if turns else None,
+            "turn_p95_ms": round(percentile(turns, 0.95), 1) if turns else None,
+            "nodes": {
+                node: {
+                    "runs": len(values),
+                    "mean_ms": round(sum(values) / len(values), 1),
+                    "p50_ms": round(percentile(values, 0.50), 1),
+                    "p95_ms": round(percentile(values, 0.95), 1),
+                    "input_tokens": tokens[node][0],
+                    "output_tokens": tokens[node][1],
+                    "cost_usd": round(costs[node], 6)
+                }
+                for node, values in durations.items()
+            }
+        }
@@ -35,6 +35,17 @@ from typing import List, Dict, Any, Optional
 import requests
 from pgvector.sqlalchemy import Vector
 from dotenv import load_dotenv
+import httpx
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from pgvector.asyncpg import register_vector
+import numpy as np
+import hashlib
+import json
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from metrics import EMBEDDING_LATENCY, POOL_CHECKOUT_WAIT
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+import time
 
 db_config = {
     "host": "localhost",
@@ -45,11 +56,272 @@ db_config = {
 }
 
 
+# Connection pools that report how long each checkout waited (db_pool_checkout_seconds)
+class TimedQueuePool(QueuePool):
+    metrics_label = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start, self.metrics_label)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start, self.metrics_label)
+
+
 # SQLAlchemy setup
 DATABASE_URL = f"postgresql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, poolclass=TimedQueuePool)
 SessionLocal = sessionmaker(bind=engine)
 
+# Async SQLAlchemy setup used by the LangGraph nodes
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=TimedAsyncQueuePool)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _register_vector_type(dbapi_connection, connection_record):
+    dbapi_connection.run_async(register_vector)
+
+
+# Calls to the embedding API fail fast while it keeps failing
+embedding_breaker = CircuitBreaker.from_env("EMBEDDING")
+
+
+# Shared HTTP client for the embedding API, created on first use
+_async_http_client = None
+
+
+def get_async_http_client():
+    """Return the process-wide async HTTP client"""
+    global _async_http_client
+    if _async_http_client is None or _async_http_client.is_closed:
+        _async_http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+    return _async_http_client
+
+
+async def close_async_resources():
+    """Close the shared HTTP client and async database engine"""
+    global _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = None
+    await async_engine.dispose()
+
+
+def embed_texts(texts, timeout=10):
+    """
+    Embed a batch of texts with the embedding API.
+    
+    Args:
+        texts (list): Strings to embed
+        timeout (float): Request timeout in seconds
+    
+    Returns:
+        list: One embedding (list of 384 floats) per input text
+    """
+    embedding_api_url = os.environ.get("EMBEDDING_API_URL", "")
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with embedding_breaker:
+            response = requests.post(
+                embedding_api_url,
+                json={"texts": texts},
+                timeout=timeout
+            )
+            response.raise_for_status()
+        outcome = "ok"
+    except CircuitOpen:
+        outcome = "short_circuited"
+        raise
+    finally:
+        EMBEDDING_LATENCY.observe(time.perf_counter() - start, outcome)
+    return response.json().get("embeddings", [])
+
+
+async def aembed_texts(texts, timeout=10):
+    """Async version of embed_texts using the shared HTTP client"""
+    embedding_api_url = os.environ.get("EMBEDDING_API_URL", "")
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        async with embedding_breaker:
+            response = await get_async_http_client().post(
+                embedding_api_url,
+                json={"texts": texts},
+                timeout=timeout
+            )
+            response.raise_for_status()
+        outcome = "ok"
+    except CircuitOpen:
+        outcome = "short_circuited"
+        raise
+    finally:
+        EMBEDDING_LATENCY.observe(time.perf_counter() - start, outcome)
+    return response.json().get("embeddings", [])
+
+
+def cosine_similarity(a, b):
+    """Cosine similarity between two embedding vectors"""
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    return float(a @ b / ((np.linalg.norm(a) * np.linalg.norm(b)) + 1e-12))
+
+
+def build_course_recommendation_query(user_id, query_embedding, top_n=10):
+    """
+    Build the eligibility-filtered semantic search statement for a student.
+    
+    The statement can be executed by both sync and async sessions.
+    
+    Args:
+        user_id (str): Student user ID
+        query_embedding (list): Vector embedding of the query (list of 384 floating point numbers)
+        top_n (int): Number of results to return
+    
+    Returns:
+        Select: Statement yielding the top N eligible courses ordered by similarity
+    """
+    # Step 1: Get student's information
+    student_info = select(
+        StudentProfile.user_id,
+        StudentProfile.remaining_credits,
+        StudentProfile.upcoming_semester
+    ).where(
+        StudentProfile.user_id == user_id
+    ).subquery()
+    
+    # Step 2: Get student's completed courses
+    completed_courses = select(
+        CompletedCourse.course_id
+    ).where(
+        CompletedCourse.user_id == user_id
+    ).subquery()
+    
+    # Step 3: Find eligible courses
+    eligible_courses = select(
+        CourseDetails.course_id,
+        CourseDetails.course_name,
+        CourseDetails.department,
+        CourseDetails.min_credits,
+        CourseDetails.max_credits,
+        CourseDetails.offered_semester,
+        CourseDetails.prerequisites,
+        CourseDetails.course_title,
+        CourseDetails.course_description,
+        CourseDetails.embedding
+    ).select_from(
+        CourseDetails
+    ).join(
+        student_info,
+        sa.literal(True)
+    ).where(
+        # Credits check
+        or_(
+            CourseDetails.max_credits <= student_info.c.remaining_credits,
+            CourseDetails.min_credits <= student_info.c.remaining_credits
+        ),
+        # Semester check
+        CourseDetails.offered_semester.ilike('%' + student_info.c.upcoming_semester + '%'),
+        # Not already completed
+        ~exists().where(
+            completed_courses.c.course_id == CourseDetails.course_id
+        )
+    ).subquery()
+
+    # Step 4: Filter courses based on prerequisites being met
+    # Using SQLAlchemy's approach for array operation
+    
+    # First, create a subquery for prerequisites that must be met
+    prereq_subquery = select(
+        eligible_courses.c.course_id,
+        func.unnest(eligible_courses.c.prerequisites).label('prereq')
+    ).subquery()
+
+    # Then check if all prerequisites are in completed courses
+    missing_prereqs = select(
+        prereq_subquery.c.course_id
+    ).where(
+        ~exists().where(
+            and_(
+                completed_courses.c.course_id == prereq_subquery.c.prereq,
+                prereq_subquery.c.prereq != None,
+                prereq_subquery.c.prereq != ''
+            )
+        )
+    ).subquery()
+
+    courses_with_prerequisites_met = select(
+        eligible_courses.c.course_id,
+        eligible_courses.c.course_name,
+        eligible_courses.c.department,
+        eligible_courses.c.min_credits,
+        eligible_courses.c.max_credits,
+        eligible_courses.c.course_title,
+        eligible_courses.c.course_description,
+        eligible_courses.c.embedding
+    ).where(
+        or_(
+            # Case 1: No prerequisites (empty array)
+            eligible_courses.c.prerequisites == '{}',
+            # Case 2: Course ID not in missing prerequisites list
+            ~exists().where(
+                missing_prereqs.c.course_id == eligible_courses.c.course_id
+            )
+        )
+    ).subquery()
+    
+    
+    # Step 5: Apply semantic search on filtered courses
+    similarity_expr = func.coalesce(
+        literal(1) - (courses_with_prerequisites_met.c.embedding.cosine_distance(query_embedding)),
+        0
+    ).label("similarity")
+    
+    return select(
+        courses_with_prerequisites_met.c.course_id,
+        courses_with_prerequisites_met.c.course_name,
+        courses_with_prerequisites_met.c.department,
+        courses_with_prerequisites_met.c.min_credits,
+        courses_with_prerequisites_met.c.max_credits,
+        courses_with_prerequisites_met.c.course_title,
+        courses_with_prerequisites_met.c.course_description,
+        similarity_expr
+    ).order_by(
+        desc("similarity")
+    ).limit(top_n)
+
+
+def course_rows_to_dicts(results):
+    """Convert course recommendation rows to dictionaries for easier handling"""
+    courses = []
+    for r in results:
+        courses.append({
+            'course_id': r.course_id,
+            'course_name': r.course_name,
+            'department': r.department,
+            'min_credits': r.min_credits,
+            'max_credits': r.max_credits,
+            'course_title': r.course_title,
+            'course_description': r.course_description,
+            'similarity': float(r.similarity)
+        })
+    return courses
+
 
 def get_course_recommendations(user_id, query_text, session, top_n=10):
     """
@@ -58,27 +330,18 @@ def get_course_recommendations(user_id, query_text, session, top_n=10):
     
     Args:
         user_id (str): Student user ID
-        query_embedding (list): Vector embedding of the query (list of 384 floating point numbers)
-        top_n (int): Number of results to return (default: 30)
-        db_config (dict): Database connection parameters (optional)
+        query_text (str | list): Text (or list of phrases) to embed and search with
+        top_n (int): Number of results to return (default: 10)
     
     Returns:
         list: Top N recommended courses ordered by embedding similarity
     """
     print(f"Generating course recommendations for user_id: {user_id} with query: {query_text}")
-    embedding_api_url = os.environ.get("EMBEDDING_API_URL", "")
     query = ' '.join(query_text) if isinstance(query_text, list) else query_text
     try:
         session = SessionLocal()
         try:
-            response = requests.post(
-                embedding_api_url,
-                json={"texts": [query]},
-                timeout=10
-            )
-            response.raise_for_status()
-            embedding_result = response.json()
-            query_embedding = embedding_result.get("embeddings", [])[0]
+            query_embedding = embed_texts([query])[0]
             
             if not query_embedding:
                 raise ValueError("Failed to generate embedding for query text")
@@ -91,133 +354,107 @@ def get_course_recommendations(user_id, query_text, session, top_n=10):
                 detail=f"Error generating embedding: {str(e)}"
             )
 
-
-        # Step 1: Get student's information
-        student_info = session.query(
-            StudentProfile.user_id,
-            StudentProfile.remaining_credits,
-            StudentProfile.upcoming_semester
-        ).filter(
-            StudentProfile.user_id == user_id
-        ).subquery()
-        
-        # Step 2: Get student's completed courses
-        completed_courses = session.query(
-            CompletedCourse.course_id
-        ).filter(
-            CompletedCourse.user_id == user_id
-        ).subquery()
-        
-        # Step 3: Find eligible courses
-        eligible_courses = session.query(
-            CourseDetails.course_id,
-            CourseDetails.course_name,
-            CourseDetails.department,
-            CourseDetails.min_credits,
-            CourseDetails.max_credits,
-            CourseDetails.offered_semester,
-            CourseDetails.prerequisites,
-            CourseDetails.course_title,
-            CourseDetails.course_description,
-            CourseDetails.embedding
-        ).join(
-            student_info,
-            sa.literal(True)
-        ).filter(
-            # Credits check
-            or_(
-                CourseDetails.max_credits <= student_info.c.remaining_credits,
-                CourseDetails.min_credits <= student_info.c.remaining_credits
-            ),
-            # Semester check
-            CourseDetails.offered_semester.ilike('%' + student_info.c.upcoming_semester + '%'),
-            # Not already completed
-            ~exists().where(
-                completed_courses.c.course_id == CourseDetails.course_id
-            )
-        ).subquery()
-
-        # Step 4: Filter courses based on prerequisites being met
-        # Using SQLAlchemy's approach for array operation
-        
-        # First, create a subquery for prerequisites that must be met
-        prereq_subquery = session.query(
-            eligible_courses.c.course_id,
-            func.unnest(eligible_courses.c.prerequisites).label('prereq')
-        ).subquery()
-
-        # Then check if all prerequisites are in completed courses
-        missing_prereqs = session.query(
-            prereq_subquery.c.course_id
-        ).filter(
-            ~exists().where(
-                and_(
-                    completed_courses.c.course_id == prereq_subquery.c.prereq,
-                    prereq_subquery.c.prereq != None,
-                    prereq_subquery.c.prereq != ''
-                )
-            )
-        ).subquery()
-
-        courses_with_prerequisites_met = session.query(
-            eligible_courses.c.course_id,
-            eligible_courses.c.course_name,
-            eligible_courses.c.department,
-            eligible_courses.c.min_credits,
-            eligible_courses.c.max_credits,
-            eligible_courses.c.course_title,
-            eligible_courses.c.course_description,
-            eligible_courses.c.embedding
-        ).filter(
-            or_(
-                # Case 1: No prerequisites (empty array)
-                eligible_courses.c.prerequisites == '{}',
-                # Case 2: Course ID not in missing prerequisites list
-                ~exists().where(
-                    missing_prereqs.c.course_id == eligible_courses.c.course_id
-                )
-            )
-        ).subquery()
-        
-        
-        # Step 5: Apply semantic search on filtered courses
-        similarity_expr = func.coalesce(
-            literal(1) - (courses_with_prerequisites_met.c.embedding.cosine_distance(query_embedding)),
-            0
-        ).label("similarity")
-        
-        results = session.query(
-            courses_with_prerequisites_met.c.course_id,
-            courses_with_prerequisites_met.c.course_name,
-            courses_with_prerequisites_met.c.department,
-            courses_with_prerequisites_met.c.min_credits,
-            courses_with_prerequisites_met.c.max_credits,
-            courses_with_prerequisites_met.c.course_title,
-            courses_with_prerequisites_met.c.course_description,
-            similarity_expr
-        ).order_by(
-            desc("similarity")
-        ).limit(top_n).all()
-        
-        # Convert results to dictionary format for easier handling
-        courses = []
-        for r in results:
-            courses.append({
-                'course_id': r.course_id,
-                'course_name': r.course_name,
-                'department': r.department,
-                'max_credits': r.min_credits,
-                'max_credits': r.max_credits,
-                'course_title': r.course_title,
-                'course_description': r.course_description,
-                'similarity': float(r.similarity)
-            })
-            
-        return courses
+        results = session.execute(
+            build_course_recommendation_query(user_id, query_embedding, top_n)
+        ).all()
+        return course_rows_to_dicts(results)
         
     except Exception as e:
         print(f"Error querying database: {e}")
         return []
         
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+
+async def asearch_courses(user_id, query_embedding, top_n=10):
+    """
+    Run the eligibility-filtered semantic search for an already embedded query.
+    
+    Args:
+        user_id (str): Student user ID
+        query_embedding (list): Vector embedding of the query
+        top_n (int): Number of results to return (default: 10)
+    
+    Returns:
+        list: Top N recommended courses ordered by embedding similarity
+    """
+    try:
+        async with AsyncSessionLocal() as session:
+            results = (await session.execute(
+                build_course_recommendation_query(user_id, query_embedding, top_n)
+            )).all()
+        return course_rows_to_dicts(results)
+    
+    except Exception as e:
+        print(f"Error querying database: {e}")
+        return []
+
+
+async def aget_eligibility_fingerprint(user_id):
+    """
+    Fingerprint the inputs that decide which courses a student is eligible for.
+    
+    Two students with the same fingerprint get the same eligible course set, so
+    recommendation results can be shared between them.
+    
+    Args:
+        user_id (str): Student user ID
+    
+    Returns:
+        str: Hash of upcoming semester, remaining credits and completed course IDs
+    """
+    async with AsyncSessionLocal() as session:
+        profile = (await session.execute(
+            select(
+                StudentProfile.upcoming_semester,
+                StudentProfile.remaining_credits
+            ).where(StudentProfile.user_id == user_id)
+        )).first()
+        completed = (await session.execute(
+            select(CompletedCourse.course_id).where(
+                CompletedCourse.user_id == user_id
+            ).order_by(CompletedCourse.course_id)
+        )).scalars().all()
+    
+    payload = json.dumps([
+        profile.upcoming_semester if profile else None,
+        profile.remaining_credits if profile else None,
+        list(completed)
+    ])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+async def aget_catalog_version():
+    """Cheap version stamp of course_details that changes when courses are added, removed or updated"""
+    async with AsyncSessionLocal() as session:
+        count, last_updated = (await session.execute(
+            select(func.count(CourseDetails.id), func.max(CourseDetails.updated_at))
+        )).one()
+    return f"{count}:{last_updated.isoformat() if last_updated else ''}"
+
+
+async def aget_course_recommendations(user_id, query_text, top_n=10):
+    """
+    Async version of get_course_recommendations.
+    
+    Embeds the query through the shared HTTP client and runs the search on the
+    async engine, so it never blocks the event loop. Embedding failures, including
+    CircuitOpen while the embedding breaker is open, propagate to the caller.
+    
+    Args:
+        user_id (str): Student user ID
+        query_text (str | list): Text (or list of phrases) to embed and search with
+        top_n (int): Number of results to return (default: 10)
+    
+    Returns:
+        list: Top N recommended courses ordered by embedding similarity
+    """
+    print(f"Generating course recommendations for user_id: {user_id} with query: {query_text}")
+    query = ' '.join(query_text) if isinstance(query_text, list) else query_text
+    query_embedding = (await aembed_texts([query]))[0]
+    if not query_embedding:
+        raise ValueError("Failed to generate embedding for query text")
+    print(f"Generated embedding for query text: {len(query_embedding)} dimensions")
+    
+    return await asearch_courses(user_id, query_embedding, top_n)
\ No newline at end of file